@@ -0,0 +1,265 @@
+"""AI 调用链路基准测试（基于本地 mock 服务，不消耗真实 tokens）
+
+用法：
+    uv run python scripts/bench_ai.py                       # 全部场景
+    uv run python scripts/bench_ai.py -s analysis -s retry --runs 10
+    uv run python scripts/bench_ai.py --json bench.json     # 输出结果便于前后对比
+
+场景：
+    analysis      单次调用新闻分析（realtime.analyze, mode=single）
+    map_reduce    大批新闻 map-reduce 分析
+    deep_dive     单次分析 + 热门板块并发深挖
+    reask         分析结果缺 signal/commodity_cycle，补问缺失字段
+    sector_map    板块映射（ai_map_to_master_sectors）
+    etf_classify  ETF 分类+描述（FundService._ai_classify_etfs）
+    retry         主 API 随机 429/5xx，无 fallback，统计成功率和重试开销
+    refusal       主 API "high risk" 拒绝，降级到 fallback
+    hedge         主 API 慢，对冲请求 fallback
+    json_repair   parse_json_with_repair 解析正常/畸形 JSON 的耗时
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+from loguru import logger
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+from mock_llm_server import MockConfig, MockLLMServer, malform, synthesize  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.models import NewsItem  # noqa: E402
+from src.services import ai_batch, ai_client  # noqa: E402
+from src.services.ai_client import LatencyTracker, parse_json_with_repair, repair_stats  # noqa: E402
+from src.services.telemetry import Telemetry  # noqa: E402
+
+SCENARIOS = [
+    "analysis", "map_reduce", "deep_dive", "reask", "sector_map", "etf_classify", "retry", "refusal", "hedge", "json_repair",
+]
+
+_TOPICS = [
+    ("财联社", "黄金价格再创新高，避险需求升温"),
+    ("东方财富", "芯片板块集体拉升，国产替代加速"),
+    ("华尔街见闻", "AI 算力需求激增，服务器订单排至明年"),
+    ("金十数据", "券商板块异动，成交额突破万亿"),
+    ("新浪财经", "创新药出海再落地，医药板块走强"),
+    ("财联社", "军工订单密集落地，板块估值修复"),
+]
+
+
+def make_news(n: int) -> list[NewsItem]:
+    return [
+        NewsItem(source=src, title=f"{title}（{i}）")
+        for i, (src, title) in ((i, _TOPICS[i % len(_TOPICS)]) for i in range(n))
+    ]
+
+
+def make_etf_infos(n: int) -> list[dict]:
+    names = ["半导体ETF", "黄金ETF", "证券ETF", "医药ETF", "军工ETF", "光伏ETF", "银行ETF", "白酒ETF"]
+    return [
+        {"code": f"5{i:05d}", "name": names[i % len(names)], "manager": "mock基金",
+         "scope": "本基金主要投资于标的指数成份股及备选成份股" * 3, "risk": "较高风险较高收益"}
+        for i in range(n)
+    ]
+
+
+def summarize(name: str, latencies: list[float], ok: int, total: int, server: MockLLMServer, **extra) -> dict:
+    latencies = sorted(latencies) or [0.0]
+    return {
+        "scenario": name,
+        "ok": ok,
+        "total": total,
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 1),
+        "http_requests": server.stats["requests"],
+        "status": {k: v for k, v in server.stats.items() if k.isdigit()},
+        **extra,
+    }
+
+
+async def timed_runs(runs: int, fn) -> tuple[list[float], int]:
+    latencies, ok = [], 0
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        result = await fn()
+        latencies.append(time.perf_counter() - t0)
+        ok += bool(result)
+    return latencies, ok
+
+
+class Bench:
+    def __init__(self, args, workdir: Path):
+        self.args = args
+        self.workdir = workdir
+        self.primary = MockLLMServer(MockConfig(latency=args.latency, jitter=args.jitter, seed=1)).start()
+        self.fallback = MockLLMServer(MockConfig(latency=args.latency, jitter=args.jitter, seed=2)).start()
+
+    def close(self):
+        self.primary.stop()
+        self.fallback.stop()
+
+    def configure(self, *, primary: MockConfig, fallback: MockConfig | None = None, hedge: bool = False,
+                  hedge_delay: float = 60.0):
+        """切换 mock 行为并重置统计；每个场景用新的延迟直方图和遥测，互不影响
+
+        延迟直方图、遥测记录、新闻过滤审计都写到临时目录，不碰 src/data。
+        """
+        from src.analyzers import realtime, relevance
+        self.primary.config = primary
+        self.primary.reset_stats()
+        self.fallback.config = fallback or MockConfig(latency=self.args.latency)
+        self.fallback.reset_stats()
+        overrides = {
+            "claude_base_url": self.primary.url,
+            "claude_api_key": "mock",
+            "ai_fallback_base_url": self.fallback.url if fallback else "",
+            "ai_fallback_api_key": "mock" if fallback else "",
+            "ai_hedge_enabled": hedge,
+            "ai_hedge_default_delay": hedge_delay,
+            "ai_hedge_min_delay": 0.0,
+        }
+        self.telemetry = Telemetry(self.workdir / f"metrics_{time.time_ns()}")
+        return [patch.object(settings, k, v) for k, v in overrides.items()] + [
+            patch.object(ai_client, "latency_tracker", LatencyTracker(self.workdir / f"lat_{time.time_ns()}.json")),
+            patch.object(ai_client, "telemetry", self.telemetry),
+            patch.object(ai_batch, "telemetry", self.telemetry),
+            patch.object(realtime, "save_audit",
+                         lambda audit: relevance.save_audit(audit, self.workdir / "news_filtered.json")),
+        ]
+
+    async def run(self, name: str) -> dict:
+        a = self.args
+        base = MockConfig(latency=a.latency, jitter=a.jitter, seed=1)
+        if name == "json_repair":
+            return self.json_repair()
+
+        if name == "retry":
+            patches = self.configure(primary=MockConfig(latency=a.latency, rate_429=0.2, retry_after=0.2,
+                                                        rate_5xx=0.2, seed=3))
+        elif name == "reask":
+            patches = self.configure(primary=MockConfig(latency=a.latency, seed=1,
+                                                        drop_fields=["signal", "commodity_cycle"]))
+        elif name == "refusal":
+            patches = self.configure(primary=MockConfig(latency=a.latency, refuse_rate=1.0), fallback=base)
+        elif name == "hedge":
+            patches = self.configure(primary=MockConfig(latency=a.latency * 5, seed=4), fallback=base,
+                                     hedge=True, hedge_delay=a.latency * 1.5)
+        else:
+            patches = self.configure(primary=base)
+
+        for p in patches:
+            p.start()
+        try:
+            fn = self.workload(name)
+            latencies, ok = await timed_runs(a.runs, fn)
+        finally:
+            for p in patches:
+                p.stop()
+        total = self.telemetry.summary().get("total", {})
+        extra = {k: total.get(k, 0) for k in ("input_tokens", "output_tokens", "cache_read_tokens")}
+        if name == "reask":
+            extra.update({k: v for k, v in repair_stats.items() if k.startswith("reask")})
+            repair_stats.clear()
+        if name in ("refusal", "hedge"):
+            extra["fallback_requests"] = self.fallback.stats["requests"]
+        return summarize(name, latencies, ok, a.runs, self.primary, **extra)
+
+    def workload(self, name: str):
+        from src.analyzers.realtime import analyze
+
+        a = self.args
+        if name in ("analysis", "reask", "retry", "refusal", "hedge"):
+            news = make_news(a.news)
+            return lambda: analyze(news, mode="single", deep_dive=False)
+        if name == "deep_dive":
+            news = make_news(a.news)
+            return lambda: analyze(news, mode="single", deep_dive=True)
+        if name == "map_reduce":
+            news = make_news(a.news * 5)
+            return lambda: analyze(news, mode="map_reduce", deep_dive=False)
+        if name == "sector_map":
+            from src.worker_simple import ai_map_to_master_sectors
+            return lambda: ai_map_to_master_sectors(
+                ["半导体设备", "贵金属", "券商", "创新药"], ["芯片", "黄金", "证券", "医药", "军工"],
+            )
+        if name == "etf_classify":
+            from src.services.fund_service import FundService
+            infos = make_etf_infos(40)
+            service = FundService()
+
+            async def classify():
+                result = await service._ai_classify_etfs(infos)
+                return len(result.get("分类结果", {})) == len(infos)
+            return classify
+        raise ValueError(f"未知场景: {name}")
+
+    def json_repair(self) -> dict:
+        rng = random.Random(0)
+        payload = {"system": "market_view 市场综述", "messages": [{"role": "user", "content": "芯片 黄金"}]}
+        clean = synthesize(payload, rng)
+        broken = malform(clean)
+        result = {"scenario": "json_repair", "ok": 0, "total": 0}
+        for label, text in (("clean", clean), ("malformed", broken)):
+            n = self.args.repair_iterations
+            t0 = time.perf_counter()
+            for _ in range(n):
+                parse_json_with_repair(text, fix_newlines=True)
+            result[f"{label}_us"] = round((time.perf_counter() - t0) / n * 1e6, 1)
+            result["ok"] += n
+            result["total"] += n
+        return result
+
+
+def print_table(results: list[dict]):
+    cols = ["scenario", "ok", "total", "p50_ms", "p95_ms", "mean_ms", "http_requests"]
+    print("\n" + " | ".join(f"{c:>13}" for c in cols) + " | extra")
+    print("-" * (16 * len(cols) + 10))
+    for r in results:
+        extra = {k: v for k, v in r.items() if k not in cols}
+        print(" | ".join(f"{str(r.get(c, '')):>13}" for c in cols) + f" | {json.dumps(extra, ensure_ascii=False)}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="AI 调用链路基准测试（mock 服务）")
+    parser.add_argument("-s", "--scenario", action="append", choices=SCENARIOS, help="可重复，默认全部")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--news", type=int, default=80, help="单次分析的新闻条数（map_reduce 为 5 倍）")
+    parser.add_argument("--latency", type=float, default=0.2, help="mock 基础延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--repair-iterations", type=int, default=2000)
+    parser.add_argument("--json", type=Path, help="结果输出为 JSON 文件")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level="DEBUG" if args.verbose else "ERROR")
+    # mock 服务没有真实限额，放开共享限流器
+    for k, v in {"ai_rpm": 100000, "ai_tpm": 10 ** 9, "ai_max_concurrency": 16}.items():
+        setattr(settings, k, v)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        bench = Bench(args, Path(tmp))
+        try:
+            for name in args.scenario or SCENARIOS:
+                print(f"running {name}...", file=sys.stderr)
+                results.append(await bench.run(name))
+        finally:
+            bench.close()
+
+    print_table(results)
+    if args.json:
+        args.json.write_text(json.dumps(results, ensure_ascii=False, indent=2))
+        print(f"\n结果已写入 {args.json}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
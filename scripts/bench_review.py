@@ -0,0 +1,113 @@
+"""信号复盘基准测试（合成数据，不访问网络）
+
+用法：
+    uv run python scripts/bench_review.py                     # 10 万条信号
+    uv run python scripts/bench_review.py --signals 20000 --codes 300 --bars 500
+
+对比：
+    engine  review_engine.compute_review（二分定位 + 整批数组运算）
+    legacy  原 update_review._calc_horizon 的逐条线性扫描，只跑 --legacy-sample 条后按比例外推
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.services.review_engine import HORIZONS, compute_review  # noqa: E402
+
+
+def make_data(n_signals: int, n_codes: int, n_bars: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    days = np.busday_offset("2020-01-02", np.arange(n_bars))
+    dates = np.array([int(str(d).replace("-", "")) for d in days], dtype=np.int32)
+    date_strs = [str(d) for d in days]
+    codes = [f"{510000 + i}" for i in range(n_codes)]
+    klines = {}
+    for code in codes:
+        start = int(rng.integers(0, n_bars // 4))
+        closes = np.cumprod(1 + rng.normal(0, 0.02, n_bars - start))
+        klines[code] = (dates[start:], closes)
+    bench = (dates, np.cumprod(1 + rng.normal(0, 0.01, n_bars)))
+    kinds = ["买入", "回避", "观望"]
+    signals = [
+        {
+            "date": date_strs[rng.integers(0, n_bars)],
+            "etf_code": codes[rng.integers(0, n_codes)],
+            "signal": kinds[rng.integers(0, 3)],
+        }
+        for _ in range(n_signals)
+    ]
+    return signals, klines, bench
+
+
+def _pick_trading_index(dates: list[str], entry_date: str) -> int | None:
+    for i, d in enumerate(dates):
+        if d >= entry_date:
+            return i
+    return None
+
+
+def legacy_review(signals, klines, bench):
+    """原实现：每条信号、每个周期重建列表并线性扫描"""
+    code_to_kline = {
+        code: [(f"{d // 10000:04d}-{d // 100 % 100:02d}-{d % 100:02d}", c) for d, c in zip(ds.tolist(), cs.tolist())]
+        for code, (ds, cs) in klines.items()
+    }
+    bench_dates = [f"{d // 10000:04d}-{d // 100 % 100:02d}-{d % 100:02d}" for d in bench[0].tolist()]
+    bench_closes = bench[1].tolist()
+
+    def calc(sig_list, h, invert=False):
+        returns, excess = [], []
+        for s in sig_list:
+            kline = code_to_kline.get(s["etf_code"], [])
+            dates = [d for d, _ in kline]
+            closes = [c for _, c in kline]
+            idx = _pick_trading_index(dates, s["date"])
+            if idx is None or idx + h >= len(closes):
+                continue
+            ret = (closes[idx + h] - closes[idx]) / closes[idx] * 100
+            returns.append(ret)
+            bidx = _pick_trading_index(bench_dates, s["date"])
+            if bidx is not None and bidx + h < len(bench_closes):
+                excess.append(ret - (bench_closes[bidx + h] - bench_closes[bidx]) / bench_closes[bidx] * 100)
+        return len(returns)
+
+    buy = [s for s in signals if "买入" in s["signal"]]
+    avoid = [s for s in signals if "回避" in s["signal"]]
+    for h in HORIZONS:
+        # 原实现 horizons 和 by_signal["买入"] 各算一遍
+        calc(buy, h)
+        calc(buy, h)
+        calc(avoid, h, invert=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="信号复盘基准测试")
+    parser.add_argument("--signals", type=int, default=100_000)
+    parser.add_argument("--codes", type=int, default=500)
+    parser.add_argument("--bars", type=int, default=750, help="每个代码的日K线根数")
+    parser.add_argument("--legacy-sample", type=int, default=2000, help="原实现只跑这么多条信号，按比例外推")
+    args = parser.parse_args()
+
+    signals, klines, bench = make_data(args.signals, args.codes, args.bars)
+    print(f"信号 {args.signals} 条 / 代码 {args.codes} 个 / 每个 {args.bars} 根K线")
+
+    start = time.perf_counter()
+    summary = compute_review(signals, klines, bench)
+    engine_s = time.perf_counter() - start
+    print(f"engine : {engine_s:.3f}s  （买入 20 日样本 {summary['horizons']['20']['count']} 条）")
+
+    sample = signals[:args.legacy_sample]
+    start = time.perf_counter()
+    legacy_review(sample, klines, bench)
+    legacy_s = (time.perf_counter() - start) * args.signals / max(len(sample), 1)
+    print(f"legacy : {legacy_s:.1f}s  （{len(sample)} 条实测，外推）")
+    print(f"加速   : {legacy_s / engine_s:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,509 @@
+"""本地 Anthropic 兼容 mock 服务 - 离线调试/压测 AI 调用链路
+
+用法：
+    uv run python scripts/mock_llm_server.py --port 8787 --latency 1.5 --rate-429 0.1
+    CLAUDE_BASE_URL=http://127.0.0.1:8787 CLAUDE_API_KEY=mock uv run python -m src.worker_simple
+
+功能：
+    - POST /v1/messages：按 prompt 识别任务（新闻分析 / 分片提炼 / 板块深挖 / 字段补问 / 标题翻译 / 板块映射 / ETF 分类 / ETF 描述），
+      返回结构正确的合成 JSON；也可用 --replay 回放录制的响应
+    - 可配置延迟/抖动、SSE 流式输出、429（带 retry-after）、5xx、"high risk" 内容安全拒绝、
+      畸形 JSON（尾逗号、字符串内换行）
+    - 模拟 prompt caching：相同缓存前缀第二次起计入 cache_read_input_tokens；
+      --no-cache-control 时对带 cache_control 的请求返回 400
+    - Message Batches：POST /v1/messages/batches 提交，--batch-delay 秒后结束，
+      GET /v1/messages/batches/{id}[/results] 查询状态、取回 JSONL 结果；--no-batch-api 时返回 404
+    - GET /stats：请求数、按状态码统计、客户端中途放弃数
+
+也可在进程内使用（scripts/bench_ai.py）：
+    server = MockLLMServer(MockConfig(latency=0.2)).start()
+    ... settings.claude_base_url = server.url ...
+    server.stop()
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.services.rate_limit import estimate_tokens  # noqa: E402
+
+DEFAULT_SECTORS = ["黄金", "芯片", "AI", "证券", "医药", "新能源", "军工", "有色"]
+_CODE_LINE_RE = re.compile(r"^- (\d{6}) ([^:：\s]*)", re.MULTILINE)
+
+
+@dataclass
+class MockConfig:
+    latency: float = 0.5             # 首字节前的基础延迟（秒）
+    jitter: float = 0.0              # 额外均匀随机延迟上限（秒）
+    stream_chunk_delay: float = 0.01  # 流式输出每个分块的间隔
+    rate_429: float = 0.0
+    retry_after: float = 1.0
+    rate_5xx: float = 0.0
+    refuse_rate: float = 0.0          # 随机 "high risk" 拒绝比例
+    refuse_keywords: list[str] = field(default_factory=list)  # prompt 含关键词时必定拒绝
+    malformed_rate: float = 0.0       # 返回需修复的 JSON 的比例
+    cache_control: bool = True        # False 时模拟不支持 prompt caching 的端点
+    drop_fields: list[str] = field(default_factory=list)  # 新闻分析结果中省略的字段（测试补问）
+    replay: list[dict] = field(default_factory=list)  # [{"match": 子串, "text": 响应文本}]
+    batch_api: bool = True            # False 时模拟没有 Message Batches 接口的端点
+    batch_delay: float = 1.0          # 批次提交后多久结束（秒）
+    seed: int | None = None
+
+
+# ---------------------------------------------------------------------------
+# 合成响应
+# ---------------------------------------------------------------------------
+
+def _flatten(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return "\n".join(_flatten(v) for v in value)
+    if isinstance(value, dict):
+        if "text" in value:
+            return str(value["text"])
+        return _flatten(value.get("content", ""))
+    return ""
+
+
+def _section(text: str, title: str) -> str:
+    """取 '## 标题' 到下一个 '##' 之间的内容"""
+    m = re.search(rf"## {re.escape(title)}[^\n]*\n(.*?)(?=\n## |\Z)", text, re.DOTALL)
+    return m.group(1).strip() if m else ""
+
+
+def _sector_pool(system: str) -> list[str]:
+    found = _section(system, "可选板块")
+    sectors = [s.strip() for s in re.split(r"[/、,，\s]+", found) if s.strip()]
+    return sectors or DEFAULT_SECTORS
+
+
+def _mentioned(sectors: list[str], news: str, limit: int) -> list[str]:
+    hit = [s for s in sectors if s in news]
+    return (hit or sectors)[:limit]
+
+
+def _analysis(system: str, user: str, rng: random.Random) -> dict:
+    sectors = _mentioned(_sector_pool(system), user, 6)
+    return {
+        "market_view": f"🎯 {sectors[0]}领涨，关注主线持续性",
+        "summary": "📈 mock 综述：" + "、".join(sectors) + "板块有新闻催化。",
+        "sentiment": rng.choice(["偏乐观", "偏悲观", "分歧", "平淡"]),
+        "sectors": [
+            {
+                "name": name,
+                "heat": max(1, 5 - i // 2),
+                "direction": rng.choice(["利好", "利空", "中性"]),
+                "confidence": rng.randint(50, 90),
+                "analysis": f"{name}板块受新闻驱动，注意追高风险。",
+                "signal": rng.choice(["🟢买入", "🟡观望", "🔴回避"]),
+            }
+            for i, name in enumerate(sectors)
+        ],
+        "risk_alerts": ["风险1：mock 风险提示"],
+        "opportunity_hints": ["机会1：mock 机会提示"],
+        "commodity_cycle": {
+            "stage": 1, "stage_name": "黄金领涨期", "leader": "gold", "analysis": "mock 周期分析",
+        },
+    }
+
+
+def _evidence(system: str, user: str, rng: random.Random) -> dict:
+    sectors = _mentioned(_sector_pool(system), user, 4)
+    return {
+        "sectors": {
+            name: {
+                "direction": rng.choice(["利好", "利空", "中性"]),
+                "weight": rng.randint(1, 5),
+                "evidence": [f"{name}相关新闻{rng.randint(1, 99)}"],
+            }
+            for name in sectors
+        },
+        "macro": ["mock 宏观要点"],
+        "commodities": ["mock 商品要点"],
+    }
+
+
+def _sector_mapping(user: str) -> dict:
+    names = [s.strip() for s in re.split(r"[,，]", _section(user, "待映射板块")) if s.strip()]
+    standard = [s.strip() for s in re.split(r"[,，]", _section(user, "标准板块列表")) if s.strip()]
+    return {
+        name: [s for s in standard if s in name or name in s][:3]
+        for name in names
+    }
+
+
+def _etf_classification(user: str, with_wrapper: bool) -> dict:
+    rules = _section(user, "分类规则")
+    candidates = [s for s in re.split(r"[、，,：:\s]+", rules) if 1 < len(s) <= 4]
+    result = {}
+    for code, name in _CODE_LINE_RE.findall(user):
+        sector = next((s for s in candidates if s in name), "其他")
+        entry = {"sector": sector, "desc": f"{name}，mock 描述", "tags": [sector, name[:2]]}
+        if with_wrapper:
+            entry["related"] = []
+        result[code] = entry
+    if with_wrapper:
+        return {
+            "分类结果": result,
+            "板块列表": sorted({v["sector"] for v in result.values() if v["sector"] != "其他"}),
+        }
+    return result
+
+
+def _reask_patch(user: str, rng: random.Random) -> dict:
+    """补问请求：按 "需要补全的字段" 列表生成补丁"""
+    sample = _analysis("", "", rng)
+    sample_sector = sample["sectors"][0]
+    patch: dict[str, Any] = {}
+    for line in _section(user, "需要补全的字段").splitlines():
+        line = line.lstrip("- ").strip()
+        if line.startswith("sectors."):
+            name, _, fields = line[len("sectors."):].partition(":")
+            patch.setdefault("sectors", {})[name.strip()] = {
+                f.strip(): sample_sector[f.strip()] for f in fields.split(",") if f.strip() in sample_sector
+            }
+        elif line in sample:
+            patch[line] = sample[line]
+    return patch
+
+
+def synthesize(payload: dict, rng: random.Random, drop_fields: list[str] | None = None) -> str:
+    """按 prompt 特征识别任务并生成结构正确的 JSON 文本"""
+    system = _flatten(payload.get("system") or "")
+    user = _flatten(payload.get("messages") or [])
+
+    if "提炼" in system and "evidence" in system:
+        data = _evidence(system, user, rng)
+    elif "checklist" in system:
+        name = (_section(user, "板块").split("（")[0] or "板块").strip()
+        data = {
+            "analysis": f"{name}深挖：mock 驱动因素与持续性判断。",
+            "checklist": [f"✅ {name}政策支持", "⚠️ 关注成交量配合", "❌ 短期涨幅过大"],
+        }
+    elif "market_view" in system:
+        data = _analysis(system, user, rng)
+        for name in drop_fields or []:
+            data.pop(name, None)
+            for sector in data["sectors"]:
+                sector.pop(name, None)
+    elif "翻译成简洁的中文" in user:
+        data = {
+            num: f"【译】{title[:30]}"
+            for num, title in re.findall(r"^(\d+)\. (.+)$", _section(user, "标题"), re.MULTILINE)
+        }
+    elif "需要补全的字段" in user:
+        data = _reask_patch(user, rng)
+    elif "待映射板块" in user:
+        data = _sector_mapping(user)
+    elif "ETF列表" in user:
+        data = _etf_classification(user, with_wrapper="分类结果" in user)
+    else:
+        data = {"echo": user[:50]}
+    return "```json\n" + json.dumps(data, ensure_ascii=False, indent=2) + "\n```"
+
+
+def malform(text: str) -> str:
+    """制造 parse_json_with_repair 需要处理的常见问题：尾逗号、字符串内换行"""
+    text = re.sub(r'(\n\s*)([}\]])', r',\1\2', text, count=3)
+    return text.replace("：", "：\n", 1)
+
+
+# ---------------------------------------------------------------------------
+# HTTP 服务
+# ---------------------------------------------------------------------------
+
+class MockLLMServer:
+    def __init__(self, config: MockConfig | None = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or MockConfig()
+        self.rng = random.Random(self.config.seed)
+        self.stats: Counter = Counter()
+        self._lock = threading.Lock()
+        self._cache_prefixes: set[str] = set()
+        self._batches: dict[str, dict] = {}
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats.clear()
+            self._cache_prefixes.clear()
+
+    def _roll(self, p: float) -> bool:
+        with self._lock:
+            return p > 0 and self.rng.random() < p
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _usage(self, payload: dict, output_text: str) -> dict:
+        """模拟 prompt caching：最后一个 cache_control 之前的内容作为缓存前缀"""
+        total = estimate_tokens(payload)
+        usage = {"input_tokens": total, "output_tokens": estimate_tokens(output_text)}
+        raw = json.dumps(payload.get("system") or "", ensure_ascii=False) + \
+            json.dumps(payload.get("messages") or [], ensure_ascii=False)
+        cut = raw.rfind('"cache_control"')
+        if cut == -1:
+            return usage
+        prefix = raw[:cut]
+        key = hashlib.sha1(prefix.encode("utf-8")).hexdigest()
+        cached = min(total, estimate_tokens(prefix))
+        with self._lock:
+            hit = key in self._cache_prefixes
+            self._cache_prefixes.add(key)
+        usage["input_tokens"] = total - cached
+        usage["cache_read_input_tokens" if hit else "cache_creation_input_tokens"] = cached
+        return usage
+
+    def _respond_text(self, payload: dict) -> str:
+        user = _flatten(payload.get("messages") or [])
+        for rec in self.config.replay:
+            if rec.get("match", "") in user:
+                return rec["text"]
+        with self._lock:
+            text = synthesize(payload, self.rng, self.config.drop_fields)
+        if self._roll(self.config.malformed_rate):
+            self._count("malformed")
+            text = malform(text)
+        return text
+
+    def _batch_info(self, batch_id: str) -> dict:
+        """批次状态；到期后一次性生成全部结果（拒绝关键词命中的记为 errored）"""
+        batch = self._batches[batch_id]
+        ended = time.time() - batch["created_at"] >= self.config.batch_delay
+        if ended and batch["results"] is None:
+            results = []
+            for req in batch["requests"]:
+                params = req.get("params") or {}
+                raw = json.dumps(params, ensure_ascii=False)
+                if any(k in raw for k in self.config.refuse_keywords):
+                    result = {"type": "errored", "error": {"type": "invalid_request_error", "message": "high risk"}}
+                else:
+                    text = self._respond_text(params)
+                    result = {"type": "succeeded", "message": {
+                        "id": f"msg_mock_{len(results)}", "type": "message", "role": "assistant",
+                        "model": params.get("model", "mock"), "content": [{"type": "text", "text": text}],
+                        "stop_reason": "end_turn", "usage": self._usage(params, text),
+                    }}
+                results.append({"custom_id": req.get("custom_id"), "result": result})
+            batch["results"] = results
+        done = batch["results"] or []
+        succeeded = sum(r["result"]["type"] == "succeeded" for r in done)
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else len(batch["requests"]),
+                "succeeded": succeeded, "errored": len(done) - succeeded, "canceled": 0, "expired": 0,
+            },
+            "results_url": f"{self.url}/v1/messages/batches/{batch_id}/results" if ended else None,
+        }
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):  # noqa: A002
+                pass
+
+            def _json(self, status: int, body: dict, headers: dict | None = None):
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+                server._count(str(status))
+
+            def _error(self, status: int, err_type: str, message: str, headers: dict | None = None):
+                self._json(status, {"type": "error", "error": {"type": err_type, "message": message}}, headers)
+
+            def do_GET(self):
+                path = self.path.rstrip("/")
+                m = re.fullmatch(r"/v1/messages/batches/([\w-]+)(/results)?", path)
+                if path == "/stats":
+                    with server._lock:
+                        self._json(200, dict(server.stats))
+                elif m and server.config.batch_api and m.group(1) in server._batches:
+                    info = server._batch_info(m.group(1))
+                    if not m.group(2):
+                        return self._json(200, info)
+                    if info["processing_status"] != "ended":
+                        return self._error(400, "invalid_request_error", "batch still processing")
+                    body = "\n".join(
+                        json.dumps(r, ensure_ascii=False) for r in server._batches[m.group(1)]["results"]
+                    ).encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-jsonl")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    server._count("200")
+                else:
+                    self._error(404, "not_found_error", "not found")
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError:
+                    return self._error(400, "invalid_request_error", "invalid json")
+                if self.path.rstrip("/") == "/v1/messages/batches" and server.config.batch_api:
+                    return self.create_batch(payload)
+                if self.path.rstrip("/") != "/v1/messages":
+                    return self._error(404, "not_found_error", f"unknown path {self.path}")
+                server._count("requests")
+                try:
+                    self.handle_messages(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端已放弃（超时/对冲取消）
+                    server._count("aborted")
+
+            def create_batch(self, payload: dict):
+                requests = payload.get("requests") or []
+                if not requests:
+                    return self._error(400, "invalid_request_error", "requests: empty")
+                server._count("batches")
+                with server._lock:
+                    batch_id = f"msgbatch_mock_{len(server._batches) + 1}"
+                    server._batches[batch_id] = {"created_at": time.time(), "requests": requests, "results": None}
+                self._json(200, server._batch_info(batch_id))
+
+            def handle_messages(self, payload: dict):
+                cfg = server.config
+                delay = cfg.latency + (server.rng.uniform(0, cfg.jitter) if cfg.jitter else 0)
+                time.sleep(delay)
+
+                raw = json.dumps(payload, ensure_ascii=False)
+                if not cfg.cache_control and '"cache_control"' in raw:
+                    return self._error(400, "invalid_request_error", "Extra inputs are not permitted: cache_control")
+                if any(k in raw for k in cfg.refuse_keywords) or server._roll(cfg.refuse_rate):
+                    return self._error(400, "invalid_request_error", "The request was rejected because it was considered high risk")
+                if server._roll(cfg.rate_429):
+                    return self._error(429, "rate_limit_error", "rate limited", {"retry-after": str(cfg.retry_after)})
+                if server._roll(cfg.rate_5xx):
+                    status = server.rng.choice([500, 502, 529])
+                    return self._error(status, "api_error", "mock upstream error")
+
+                text = server._respond_text(payload)
+                usage = server._usage(payload, text)
+                if payload.get("stream"):
+                    return self.stream(payload, text, usage)
+                self._json(200, {
+                    "id": f"msg_mock_{int(time.time() * 1000)}",
+                    "type": "message",
+                    "role": "assistant",
+                    "model": payload.get("model", "mock"),
+                    "content": [{"type": "text", "text": text}],
+                    "stop_reason": "end_turn",
+                    "usage": usage,
+                })
+
+            def stream(self, payload: dict, text: str, usage: dict):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+
+                def event(name: str, data: dict):
+                    self.wfile.write(f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+                start_usage = {k: v for k, v in usage.items() if k != "output_tokens"}
+                event("message_start", {"type": "message_start", "message": {
+                    "id": f"msg_mock_{int(time.time() * 1000)}", "type": "message", "role": "assistant",
+                    "model": payload.get("model", "mock"), "content": [], "usage": {**start_usage, "output_tokens": 0},
+                }})
+                event("content_block_start", {"type": "content_block_start", "index": 0,
+                                              "content_block": {"type": "text", "text": ""}})
+                for i in range(0, len(text), 40):
+                    event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                  "delta": {"type": "text_delta", "text": text[i:i + 40]}})
+                    time.sleep(server.config.stream_chunk_delay)
+                event("content_block_stop", {"type": "content_block_stop", "index": 0})
+                event("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn"},
+                                        "usage": {"output_tokens": usage["output_tokens"]}})
+                event("message_stop", {"type": "message_stop"})
+                server._count("200")
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 Anthropic 兼容 mock 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency", type=float, default=0.5, help="基础延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="随机附加延迟上限（秒）")
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--rate-5xx", type=float, default=0.0)
+    parser.add_argument("--refuse-rate", type=float, default=0.0)
+    parser.add_argument("--refuse-keyword", action="append", default=[], help="prompt 含该词时返回 high risk 拒绝")
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--drop-field", action="append", default=[], help="新闻分析结果中省略该字段（测试补问）")
+    parser.add_argument("--no-cache-control", action="store_true", help="模拟不支持 prompt caching 的端点")
+    parser.add_argument("--no-batch-api", action="store_true", help="模拟没有 Message Batches 接口的端点")
+    parser.add_argument("--batch-delay", type=float, default=1.0, help="批次提交后多久结束（秒）")
+    parser.add_argument("--replay", type=Path, help='录制响应 JSON：[{"match": "子串", "text": "响应"}]')
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        latency=args.latency, jitter=args.jitter,
+        rate_429=args.rate_429, retry_after=args.retry_after, rate_5xx=args.rate_5xx,
+        refuse_rate=args.refuse_rate, refuse_keywords=args.refuse_keyword,
+        malformed_rate=args.malformed_rate, drop_fields=args.drop_field,
+        cache_control=not args.no_cache_control,
+        batch_api=not args.no_batch_api, batch_delay=args.batch_delay,
+        replay=json.loads(args.replay.read_text()) if args.replay else [],
+        seed=args.seed,
+    )
+    server = MockLLMServer(config, args.host, args.port)
+    print(f"mock LLM server listening on {server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,37 @@
 """重新生成 ETF 描述（基于现有数据）
 
 用法：
-    CLAUDE_API_KEY=xxx uv run python scripts/refresh_etf_desc.py
+    CLAUDE_API_KEY=xxx uv run python scripts/refresh_etf_desc.py [--force] [--batch]
+
+默认跳过内容（名称/投资范围/风险特征）未变且已有 AI 描述缓存的 ETF；--force 全量重新生成。
+--batch 走离线批处理（Message Batches），未结束时退出，重跑继续轮询已提交的批次。
 """
 
 import asyncio
 import json
 import os
+import sys
 from pathlib import Path
 
-import httpx
 from loguru import logger
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.services.etf_cache import EtfClassifyCache  # noqa: E402
+from src.services.telemetry import telemetry  # noqa: E402
+
 CLAUDE_API_KEY = os.getenv("CLAUDE_API_KEY", "")
-CLAUDE_BASE_URL = os.getenv("CLAUDE_BASE_URL", "https://api.anthropic.com")
 CLAUDE_MODEL = os.getenv("CLAUDE_MODEL", "claude-sonnet-4-20250514")
+# 遥测阶段名
+AI_STAGE = "etf_desc"
 
 
-async def ai_generate_desc(client: httpx.AsyncClient, etf_infos: list[dict]) -> dict:
-    """AI 批量生成 ETF 描述"""
+def build_desc_prompt(etf_infos: list[dict]) -> str:
     etf_list = "\n".join([
         f"- {info['code']} {info.get('name','')}: {info.get('scope','')[:150]}"
         for info in etf_infos
     ])
 
-    prompt = f"""为以下ETF生成精炼描述和板块别名。
+    return f"""为以下ETF生成精炼描述和板块别名。
 
 ## ETF列表
 {etf_list}
@@ -43,33 +50,52 @@ async def ai_generate_desc(client: httpx.AsyncClient, etf_infos: list[dict]) ->
 {{"ETF代码": {{"desc": "描述", "tags": ["别名1", "别名2", ...]}}, ...}}
 ```"""
 
+
+async def ai_generate_desc(etf_infos: list[dict]) -> dict:
+    """AI 批量生成 ETF 描述（AIClient：共享限流、429 按 retry-after 暂停、重试、遥测）"""
+    from src.services.ai_client import AIClient, AIRequest, parse_json_with_repair
+
     try:
-        resp = await client.post(
-            f"{CLAUDE_BASE_URL.rstrip('/')}/v1/messages",
-            headers={
-                "Content-Type": "application/json",
-                "x-api-key": CLAUDE_API_KEY,
-                "anthropic-version": "2023-06-01",
-            },
-            json={
-                "model": CLAUDE_MODEL,
-                "max_tokens": 4096,
-                "messages": [{"role": "user", "content": prompt}]
-            },
-            timeout=120,
-        )
-        resp.raise_for_status()
-        text = resp.json()["content"][0]["text"].strip()
-        if "```json" in text:
-            text = text.split("```json")[1].split("```")[0]
-        elif "```" in text:
-            text = text.split("```")[1].split("```")[0]
-        return json.loads(text)
+        text = await AIClient().send(AIRequest(
+            messages=[{"role": "user", "content": build_desc_prompt(etf_infos)}],
+            max_tokens=4096,
+            model=CLAUDE_MODEL,
+            stage=AI_STAGE,
+        ))
+        return parse_json_with_repair(text, fix_newlines=True)
     except Exception as e:
         logger.warning(f"AI生成描述失败: {e}")
         return {}
 
 
+async def ai_generate_desc_offline(batches: list[list[dict]]) -> list[dict]:
+    """离线批处理生成描述：job_id 由 prompt 内容决定，重跑时复用已提交/已完成的任务"""
+    from src.services.ai_batch import BatchQueue
+    from src.services.ai_client import AIRequest, parse_json_with_repair
+
+    queue = BatchQueue("refresh_etf_desc")
+    jids = [
+        queue.add(AIRequest(
+            messages=[{"role": "user", "content": build_desc_prompt(batch)}],
+            max_tokens=4096,
+            model=CLAUDE_MODEL,
+            stage=AI_STAGE,
+        ))
+        for batch in batches
+    ]
+    queue.save()
+    if not await queue.run(jids):
+        raise SystemExit("批处理尚未结束，稍后重跑继续")
+
+    results = []
+    for jid in jids:
+        try:
+            results.append(parse_json_with_repair(queue.result(jid) or "{}", fix_newlines=True))
+        except Exception as e:
+            logger.warning(f"AI生成描述结果解析失败: {e}")
+    return results
+
+
 async def main():
     if not CLAUDE_API_KEY:
         logger.error("请设置 CLAUDE_API_KEY")
@@ -81,18 +107,37 @@ async def main():
     etfs = data["etfs"]
     logger.info(f"读取到 {len(etfs)} 个 ETF")
 
-    # 转为列表
-    etf_list = list(etfs.values())
-
-    # 批量生成描述
+    # 内容未变且已有缓存描述的直接复用（缓存只记录 AI 产出，不从 master 预热）
+    force = "--force" in sys.argv
+    cache = EtfClassifyCache("refresh_etf_desc")
     all_descs = {}
-    async with httpx.AsyncClient(timeout=120) as client:
-        for i in range(0, len(etf_list), 30):
-            batch = etf_list[i:i+30]
-            logger.info(f"处理 {i+1}-{i+len(batch)}/{len(etf_list)}...")
-            descs = await ai_generate_desc(client, batch)
-            all_descs.update(descs)
-            await asyncio.sleep(1)
+    etf_list = []
+    for info in etfs.values():
+        hit = None if force else cache.lookup(info, ("desc", "tags"))
+        if hit:
+            all_descs[info["code"]] = hit
+        else:
+            etf_list.append(info)
+    logger.info(f"需重新生成 {len(etf_list)}/{len(etfs)} 个")
+
+    # 批量生成描述（批次并发，由共享限流器控制速率和并发；--batch 时走离线批处理）
+    batches = [etf_list[i:i+30] for i in range(0, len(etf_list), 30)]
+    if "--batch" in sys.argv:
+        results = await ai_generate_desc_offline(batches) if batches else []
+    else:
+        async def generate(i: int):
+            batch = batches[i]
+            logger.info(f"处理 {i*30+1}-{i*30+len(batch)}/{len(etf_list)}...")
+            return await ai_generate_desc(batch)
+
+        results = await asyncio.gather(*(generate(i) for i in range(len(batches))))
+    for descs in results:
+        for code, info in descs.items():
+            if code in etfs and isinstance(info, dict):
+                cache.store(etfs[code], info)
+        all_descs.update(descs)
+    cache.save()
+    cache.report("ETF描述")
 
     # 更新描述和tags
     updated = 0
@@ -113,4 +158,10 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        asyncio.run(main())
+    finally:
+        telemetry.flush()
+        # ai_client 惰性导入（需要 CLAUDE_API_KEY），只有实际调用过 AI 才有延迟样本要保存
+        if "src.services.ai_client" in sys.modules:
+            sys.modules["src.services.ai_client"].latency_tracker.save()
@@ -1,29 +1,41 @@
 """更新 ETF Master 数据（完整版）
 
 用法：
-    CLAUDE_API_KEY=xxx uv run python scripts/update_etf_master.py
+    CLAUDE_API_KEY=xxx uv run python scripts/update_etf_master.py [--batch]
+
+    --batch：AI 分类走离线批处理（Message Batches，费用减半，不占实时限流配额）；
+             超过 AI_BATCH_MAX_WAIT 未结束时退出，重跑继续轮询已提交的批次
 
 功能：
     1. 从新浪获取全量 ETF 列表
-    2. 爬取东方财富获取详细信息（管理人、投资范围等）
-    3. AI 批量分类到板块 + 精炼描述
+    2. 爬取东方财富获取详细信息（管理人、投资范围等，长期缓存只抓新增/过期）
+    3. AI 批量分类到板块 + 精炼描述 + 板块别名（并发，可断点续跑）
     4. 保存到 config/etf_master.json
 """
 
 import asyncio
 import json
 import os
-import re
+import sys
 from pathlib import Path
 from datetime import datetime
 
 import httpx
 from loguru import logger
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.services.batch_runner import BatchCheckpoint, pack_batches, run_batches  # noqa: E402
+from src.services.etf_cache import EtfClassifyCache  # noqa: E402
+from src.services.etf_scraper import EtfDetailStore, fetch_sina_etf_pages  # noqa: E402
+from src.services.host_limit import host_limiter  # noqa: E402
+from src.services.kline_store import code_to_secid, kline_store  # noqa: E402
+from src.services.telemetry import telemetry  # noqa: E402
+
 # 配置
 CLAUDE_API_KEY = os.getenv("CLAUDE_API_KEY", "")
-CLAUDE_BASE_URL = os.getenv("CLAUDE_BASE_URL", "https://api.anthropic.com")
 CLAUDE_MODEL = os.getenv("CLAUDE_MODEL", "claude-sonnet-4-20250514")
+# 遥测阶段名
+AI_STAGE = "etf_master.classify"
 
 # 排除关键词
 EXCLUDE_KEYWORDS = [
@@ -42,92 +54,30 @@ def should_exclude(name: str) -> bool:
 
 
 async def fetch_all_etfs() -> list[dict]:
-    """从新浪获取全量 ETF"""
-    all_etfs = []
+    """从新浪获取全量 ETF（分页并发）"""
     async with httpx.AsyncClient(timeout=30) as client:
-        for page in range(1, 15):
-            resp = await client.get(
-                "https://vip.stock.finance.sina.com.cn/quotes_service/api/json_v2.php/Market_Center.getHQNodeData",
-                params={
-                    "page": page, "num": 100,
-                    "sort": "amount", "asc": 0,
-                    "node": "etf_hq_fund",
-                },
-                headers={"Referer": "https://finance.sina.com.cn"},
-            )
-            data = resp.json()
-            if not data:
-                break
-            for item in data:
-                all_etfs.append({
-                    "code": item.get("code", ""),
-                    "name": item.get("name", ""),
-                    "amount": float(item.get("amount", 0)),
-                })
-            if len(data) < 100:
-                break
+        items = await fetch_sina_etf_pages(client, max_pages=14)
+    all_etfs = [
+        {
+            "code": item.get("code", ""),
+            "name": item.get("name", ""),
+            "amount": float(item.get("amount", 0)),
+        }
+        for item in items
+    ]
     logger.info(f"获取到 {len(all_etfs)} 个 ETF")
     return all_etfs
 
 
-async def fetch_etf_detail(client: httpx.AsyncClient, code: str) -> dict:
-    """从东方财富爬取 ETF 详细信息"""
-    try:
-        url = f"https://fundf10.eastmoney.com/jbgk_{code}.html"
-        resp = await client.get(url, timeout=10)
-        text = resp.text
-
-        info = {"code": code}
-        # 交易所
-        info["exchange"] = "上海" if code.startswith("5") else "深圳"
-
-        # 基金全称
-        m = re.search(r'基金全称</th><td[^>]*>([^<]+)', text)
-        if m:
-            info["full_name"] = m.group(1).strip()
-
-        # 基金简称
-        m = re.search(r'基金简称</th><td[^>]*>([^<]+)', text)
-        if m:
-            info["short_name"] = m.group(1).strip()
-
-        # 基金管理人
-        m = re.search(r'基金管理人</th><td[^>]*><a[^>]*>([^<]+)', text)
-        if m:
-            info["manager"] = m.group(1).strip()
-
-        # 成立日期
-        m = re.search(r'成立日期/规模</th><td[^>]*>(\d{4}年\d{2}月\d{2}日)', text)
-        if m:
-            info["establish_date"] = m.group(1).strip()
-
-        # 投资范围
-        m = re.search(r'投资范围</label>.*?<p>\s*(.+?)\s*</p>', text, re.DOTALL)
-        if m:
-            info["scope"] = m.group(1).strip()[:500]  # 限制长度
-
-        # 风险收益特征
-        m = re.search(r'风险收益特征</label>.*?<p>\s*(.+?)\s*</p>', text, re.DOTALL)
-        if m:
-            info["risk"] = m.group(1).strip()[:300]
-
-        return info
-    except Exception as e:
-        logger.warning(f"获取 {code} 详情失败: {e}")
-        return {"code": code}
-
+def render_etf_line(info: dict) -> str:
+    name = info.get("short_name") or info.get("name", "")
+    return f"- {info['code']} {name}: {info.get('scope','')[:150]}"
 
-async def ai_classify_batch(client: httpx.AsyncClient, etf_infos: list[dict]) -> dict:
-    """AI 批量分类 ETF 到板块"""
-    if not etf_infos or not CLAUDE_API_KEY:
-        return {}
 
-    etf_list = "\n".join([
-        f"- {info['code']} {info.get('short_name','')}: {info.get('scope','')[:150]}"
-        for info in etf_infos
-    ])
+def build_classify_prompt(etf_infos: list[dict]) -> str:
+    etf_list = "\n".join(render_etf_line(info) for info in etf_infos)
 
-    prompt = f"""对以下ETF进行行业板块分类并生成描述。
+    return f"""对以下ETF进行行业板块分类并生成描述和板块别名。
 
 ## ETF列表
 {etf_list}
@@ -144,79 +94,73 @@ async def ai_classify_batch(client: httpx.AsyncClient, etf_infos: list[dict]) ->
   - 芯片ETF → "覆盖半导体设计、制造、封测全产业链龙头"
   - 证券ETF → "券商股打包投资，牛市弹性大"
 
+## tags 要求
+- 3-5个板块别名，包含可能的叫法（如芯片ETF: ["芯片", "半导体", "集成电路", "IC", "晶圆"]）
+
 ## 输出JSON
 ```json
 {{
-  "ETF代码": {{"sector": "板块", "desc": "描述"}},
+  "ETF代码": {{"sector": "板块", "desc": "描述", "tags": ["别名1", "别名2"]}},
   ...
 }}
 ```"""
 
+
+async def ai_classify_batch(etf_infos: list[dict]) -> dict:
+    """AI 批量分类 ETF 到板块（AIClient：共享限流、429 按 retry-after 暂停、重试、遥测）"""
+    if not etf_infos or not CLAUDE_API_KEY:
+        return {}
+    from src.services.ai_client import AIClient, AIRequest, parse_json_with_repair
+
     try:
-        resp = await client.post(
-            f"{CLAUDE_BASE_URL.rstrip('/')}/v1/messages",
-            headers={
-                "Content-Type": "application/json",
-                "x-api-key": CLAUDE_API_KEY,
-                "anthropic-version": "2023-06-01",
-            },
-            json={
-                "model": CLAUDE_MODEL,
-                "max_tokens": 4096,
-                "messages": [{"role": "user", "content": prompt}]
-            },
-            timeout=120,
-        )
-        resp.raise_for_status()
-        text = resp.json()["content"][0]["text"].strip()
-        if "```json" in text:
-            text = text.split("```json")[1].split("```")[0]
-        elif "```" in text:
-            text = text.split("```")[1].split("```")[0]
-        return json.loads(text)
+        text = await AIClient().send(AIRequest(
+            messages=[{"role": "user", "content": build_classify_prompt(etf_infos)}],
+            max_tokens=4096,
+            model=CLAUDE_MODEL,
+            stage=AI_STAGE,
+        ))
+        return parse_json_with_repair(text, fix_newlines=True)
     except Exception as e:
         logger.warning(f"AI分类失败: {e}")
         return {}
 
 
-async def fetch_kline_changes(client: httpx.AsyncClient, code: str) -> dict:
-    """获取 ETF 的 90 天 K 线数据和 5日/20日涨跌幅（东方财富 → 新浪降级）"""
-    # 优先东方财富
-    secid = f"1.{code}" if code.startswith("5") else f"0.{code}"
-    try:
-        resp = await client.get(
-            "https://push2his.eastmoney.com/api/qt/stock/kline/get",
-            params={
-                "secid": secid,
-                "fields1": "f1,f2,f3",
-                "fields2": "f51,f52,f53,f54,f55,f56",
-                "klt": "101",
-                "fqt": "1",
-                "end": "20500101",
-                "lmt": "95",
-            },
-        )
-        klines = resp.json().get("data", {}).get("klines", [])
-        if klines:
-            return _calc_changes([float(k.split(",")[2]) for k in klines])
-    except Exception:
-        pass
+async def ai_classify_offline(batches: list[list[dict]]) -> dict:
+    """离线批处理分类：每批 ETF 一个任务，job_id 由 prompt 内容决定，重跑时复用已提交/已完成的任务"""
+    from src.services.ai_batch import BatchQueue
+    from src.services.ai_client import AIRequest, parse_json_with_repair
+
+    queue = BatchQueue("update_etf_master")
+    jobs = {
+        queue.add(AIRequest(
+            messages=[{"role": "user", "content": build_classify_prompt(batch)}],
+            max_tokens=4096,
+            model=CLAUDE_MODEL,
+            stage=AI_STAGE,
+        )): batch
+        for batch in batches
+    }
+    queue.save()
+    if not await queue.run(list(jobs)):
+        # 不写断点：重跑时待分类集合不变，切出的批次和 job_id 也不变
+        raise SystemExit("批处理尚未结束，稍后重跑继续")
+
+    results = {}
+    for jid, batch in jobs.items():
+        text = queue.result(jid)
+        if not text:
+            continue
+        codes = {d["code"] for d in batch}
+        try:
+            results.update({c: v for c, v in parse_json_with_repair(text, fix_newlines=True).items() if c in codes and isinstance(v, dict)})
+        except Exception as e:
+            logger.warning(f"AI分类结果解析失败: {e}")
+    return results
 
-    # 降级：新浪 K 线 API
-    try:
-        prefix = "sh" if code.startswith("5") else "sz"
-        resp = await client.get(
-            "https://money.finance.sina.com.cn/quotes_service/api/json_v2.php/CN_MarketData.getKLineData",
-            params={"symbol": f"{prefix}{code}", "scale": "240", "ma": "no", "datalen": "95"},
-            headers={"Referer": "https://finance.sina.com.cn"},
-        )
-        data = resp.json()
-        if data and isinstance(data, list) and len(data) >= 2:
-            return _calc_changes([float(item["close"]) for item in data])
-    except Exception:
-        pass
 
-    return {}
+async def fetch_kline_changes(client: httpx.AsyncClient, code: str) -> dict:
+    """获取 ETF 的 90 天 K 线数据和 5日/20日涨跌幅（本地K线库，只增量拉取新K线）"""
+    return _calc_changes(await kline_store.closes(client, code_to_secid(code), 95))
 
 
 def _calc_changes(closes: list[float]) -> dict:
@@ -239,6 +183,15 @@ async def main():
         logger.error("请设置 CLAUDE_API_KEY 环境变量")
         return
 
+    # 旧数据用于预热详情/分类缓存
+    output_file = Path(__file__).parent.parent / "config" / "etf_master.json"
+    old_master = {}
+    if output_file.exists():
+        try:
+            old_master = json.loads(output_file.read_text())
+        except Exception as e:
+            logger.warning(f"读取旧 etf_master.json 失败: {e}")
+
     # Step 1: 获取全量 ETF
     logger.info("=== Step 1: 获取 ETF 列表 ===")
     all_etfs = await fetch_all_etfs()
@@ -250,56 +203,83 @@ async def main():
     ]
     logger.info(f"筛选后: {len(active_etfs)} 个活跃行业ETF")
 
-    # Step 2: 爬取详细信息
+    # Step 2: 获取详细信息（持久缓存，只抓新上市或过期的）
     logger.info("=== Step 2: 获取 ETF 详情 ===")
-    details = []
+    detail_store = EtfDetailStore()
+    detail_store.seed_from_master(old_master.get("etfs", {}), old_master.get("updated_at", ""))
     async with httpx.AsyncClient(timeout=30) as client:
-        sem = asyncio.Semaphore(5)
-
-        async def fetch_with_sem(etf):
-            async with sem:
-                detail = await fetch_etf_detail(client, etf["code"])
-                detail["name"] = etf["name"]
-                detail["amount_yi"] = round(etf["amount"] / 1e8, 2)
-                return detail
-
-        tasks = [fetch_with_sem(e) for e in active_etfs]
-        details = await asyncio.gather(*tasks)
-        details = [d for d in details if d.get("code")]
+        infos = await detail_store.get_many(client, [e["code"] for e in active_etfs])
+    details = []
+    for etf in active_etfs:
+        code = etf["code"]
+        detail = {"code": code, **infos.get(code, {})}
+        detail["exchange"] = "上海" if code.startswith("5") else "深圳"
+        detail["name"] = etf["name"]
+        detail["amount_yi"] = round(etf["amount"] / 1e8, 2)
+        details.append(detail)
     logger.info(f"获取到 {len(details)} 个 ETF 详情")
 
-    # Step 3: AI 批量分类
+    # Step 3: AI 批量分类（内容未变的复用缓存；其余按 token 预算切批，并发执行，每批完成即写断点）
     logger.info("=== Step 3: AI 分类 ===")
+    cache = EtfClassifyCache("update_etf_master")
+    cache.seed_from_master(old_master.get("etfs", {}))
+
     all_classifications = {}
-    async with httpx.AsyncClient(timeout=120) as client:
-        for i in range(0, len(details), 30):
-            batch = details[i:i+30]
-            logger.info(f"处理 {i+1}-{i+len(batch)}/{len(details)}...")
-            result = await ai_classify_batch(client, batch)
-            all_classifications.update(result)
-            await asyncio.sleep(1)  # 避免限流
-
-    # Step 4: 获取 K 线数据（小批量 + 长间隔，避免被限流）
+    for d in details:
+        hit = cache.lookup(d, ("sector", "desc", "tags"))
+        if hit:
+            all_classifications[d["code"]] = hit
+
+    checkpoint = BatchCheckpoint("update_etf_master", fingerprint=CLAUDE_MODEL)
+    pending = [
+        d for d in details
+        if d["code"] not in all_classifications and d["code"] not in checkpoint
+    ]
+    batches = pack_batches(pending, render_etf_line)
+    logger.info(f"待分类 {len(pending)}/{len(details)} 个，共 {len(batches)} 批")
+    if "--batch" in sys.argv:
+        if batches:
+            checkpoint.update(await ai_classify_offline(batches))
+    else:
+        from src.config import settings  # 需要 CLAUDE_API_KEY，只在实际调用 AI 时导入
+
+        async def classify(batch: list[dict]) -> dict:
+            codes = {d["code"] for d in batch}
+            result = await ai_classify_batch(batch)
+            return {c: v for c, v in result.items() if c in codes and isinstance(v, dict)}
+
+        await run_batches(
+            batches, classify, concurrency=settings.ai_max_concurrency, checkpoint=checkpoint, label="AI分类",
+        )
+
+    details_by_code = {d["code"]: d for d in details}
+    for code, result in checkpoint.done.items():
+        if code in details_by_code and code not in all_classifications:
+            cache.store(details_by_code[code], result)
+            all_classifications[code] = result
+    cache.save()
+    cache.report()
+
+    # Step 4: 获取 K 线数据（全部并发发起，实际并发由各域名的自适应上限控制）
     logger.info("=== Step 4: 获取 K 线数据 ===")
-    kline_map = {}
     codes = [d["code"] for d in details]
-    batch_size = 10
-    async with httpx.AsyncClient(
-        timeout=15,
-        limits=httpx.Limits(max_connections=2),
-        headers={"Referer": "https://finance.sina.com.cn"},
-    ) as client:
-        for i in range(0, len(codes), batch_size):
-            batch = codes[i:i + batch_size]
-            tasks = [fetch_kline_changes(client, c) for c in batch]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            for code, result in zip(batch, results):
-                if isinstance(result, dict) and result:
-                    kline_map[code] = result
-            if (i // batch_size) % 10 == 0:
-                logger.info(f"  K线进度: {min(i + batch_size, len(codes))}/{len(codes)}, 成功: {len(kline_map)}")
-            if i + batch_size < len(codes):
-                await asyncio.sleep(2)
+    done = 0
+
+    async def fetch_one(client: httpx.AsyncClient, code: str) -> dict:
+        nonlocal done
+        try:
+            return await fetch_kline_changes(client, code)
+        except Exception as e:
+            logger.warning(f"K线失败 {code}: {e}")
+            return {}
+        finally:
+            done += 1
+            if done % 50 == 0 or done == len(codes):
+                logger.info(f"  K线进度: {done}/{len(codes)}")
+
+    async with httpx.AsyncClient(timeout=15, limits=httpx.Limits(max_connections=64)) as client:
+        results = await asyncio.gather(*(fetch_one(client, c) for c in codes))
+    kline_map = {code: result for code, result in zip(codes, results) if result}
     logger.info(f"获取到 {len(kline_map)}/{len(details)} 个 ETF 的 K 线数据")
 
     # Step 5: 构建最终数据
@@ -312,6 +292,7 @@ async def main():
         classify = all_classifications.get(code, {})
         sector = classify.get("sector", "其他")
         desc = classify.get("desc", "")
+        tags = classify.get("tags", [])
 
         kline_data = kline_map.get(code, {})
         etf_master[code] = {
@@ -324,8 +305,10 @@ async def main():
             "amount_yi": detail.get("amount_yi", 0),
             "sector": sector,
             "desc": desc,
+            "tags": tags,
             "scope": detail.get("scope", "")[:200],
             "risk": detail.get("risk", "")[:100],
+            "detail_date": detail_store.fetched_date(code),
             "change_5d": kline_data.get("change_5d", 0),
             "change_20d": kline_data.get("change_20d", 0),
             "kline": kline_data.get("kline", []),
@@ -358,8 +341,8 @@ async def main():
         "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M"),
     }
 
-    output_file = Path(__file__).parent.parent / "config" / "etf_master.json"
     output_file.write_text(json.dumps(output, ensure_ascii=False, indent=2))
+    checkpoint.clear()
 
     # 统计
     logger.info(f"\n=== 完成 ===")
@@ -371,4 +354,11 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        asyncio.run(main())
+    finally:
+        telemetry.flush()
+        host_limiter.save()
+        # ai_client 惰性导入（需要 CLAUDE_API_KEY），只有实际调用过 AI 才有延迟样本要保存
+        if "src.services.ai_client" in sys.modules:
+            sys.modules["src.services.ai_client"].latency_tracker.save()
@@ -15,6 +15,10 @@ from src.worker_simple import (
 )
 from src.analyzers.realtime import analyze
 from src.notify import send_wechat_message, format_analysis_message
+from src.services.ai_client import latency_tracker
+from src.services.cache import log_cache_stats
+from src.services.host_limit import host_limiter
+from src.services.telemetry import telemetry
 
 
 def _dedupe_analysis_with_checklist(result: dict):
@@ -57,6 +61,7 @@ def load_news_raw() -> tuple[list[NewsItem], dict]:
             title=item["title"],
             source=item["source"],
             url=item.get("url", ""),
+            language=item.get("language", "zh"),
         )
         if item.get("published_at"):
             news_item.published_at = datetime.fromisoformat(item["published_at"])
@@ -171,4 +176,10 @@ async def run():
 
 
 if __name__ == "__main__":
-    asyncio.run(run())
+    try:
+        asyncio.run(run())
+    finally:
+        telemetry.flush()
+        log_cache_stats()
+        host_limiter.save()
+        latency_tracker.save()
@@ -1,13 +1,19 @@
 """简化版投资分析 - 无数据库，实时分析"""
 
 import asyncio
+import json
 from datetime import datetime, timezone, timedelta
+from pathlib import Path
 from collections import Counter
 from loguru import logger
 from src.config import settings
 from src.models import NewsItem
 from src.collectors import NewsAggregator
-from src.services.ai_client import AIClient, AIRequest, parse_json_with_repair
+from src.analyzers.relevance import prefilter, save_audit
+from src.analyzers.schema import build_reask_request, fill_defaults, merge_patch, validate_analysis
+from src.analyzers.translate import translate_titles
+from src.services.ai_client import AIClient, AIRequest, cached_block, parse_json_with_repair, repair_stats
+from src.services.sector_mapper import SectorResolver
 
 
 # 全局缓存
@@ -21,7 +27,9 @@ _cache = {
 # 定时任务控制
 _scheduler_task = None
 
-ANALYSIS_PROMPT = """你是A股ETF投资分析师，专注板块轮动和ETF配置建议。
+# Prompt 按稳定性排序：静态规则（system）→ 板块列表 → 历史上下文 → 新闻，
+# 前面的部分在每小时调用间保持不变，可命中服务端 prompt caching
+ANALYSIS_SYSTEM_PROMPT = """你是A股ETF投资分析师，专注板块轮动和ETF配置建议。
 
 ## 核心交易理念（必须遵守）
 
@@ -40,42 +48,34 @@ ANALYSIS_PROMPT = """你是A股ETF投资分析师，专注板块轮动和ETF配
 - 🚨 行业景气下行（业绩预亏、产能过剩）
 - 🚨 资金出逃（北向大幅流出、主力减仓）
 
-## 新闻数据（共{count}条）
-{news_list}
-
-{history_context}
-
-## 可选板块
-{sector_list}
-
 ## 商品周期规律
 黄金→白银→铜→石油→农产品（依次传导，领涨品种切换表示周期演进）
 
 ## 输出JSON
 ```json
-{{
+{
   "market_view": "🎯 一句话核心结论（25字内，直接说今天该关注什么）",
   "summary": "市场综述（200字）：融合关键事实与趋势，用emoji标注重点",
   "sentiment": "偏乐观/偏悲观/分歧/平淡",
   "sectors": [
-    {{
+    {
       "name": "板块名（必须从可选板块原样选取，禁止合并或自创名称）",
       "heat": 5,
       "direction": "利好/利空/中性",
       "confidence": 80,
       "analysis": "板块分析（80字）：包含驱动因素+风险提示",
       "signal": "🟢买入/🟡观望/🔴回避"
-    }}
+    }
   ],
   "risk_alerts": ["风险1：具体描述", "风险2：具体描述"],
   "opportunity_hints": ["机会1：具体描述", "机会2：具体描述"],
-  "commodity_cycle": {{
+  "commodity_cycle": {
     "stage": 2,
     "stage_name": "白银跟涨期",
     "leader": "gold/silver/copper/oil/corn",
     "analysis": "周期分析（30字）"
-  }}
-}}
+  }
+}
 ```
 
 ## 输出要求
@@ -89,6 +89,121 @@ ANALYSIS_PROMPT = """你是A股ETF投资分析师，专注板块轮动和ETF配
 6. 重要：JSON字符串中禁止使用中文引号""，只用英文引号或不用引号
 """
 
+SECTOR_LIST_PROMPT = """## 可选板块
+{sector_list}
+"""
+
+ANALYSIS_USER_PROMPT = """## 新闻数据（共{count}条）
+{news_list}
+
+请基于以上新闻，按要求输出JSON。"""
+
+REDUCE_USER_PROMPT = """## 板块证据汇总（由{count}条新闻分{shards}片提炼，按证据强度排序）
+{evidence}
+
+请基于以上证据，按要求输出JSON。"""
+
+# 新闻条数超过该阈值时启用 map-reduce 分析（分片并发提炼证据 → 汇总研判）
+MAP_REDUCE_THRESHOLD = 300
+# map 阶段最大并发数，也是分片数上限：分片大小随新闻条数增长，所有分片一轮并发完成
+MAP_CONCURRENCY = 4
+# 每个分片的最少新闻条数（条数少时不必拆满 MAP_CONCURRENCY 片）
+MAP_MIN_SHARD_SIZE = 100
+# 汇总时每个板块保留的证据条数
+MAX_EVIDENCE_PER_SECTOR = 6
+
+MAP_SYSTEM_PROMPT = """你是A股ETF投资分析师。从新闻中提炼对A股板块有实质影响的证据，供后续汇总研判。
+
+## 输出JSON
+```json
+{
+  "sectors": {
+    "板块名（必须从可选板块原样选取）": {
+      "direction": "利好/利空/中性",
+      "weight": 3,
+      "evidence": ["关键事实（20字内）"]
+    }
+  },
+  "macro": ["宏观/资金面要点（20字内）"],
+  "commodities": ["商品价格要点（20字内）"]
+}
+```
+
+## 输出要求
+1. weight: 1-5，代表该分片内证据强度
+2. 每个板块最多3条证据，macro/commodities 各最多3条
+3. 无关新闻直接忽略，不要编造
+4. 重要：JSON字符串中禁止使用中文引号""，只用英文引号或不用引号
+"""
+
+
+# 深挖阶段：主调用选出的前 N 个板块各自并发深挖
+DEEP_DIVE_TOP_N = 4
+# 深挖阶段最大并发数
+DEEP_DIVE_CONCURRENCY = 4
+# 每个板块送入深挖的相关新闻条数上限 / 下限（不足下限的板块不深挖）
+DEEP_DIVE_MAX_HEADLINES = 30
+DEEP_DIVE_MIN_HEADLINES = 3
+# 深挖阶段整体时限（秒），超时未返回的板块保留主调用结果
+DEEP_DIVE_TIMEOUT = 90
+
+DEEP_DIVE_SYSTEM_PROMPT = """你是A股ETF投资分析师。针对单个板块，结合相关新闻给出深入分析和操作检查清单。
+
+## 输出JSON
+```json
+{
+  "analysis": "板块分析（120字内）：驱动因素、持续性判断、主要风险",
+  "checklist": ["✅ 支撑因素", "⚠️ 需要验证或警惕的点", "❌ 利空因素"]
+}
+```
+
+## 输出要求
+1. analysis 与 checklist 不要重复同一句话
+2. checklist 2-4 条，每条 20 字内，以 ✅/⚠️/❌ 开头
+3. 只依据给出的新闻，不要编造
+4. 重要：JSON字符串中禁止使用中文引号""，只用英文引号或不用引号
+"""
+
+DEEP_DIVE_USER_PROMPT = """## 板块
+{name}（主分析结论：{direction}，热度{heat}，{signal}）
+
+## 相关新闻（共{count}条）
+{news_list}
+
+请按要求输出JSON。"""
+
+
+def build_cached_system(static_prompt: str, sector_str: str) -> list[dict]:
+    """system = 静态规则 + 板块列表，两个缓存断点（板块列表按月变化）"""
+    return [
+        cached_block(static_prompt),
+        cached_block(SECTOR_LIST_PROMPT.format(sector_list=sector_str)),
+    ]
+
+
+def build_analysis_request(
+    news_list: str, count: int, sector_str: str, history_context: str = "", *, user_prompt: str | None = None,
+) -> AIRequest:
+    """构建主分析请求：历史上下文（按天变化）放在新闻（每小时变化）之前
+
+    user_prompt 给定时替代新闻列表（map-reduce 汇总阶段传入证据汇总）
+    """
+    content: list[dict] = []
+    if history_context:
+        content.append(cached_block(history_context))
+    content.append({
+        "type": "text",
+        "text": user_prompt or ANALYSIS_USER_PROMPT.format(count=count, news_list=news_list),
+    })
+    return AIRequest(
+        system=build_cached_system(ANALYSIS_SYSTEM_PROMPT, sector_str),
+        messages=[{"role": "user", "content": content}],
+        max_tokens=4096,
+        timeout=120,
+        model=settings.claude_model,
+        stage="analyze",
+    )
+
 
 async def collect_news() -> tuple[list[NewsItem], dict]:
     """采集所有源的新闻，返回 (新闻列表, 来源统计)"""
@@ -102,60 +217,302 @@ async def collect_news() -> tuple[list[NewsItem], dict]:
         await agg.close()
 
 
-async def analyze(items: list[NewsItem], sector_list: list[str] = None, history_context: str = "") -> dict:
+# 过滤可能触发 AI 内容安全策略的新闻标题（政治人物全名等）
+# 这些新闻对投资分析无实质影响，过滤后不影响分析质量
+_FILTER_KEYWORDS = [
+    "习近平", "总书记", "李强", "赵乐际", "王沪宁", "蔡奇", "丁薛祥", "李希",
+    "国家主席", "国务院总理", "政协主席",
+]
+
+# 默认板块列表（与 etf_master.json 同步，含常用别名）
+DEFAULT_SECTORS = [
+    "AI", "白酒", "传媒", "电力", "房地产", "钢铁", "港股",
+    "光伏", "互联网", "化工", "环保", "黄金", "机器人", "家电",
+    "军工", "煤炭", "农业", "汽车", "软件", "石油", "通信",
+    "消费", "芯片", "新能源", "医药", "银行", "游戏", "有色",
+    "证券", "锂电池",
+]
+
+
+def _display_title(item: NewsItem) -> str:
+    """国际新闻优先用中文译名（原文保留在 title）"""
+    return item.summary_zh or item.title
+
+
+def _format_news_list(items: list[NewsItem]) -> str:
+    return "\n".join([
+        f"{i+1}. [{item.source}] {_display_title(item)}"
+        for i, item in enumerate(items)
+    ])
+
+
+async def analyze(
+    items: list[NewsItem],
+    sector_list: list[str] = None,
+    history_context: str = "",
+    *,
+    mode: str = "auto",
+    deep_dive: bool | None = None,
+) -> dict:
     """AI分析新闻
 
     Args:
         items: 新闻列表
         sector_list: 可选板块列表（从 etf_master.json 读取）
         history_context: 历史分析上下文（用于趋势对比）
+        mode: single=单次调用, map_reduce=分片提炼后汇总, auto=按新闻条数自动选择
+        deep_dive: 是否对热度最高的板块并发深挖（填充 analysis/checklist），默认读取配置
     """
-    # 过滤可能触发 AI 内容安全策略的新闻标题（政治人物全名等）
-    # 这些新闻对投资分析无实质影响，过滤后不影响分析质量
-    _FILTER_KEYWORDS = [
-        "习近平", "总书记", "李强", "赵乐际", "王沪宁", "蔡奇", "丁薛祥", "李希",
-        "国家主席", "国务院总理", "政协主席",
-    ]
     filtered = [item for item in items if not any(k in item.title for k in _FILTER_KEYWORDS)]
     if len(filtered) < len(items):
         logger.info(f"过滤 {len(items) - len(filtered)} 条非投资相关新闻")
 
-    news_list = "\n".join([
-        f"{i+1}. [{item.source}] {item.title}"
-        for i, item in enumerate(filtered)
-    ])
+    sector_str = "/".join(sector_list or DEFAULT_SECTORS)
 
-    # 默认板块列表（与 etf_master.json 同步，含常用别名）
-    if not sector_list:
-        sector_list = [
-            "AI", "白酒", "传媒", "电力", "房地产", "钢铁", "港股",
-            "光伏", "互联网", "化工", "环保", "黄金", "机器人", "家电",
-            "军工", "煤炭", "农业", "汽车", "软件", "石油", "通信",
-            "消费", "芯片", "新能源", "医药", "银行", "游戏", "有色",
-            "证券", "锂电池",
-        ]
-
-    sector_str = "/".join(sector_list)
-    prompt = ANALYSIS_PROMPT.format(
-        count=len(filtered),
-        news_list=news_list,
-        history_context=history_context,
-        sector_list=sector_str
-    )
+    # 先翻译再打分：英文标题只有译文能命中中文板块名/别名/ETF tags（译文有永久缓存，多翻的代价很小）
+    if settings.ai_translate_enabled:
+        try:
+            await translate_titles(filtered)
+        except Exception as e:
+            logger.warning(f"标题翻译失败，使用原文: {e}")
+
+    if settings.news_relevance_threshold > 0:
+        filtered, audit = prefilter(
+            filtered, sector_list or DEFAULT_SECTORS, settings.news_relevance_threshold, _load_master_etfs(),
+        )
+        save_audit(audit)
+
+    if mode == "auto":
+        mode = "map_reduce" if len(filtered) > MAP_REDUCE_THRESHOLD else "single"
 
     try:
+        if mode == "map_reduce":
+            logger.info(f"新闻 {len(filtered)} 条，使用 map-reduce 分析")
+            request = build_analysis_request(
+                "", len(filtered), sector_str, history_context,
+                user_prompt=await _map_news_to_evidence(filtered, sector_str),
+            )
+        else:
+            request = build_analysis_request(
+                _format_news_list(filtered), len(filtered), sector_str, history_context,
+            )
+
         client = AIClient()
-        text = await client.send(AIRequest(
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=4096,
-            timeout=120,
-            model=settings.claude_model,
-        ))
-        return parse_json_with_repair(text, fix_newlines=True)
+        text = await client.send(request)
+        result = await _ensure_complete(client, parse_json_with_repair(text, fix_newlines=True))
     except Exception as e:
         logger.error(f"分析失败: {e}")
         return {}
 
+    if deep_dive is None:
+        deep_dive = settings.ai_deep_dive_enabled
+    if deep_dive and result.get("sectors"):
+        await _deep_dive_sectors(result, filtered, sector_list or DEFAULT_SECTORS)
+    return result
+
+
+async def _ensure_complete(client: AIClient, data: dict) -> dict:
+    """schema 校验；缺失/不合法的字段单独补问一次，仍缺失的按规则填默认值"""
+    data, missing = validate_analysis(data)
+    if not missing or not data["sectors"]:
+        return data
+
+    logger.warning(f"分析结果缺失/不合法字段: {missing}，补问...")
+    try:
+        text = await client.send(build_reask_request(data, missing))
+        data = merge_patch(data, parse_json_with_repair(text, fix_newlines=True))
+        usage = client.last_usage
+        repair_stats["reask_calls"] += 1
+        repair_stats["reask_input_tokens"] += usage.get("input_tokens", 0) + usage.get("cache_read_tokens", 0)
+        repair_stats["reask_output_tokens"] += usage.get("output_tokens", 0)
+        logger.info(
+            f"补问完成（累计 {repair_stats['reask_calls']} 次，"
+            f"in={repair_stats['reask_input_tokens']} out={repair_stats['reask_output_tokens']} tokens）"
+        )
+    except Exception as e:
+        logger.warning(f"补问失败: {e}")
+
+    data, missing = validate_analysis(data)
+    if missing:
+        logger.warning(f"补问后仍缺失 {missing}，使用默认值")
+        repair_stats["defaulted_fields"] += len(missing)
+        data, _ = validate_analysis(fill_defaults(data, missing))
+    return data
+
+
+def _shard_news(
+    items: list[NewsItem], max_shards: int = MAP_CONCURRENCY, min_shard_size: int = MAP_MIN_SHARD_SIZE,
+) -> list[list[NewsItem]]:
+    """按来源聚拢后均分成不超过 max_shards 片，同一来源的新闻尽量落在同一分片
+
+    分片数封顶、分片大小随条数增长，map 阶段始终一轮并发完成，耗时不随新闻条数成倍增长。
+    """
+    if not items:
+        return []
+    ordered = sorted(items, key=lambda x: x.source)
+    count = min(max_shards, -(-len(ordered) // min_shard_size))
+    step, extra = divmod(len(ordered), count)
+    shards, start = [], 0
+    for i in range(count):
+        end = start + step + (i < extra)
+        shards.append(ordered[start:end])
+        start = end
+    return shards
+
+
+async def _map_shard(shard: list[NewsItem], sector_str: str, sem: asyncio.Semaphore) -> dict:
+    async with sem:
+        prompt = ANALYSIS_USER_PROMPT.format(count=len(shard), news_list=_format_news_list(shard))
+        try:
+            text = await AIClient().send(AIRequest(
+                system=build_cached_system(MAP_SYSTEM_PROMPT, sector_str),
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=1536,
+                timeout=90,
+                model=settings.claude_model,
+                stage="analyze.map",
+            ))
+            return parse_json_with_repair(text, fix_newlines=True)
+        except Exception as e:
+            logger.warning(f"分片提炼失败（{len(shard)}条）: {e}")
+            return {}
+
+
+def _merge_evidence(partials: list[dict]) -> str:
+    """合并各分片证据，生成汇总阶段使用的紧凑文本"""
+    sectors: dict[str, dict] = {}
+    macro: list[str] = []
+    commodities: list[str] = []
+    for part in partials:
+        for name, info in (part.get("sectors") or {}).items():
+            if not isinstance(info, dict):
+                continue
+            merged = sectors.setdefault(name, {"weight": 0, "votes": Counter(), "evidence": []})
+            try:
+                weight = int(info.get("weight", 1))
+            except (TypeError, ValueError):
+                weight = 1
+            merged["weight"] += weight
+            merged["votes"][info.get("direction", "中性")] += weight
+            for ev in info.get("evidence") or []:
+                if ev and ev not in merged["evidence"]:
+                    merged["evidence"].append(ev)
+        macro.extend(m for m in part.get("macro") or [] if m and m not in macro)
+        commodities.extend(c for c in part.get("commodities") or [] if c and c not in commodities)
+
+    lines = []
+    for name, info in sorted(sectors.items(), key=lambda x: -x[1]["weight"]):
+        votes = "/".join(f"{d}{n}" for d, n in info["votes"].most_common())
+        lines.append(f"### {name}（证据强度{info['weight']}，{votes}）")
+        lines.extend(f"- {ev}" for ev in info["evidence"][:MAX_EVIDENCE_PER_SECTOR])
+    if macro:
+        lines.append("### 宏观")
+        lines.extend(f"- {m}" for m in macro[:MAX_EVIDENCE_PER_SECTOR])
+    if commodities:
+        lines.append("### 商品")
+        lines.extend(f"- {c}" for c in commodities[:MAX_EVIDENCE_PER_SECTOR])
+    return "\n".join(lines)
+
+
+async def _map_news_to_evidence(items: list[NewsItem], sector_str: str) -> str:
+    """map 阶段：分片并发提炼板块证据，返回汇总阶段的 user prompt"""
+    shards = _shard_news(items)
+    sem = asyncio.Semaphore(MAP_CONCURRENCY)
+    partials = await asyncio.gather(*(_map_shard(s, sector_str, sem) for s in shards))
+    ok = [p for p in partials if p]
+    logger.info(f"map 阶段完成: {len(ok)}/{len(shards)} 个分片成功")
+    if not ok:
+        raise RuntimeError("map 阶段全部分片失败")
+    return REDUCE_USER_PROMPT.format(count=len(items), shards=len(ok), evidence=_merge_evidence(ok))
+
+
+def _load_master_etfs() -> dict:
+    master_file = Path(__file__).parent.parent.parent / "config" / "etf_master.json"
+    try:
+        return json.loads(master_file.read_text()).get("etfs", {})
+    except Exception:
+        return {}
+
+
+def select_headlines(
+    items: list[NewsItem], keywords: set[str], limit: int = DEEP_DIVE_MAX_HEADLINES,
+) -> list[NewsItem]:
+    """按命中关键词数量选出与板块相关的新闻（同分保持原顺序）"""
+    scored = []
+    for i, item in enumerate(items):
+        title = _display_title(item)
+        score = sum(1 for k in keywords if k in title)
+        if score:
+            scored.append((-score, i, item))
+    scored.sort(key=lambda x: x[:2])
+    return [item for _, _, item in scored[:limit]]
+
+
+async def _deep_dive_one(sector: dict, headlines: list[NewsItem], sem: asyncio.Semaphore) -> dict:
+    async with sem:
+        prompt = DEEP_DIVE_USER_PROMPT.format(
+            name=sector["name"],
+            direction=sector.get("direction", ""),
+            heat=sector.get("heat", ""),
+            signal=sector.get("signal", ""),
+            count=len(headlines),
+            news_list=_format_news_list(headlines),
+        )
+        try:
+            text = await AIClient().send(AIRequest(
+                # 各板块共用同一 system 前缀，并发请求可命中 prompt caching
+                system=[cached_block(DEEP_DIVE_SYSTEM_PROMPT)],
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=768,
+                timeout=60,
+                model=settings.claude_model,
+                stage="analyze.deep_dive",
+            ))
+            return parse_json_with_repair(text, fix_newlines=True)
+        except Exception as e:
+            logger.warning(f"板块深挖失败（{sector['name']}）: {e}")
+            return {}
+
+
+async def _deep_dive_sectors(result: dict, items: list[NewsItem], sector_list: list[str]):
+    """第二阶段：热度最高的板块各取本地筛选的相关新闻，并发深挖，填充 analysis/checklist"""
+    resolver = SectorResolver(sector_list, _load_master_etfs())
+    top = sorted(result["sectors"], key=lambda s: -s.get("heat", 0))[:DEEP_DIVE_TOP_N]
+
+    jobs = []
+    for sector in top:
+        headlines = select_headlines(items, resolver.keywords(sector["name"]))
+        if len(headlines) < DEEP_DIVE_MIN_HEADLINES:
+            logger.info(f"板块 {sector['name']} 相关新闻不足（{len(headlines)}条），跳过深挖")
+            continue
+        jobs.append((sector, headlines))
+    if not jobs:
+        return
+
+    logger.info(f"深挖 {len(jobs)} 个板块: {[s['name'] for s, _ in jobs]}")
+    sem = asyncio.Semaphore(DEEP_DIVE_CONCURRENCY)
+    tasks = {asyncio.create_task(_deep_dive_one(s, h, sem)): s for s, h in jobs}
+    done, pending = await asyncio.wait(tasks, timeout=DEEP_DIVE_TIMEOUT)
+    for task in pending:
+        task.cancel()
+    if pending:
+        # 等取消真正完成，避免连接/任务在事件循环关闭时还挂着
+        await asyncio.gather(*pending, return_exceptions=True)
+        logger.warning(f"深挖超时 {len(pending)} 个板块，保留主分析结果")
+
+    filled = 0
+    for task in done:
+        detail = task.result()
+        sector = tasks[task]
+        analysis = detail.get("analysis")
+        checklist = detail.get("checklist")
+        if isinstance(analysis, str) and analysis.strip():
+            sector["analysis"] = analysis.strip()
+        if isinstance(checklist, list):
+            sector["checklist"] = [str(c).strip() for c in checklist if str(c).strip()][:4]
+        filled += bool(analysis or checklist)
+    logger.info(f"深挖完成: {filled}/{len(jobs)} 个板块")
+
 
 async def refresh() -> dict:
     """刷新分析结果"""
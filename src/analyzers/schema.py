@@ -0,0 +1,232 @@
+"""分析结果 schema - 校验 AI 输出、定位缺失字段、构造补问请求
+
+模型偶尔漏掉 signal / confidence / commodity_cycle 等字段，或给出不合法的值。
+整体重跑要再花一次完整调用，这里只把缺失的字段连同最少的上下文发回去补问，
+补问仍失败的字段按规则填默认值，保证下游拿到的结构完整。
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Literal
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator
+
+from src.services.ai_client import AIRequest
+
+SIGNAL_KEYWORDS = ("买入", "观望", "回避")
+
+
+class SectorView(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    name: str = Field(min_length=1)
+    heat: int = Field(ge=1, le=5)
+    direction: Literal["利好", "利空", "中性"]
+    confidence: int = Field(ge=0, le=100)
+    analysis: str = Field(min_length=1)
+    signal: str
+
+    @field_validator("signal")
+    @classmethod
+    def _check_signal(cls, v: str) -> str:
+        if not any(k in v for k in SIGNAL_KEYWORDS):
+            raise ValueError("signal 必须包含 买入/观望/回避")
+        return v
+
+
+class CommodityCycle(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    stage: int = Field(ge=1, le=5)
+    stage_name: str = Field(min_length=1)
+    leader: Literal["gold", "silver", "copper", "oil", "corn"]
+    analysis: str = ""
+
+
+class AnalysisResult(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    market_view: str = Field(min_length=1)
+    summary: str = Field(min_length=1)
+    sentiment: str = Field(min_length=1)
+    sectors: list[SectorView] = Field(min_length=1)
+    risk_alerts: list[str]
+    opportunity_hints: list[str]
+    commodity_cycle: CommodityCycle
+
+
+# 补问时附带的字段要求（与主 prompt 的输出要求一致）
+FIELD_RULES = {
+    "market_view": "一句话核心结论（25字内），以🎯开头",
+    "summary": "市场综述（200字）",
+    "sentiment": "偏乐观/偏悲观/分歧/平淡",
+    "heat": "1-5 的整数",
+    "direction": "利好/利空/中性",
+    "confidence": "0-100 的整数，代表信号把握度",
+    "analysis": "板块分析（80字）：包含驱动因素+风险提示",
+    "signal": "🟢买入/🟡观望/🔴回避，基于热度+方向+风险综合判断",
+    "risk_alerts": "2-3 个风险点（字符串数组）",
+    "opportunity_hints": "2-3 个机会（字符串数组）",
+    "commodity_cycle": '{"stage": 1-5, "stage_name": "...", "leader": "gold/silver/copper/oil/corn", "analysis": "30字"}',
+}
+
+REASK_PROMPT = """以下是你刚才输出的分析结果节选，其中部分字段缺失或不合法。
+
+## 已有结果
+{context}
+
+## 需要补全的字段
+{fields}
+
+## 字段要求
+{rules}
+
+只输出需要补全的字段，板块字段以板块名为键：
+```json
+{{"sectors": {{"板块名": {{"字段": "值"}}}}, "顶层字段": "值"}}
+```"""
+
+_PATH_RE = re.compile(r"^sectors\[(\d+)\]\.(\w+)$")
+
+
+def _path(loc: tuple) -> str:
+    out = ""
+    for part in loc:
+        out += f"[{part}]" if isinstance(part, int) else (f".{part}" if out else str(part))
+    return out
+
+
+def validate_analysis(data: dict) -> tuple[dict, list[str]]:
+    """校验分析结果，返回（规范化后的结果, 缺失/不合法的字段路径）
+
+    路径形如 "sectors[2].signal"、"commodity_cycle"。缺少板块名的条目无法补问，直接丢弃。
+    """
+    data = dict(data)
+    data["sectors"] = [
+        s for s in data.get("sectors") or []
+        if isinstance(s, dict) and isinstance(s.get("name"), str) and s["name"]
+    ]
+    try:
+        return AnalysisResult.model_validate(data).model_dump(), []
+    except ValidationError as e:
+        missing = []
+        for err in e.errors():
+            loc = err["loc"]
+            # 顶层字段（含 commodity_cycle 的子字段）整体补问，板块字段精确到单个字段
+            path = _path(loc[:3] if loc and loc[0] == "sectors" else loc[:1])
+            if path not in missing:
+                missing.append(path)
+        return data, missing
+
+
+def build_reask_request(data: dict, missing: list[str]) -> AIRequest:
+    """只带缺失字段和涉及板块的关键信息，控制补问 prompt 在几百 tokens 内"""
+    context: dict[str, Any] = {"market_view": data.get("market_view", "")}
+    sector_fields: dict[str, list[str]] = {}
+    top_fields: list[str] = []
+    for path in missing:
+        m = _PATH_RE.match(path)
+        if m:
+            sector = data["sectors"][int(m.group(1))]
+            sector_fields.setdefault(sector["name"], []).append(m.group(2))
+        elif not path.startswith("sectors"):
+            top_fields.append(path)
+
+    if sector_fields:
+        keep = ("name", "heat", "direction", "analysis")
+        context["sectors"] = [
+            {k: s[k] for k in keep if k in s}
+            for s in data["sectors"] if s["name"] in sector_fields
+        ]
+
+    fields = [f"- {f}" for f in top_fields]
+    fields += [f"- sectors.{name}: {', '.join(fs)}" for name, fs in sector_fields.items()]
+    names = set(top_fields) | {f for fs in sector_fields.values() for f in fs}
+    rules = [f"- {k}: {v}" for k, v in FIELD_RULES.items() if k in names]
+
+    prompt = REASK_PROMPT.format(
+        context=json.dumps(context, ensure_ascii=False),
+        fields="\n".join(fields),
+        rules="\n".join(rules),
+    )
+    return AIRequest(
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=512,
+        timeout=60,
+        stage="analyze.reask",
+    )
+
+
+def merge_patch(data: dict, patch: dict) -> dict:
+    """把补问结果合并回原结果（板块按名称匹配）"""
+    if not isinstance(patch, dict):
+        return data
+    merged = dict(data)
+    sector_patch = patch.get("sectors")
+    if isinstance(sector_patch, dict):
+        merged["sectors"] = [
+            {**s, **sector_patch[s["name"]]} if isinstance(sector_patch.get(s["name"]), dict) else s
+            for s in data.get("sectors", [])
+        ]
+    for key, value in patch.items():
+        if key != "sectors" and key in AnalysisResult.model_fields:
+            merged[key] = value
+    return merged
+
+
+def default_signal(sector: dict) -> str:
+    """按交易理念推导信号：热度≥4 且利好→买入，利空→回避，其余观望"""
+    if sector.get("direction") == "利空":
+        return "🔴回避"
+    try:
+        heat = int(sector.get("heat"))
+    except (TypeError, ValueError):
+        heat = 0
+    if sector.get("direction") == "利好" and heat >= 4:
+        return "🟢买入"
+    return "🟡观望"
+
+
+_SECTOR_DEFAULTS = {
+    "heat": 3,
+    "direction": "中性",
+    "confidence": 50,
+    "analysis": "",
+}
+_TOP_DEFAULTS = {
+    "market_view": "",
+    "summary": "",
+    "sentiment": "平淡",
+    "risk_alerts": [],
+    "opportunity_hints": [],
+}
+
+
+def fill_defaults(data: dict, missing: list[str]) -> dict:
+    """补问后仍缺失的字段填默认值；commodity_cycle 缺失时移除，由前端按无数据处理"""
+    data = dict(data)
+    data["sectors"] = [dict(s) for s in data.get("sectors", [])]
+    # signal 依赖 heat/direction，放在最后
+    for path in sorted(missing, key=lambda p: p.endswith(".signal")):
+        m = _PATH_RE.match(path)
+        if m:
+            sector = data["sectors"][int(m.group(1))]
+            field = m.group(2)
+            if field == "signal":
+                sector["signal"] = default_signal(sector)
+            elif field in _SECTOR_DEFAULTS:
+                sector[field] = _SECTOR_DEFAULTS[field]
+        elif path == "commodity_cycle":
+            data.pop("commodity_cycle", None)
+        elif path in _TOP_DEFAULTS:
+            data[path] = _TOP_DEFAULTS[path]
+
+    # 整体仍可能不合法（如顶层文本为空），板块逐个规范化类型，保证 heat/confidence 为整数
+    for i, sector in enumerate(data["sectors"]):
+        try:
+            data["sectors"][i] = SectorView.model_validate(sector).model_dump()
+        except ValidationError:
+            pass
+    return data
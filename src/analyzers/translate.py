@@ -0,0 +1,128 @@
+"""国际新闻标题翻译 - 批量翻译 + 按标题哈希永久缓存
+
+英文标题（CNBC/Bloomberg/BBC/TechCrunch 等）翻译成中文后写入 NewsItem.summary_zh，
+供相关度打分、分析 prompt 和 news.json（title_zh）使用。analyze() 在预过滤之前对全部新闻翻译，
+末尾低优先级和被丢弃的新闻在 news.json 里同样有译文。每小时的采集结果大量重复，命中缓存的标题不再调用 AI。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+
+from loguru import logger
+
+from src.config import settings
+from src.models import NewsItem
+from src.services.ai_client import AIClient, AIRequest, parse_json_with_repair
+from src.services.batch_runner import pack_batches, run_batches
+from src.services.storage import CACHE_DIR, load_json, save_json
+
+TRANSLATION_CACHE_FILE = CACHE_DIR / "translations.json"
+# 缓存条数上限，超出时淘汰最早写入的
+MAX_CACHE_ENTRIES = 50000
+# 每批最多翻译的标题数
+TRANSLATE_BATCH_SIZE = 50
+
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u9fff]")
+_LATIN_RE = re.compile(r"[A-Za-z]")
+
+TRANSLATE_PROMPT = """把以下英文财经新闻标题翻译成简洁的中文。
+
+## 要求
+1. 保留公司名、人名的常用中文译名，股票代码/缩写（如 AI、GDP、Fed）可保留英文
+2. 译文 40 字以内，不要添加原文没有的信息
+
+## 标题
+{titles}
+
+## 输出JSON（键为标题编号）
+```json
+{{"编号": "中文标题"}}
+```"""
+
+
+def title_key(title: str) -> str:
+    return hashlib.sha1(" ".join(title.lower().split()).encode("utf-8")).hexdigest()[:16]
+
+
+def needs_translation(item: NewsItem) -> bool:
+    """英文来源、或标题里没有中日文字符但有拉丁字母的新闻需要翻译"""
+    if item.summary_zh:
+        return False
+    if item.language.startswith("en"):
+        return True
+    return not _CJK_RE.search(item.title) and bool(_LATIN_RE.search(item.title))
+
+
+class TranslationCache:
+    """标题哈希 → 中文标题"""
+
+    def __init__(self, path=TRANSLATION_CACHE_FILE):
+        self.path = path
+        self._entries: dict[str, str] = load_json(path, {}) or {}
+
+    def get(self, title: str) -> str | None:
+        return self._entries.get(title_key(title))
+
+    def put(self, title: str, translation: str):
+        self._entries[title_key(title)] = translation
+
+    def save(self):
+        overflow = len(self._entries) - MAX_CACHE_ENTRIES
+        if overflow > 0:
+            for key in list(self._entries)[:overflow]:
+                del self._entries[key]
+        try:
+            save_json(self.path, self._entries)
+        except Exception as e:
+            logger.warning(f"保存翻译缓存失败: {e}")
+
+
+async def _translate_batch(titles: list[str]) -> dict[str, str]:
+    numbered = {str(i + 1): t for i, t in enumerate(titles)}
+    prompt = TRANSLATE_PROMPT.format(titles="\n".join(f"{k}. {t}" for k, t in numbered.items()))
+    text = await AIClient().send(AIRequest(
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=2048,
+        timeout=60,
+        stage="translate",
+    ))
+    data = parse_json_with_repair(text, fix_newlines=True)
+    return {
+        numbered[k]: v.strip() for k, v in data.items()
+        if k in numbered and isinstance(v, str) and v.strip()
+    }
+
+
+async def translate_titles(items: list[NewsItem], cache: TranslationCache | None = None) -> int:
+    """为需要翻译的新闻填充 summary_zh，返回本次调用 AI 翻译的标题数"""
+    targets = [item for item in items if needs_translation(item)]
+    if not targets:
+        return 0
+
+    cache = cache or TranslationCache()
+    missing: dict[str, None] = {}  # 去重并保持顺序
+    for item in targets:
+        cached = cache.get(item.title)
+        if cached:
+            item.summary_zh = cached
+        else:
+            missing[item.title] = None
+
+    logger.info(f"🌐 国际新闻翻译: {len(targets)} 条，缓存命中 {len(targets) - len(missing)}，待翻译 {len(missing)}")
+    if not missing:
+        return 0
+
+    batches = pack_batches(list(missing), lambda t: t, max_items=TRANSLATE_BATCH_SIZE)
+    translated = await run_batches(
+        batches, _translate_batch, concurrency=settings.ai_max_concurrency, label="标题翻译",
+    )
+    for title, zh in translated.items():
+        cache.put(title, zh)
+    cache.save()
+
+    for item in targets:
+        if not item.summary_zh and item.title in translated:
+            item.summary_zh = translated[item.title]
+    return len(translated)
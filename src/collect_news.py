@@ -38,6 +38,7 @@ async def collect():
                 "source": item.source,
                 "url": item.url,
                 "published_at": item.published_at.isoformat() if item.published_at else None,
+                "language": item.language,
             }
             for item in news.items
         ],
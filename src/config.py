@@ -27,6 +27,38 @@ class Settings(BaseSettings):
         default="claude-sonnet-4-6", alias="AI_FALLBACK_MODEL"
     )
 
+    # AI 对冲请求（主 API 超过自适应阈值仍未返回时，并行请求 fallback，先返回者胜出）
+    ai_hedge_enabled: bool = Field(default=True, alias="AI_HEDGE_ENABLED")
+    ai_hedge_percentile: float = Field(default=0.9, alias="AI_HEDGE_PERCENTILE")
+    ai_hedge_min_delay: float = Field(default=10.0, alias="AI_HEDGE_MIN_DELAY")
+    ai_hedge_default_delay: float = Field(default=60.0, alias="AI_HEDGE_DEFAULT_DELAY")
+
+    # LLM 全局限流（同一 API 地址的所有调用共享：请求数/分钟、输入 tokens/分钟、并发上限）
+    ai_rpm: int = Field(default=50, alias="AI_RPM")
+    ai_tpm: int = Field(default=200000, alias="AI_TPM")
+    ai_max_concurrency: int = Field(default=4, alias="AI_MAX_CONCURRENCY")
+
+    # AI 单价（美元 / 百万 tokens），遥测据此估算费用；prompt cache 读按 0.1 倍、写按 1.25 倍输入单价计
+    ai_price_input: float = Field(default=3.0, alias="AI_PRICE_INPUT")
+    ai_price_output: float = Field(default=15.0, alias="AI_PRICE_OUTPUT")
+    ai_fallback_price_input: float = Field(default=3.0, alias="AI_FALLBACK_PRICE_INPUT")
+    ai_fallback_price_output: float = Field(default=15.0, alias="AI_FALLBACK_PRICE_OUTPUT")
+
+    # 离线批处理（ETF 分类/描述等批量任务）：auto=优先 Message Batches 接口，不支持时本地逐条；api；local
+    ai_batch_mode: str = Field(default="auto", alias="AI_BATCH_MODE")
+    ai_batch_poll_interval: float = Field(default=30.0, alias="AI_BATCH_POLL_INTERVAL")
+    # 单次运行最长等待（秒），超时后退出，重跑继续轮询已提交的批次
+    ai_batch_max_wait: float = Field(default=3600.0, alias="AI_BATCH_MAX_WAIT")
+
+    # 板块深挖：主分析后对热度最高的几个板块并发追加一次小调用，填充 analysis/checklist
+    ai_deep_dive_enabled: bool = Field(default=False, alias="AI_DEEP_DIVE_ENABLED")
+
+    # 国际新闻标题翻译（批量 + 永久缓存），译文用于分析 prompt 和 news.json
+    ai_translate_enabled: bool = Field(default=True, alias="AI_TRANSLATE_ENABLED")
+
+    # 新闻相关度预过滤阈值（0-1，0 为关闭）：低于阈值的新闻只保留少量放在 prompt 末尾
+    news_relevance_threshold: float = Field(default=0.2, alias="NEWS_RELEVANCE_THRESHOLD")
+
     # 企业微信推送配置
     wechat_webhook_url: str = Field(
         default="", alias="WECHAT_WEBHOOK_URL"
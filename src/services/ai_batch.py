@@ -0,0 +1,245 @@
+"""离线批处理 - 不急的 AI 任务（ETF 分类、描述刷新等批量任务）走 Message Batches
+
+任务先写入磁盘队列，job_id 由请求内容哈希得到，相同请求重复入队是幂等的。
+整批提交到支持 /v1/messages/batches 的端点，轮询到结束后取回结果写回队列；
+中断后重跑会继续轮询已提交的批次，已完成的任务不会重复提交。
+端点不支持批处理时退化为本地低并发逐条调用。
+
+批处理在服务端异步执行（费用约为实时调用的一半），不占用每小时新闻分析的实时限流配额。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any
+
+import httpx
+from loguru import logger
+
+from src.config import settings
+from src.services.ai_client import AIClient, AIRequest
+from src.services.storage import CACHE_DIR, load_json, save_json
+from src.services.telemetry import parse_usage, telemetry
+
+BATCH_DIR = CACHE_DIR / "ai_batch"
+# 单个批次最多请求数
+MAX_BATCH_REQUESTS = 1000
+# 本地替代模式的并发（低于实时路径，给每小时分析让出配额）
+LOCAL_CONCURRENCY = 2
+# 已结束任务在队列文件中保留的天数
+JOB_KEEP_DAYS = 7
+
+
+class BatchUnsupported(Exception):
+    """端点没有 Message Batches 接口"""
+
+
+def job_id(req: AIRequest, model: str) -> str:
+    """请求内容哈希（模型 + system + messages + max_tokens）"""
+    raw = json.dumps(
+        {"model": model, "system": req.system, "messages": req.messages, "max_tokens": req.max_tokens},
+        ensure_ascii=False, sort_keys=True,
+    )
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:24]
+
+
+def _message_text(message: dict[str, Any]) -> str:
+    for item in message.get("content") or []:
+        if item.get("type") == "text" and item.get("text"):
+            return item["text"].strip()
+    return ""
+
+
+class BatchQueue:
+    """按任务名落盘的批处理队列（BATCH_DIR/<name>.json）
+
+    任务状态：queued → submitted → succeeded / failed。失败的任务再次 add() 会重新排队。
+    """
+
+    def __init__(self, name: str, directory=BATCH_DIR):
+        self.name = name
+        self.path = directory / f"{name}.json"
+        data = load_json(self.path, {}) or {}
+        self.jobs: dict[str, dict[str, Any]] = data.get("jobs", {})
+        self.batches: dict[str, dict[str, Any]] = data.get("batches", {})
+        self.base_url = settings.claude_base_url.rstrip("/")
+        self.model = settings.claude_model
+        self._headers = {
+            "Content-Type": "application/json",
+            "x-api-key": settings.claude_api_key,
+            "anthropic-version": "2023-06-01",
+        }
+
+    def add(self, req: AIRequest) -> str:
+        model = req.model or self.model
+        jid = job_id(req, model)
+        job = self.jobs.get(jid)
+        if job is None or job["status"] == "failed":
+            params: dict[str, Any] = {"model": model, "max_tokens": req.max_tokens, "messages": req.messages}
+            if req.system:
+                params["system"] = req.system
+            self.jobs[jid] = {
+                "status": "queued",
+                "stage": req.stage,
+                "timeout": req.timeout,
+                "params": params,
+                "created_at": time.time(),
+            }
+        return jid
+
+    def result(self, jid: str) -> str | None:
+        job = self.jobs.get(jid) or {}
+        return job.get("text") if job.get("status") == "succeeded" else None
+
+    def save(self):
+        """写盘，顺带清理过期的已结束任务和无任务引用的批次"""
+        cutoff = time.time() - JOB_KEEP_DAYS * 86400
+        self.jobs = {
+            k: j for k, j in self.jobs.items()
+            if j["status"] in ("queued", "submitted") or j.get("finished_at", j["created_at"]) >= cutoff
+        }
+        used = {j.get("batch_id") for j in self.jobs.values()}
+        self.batches = {k: b for k, b in self.batches.items() if k in used}
+        save_json(self.path, {"jobs": self.jobs, "batches": self.batches})
+
+    async def run(
+        self,
+        job_ids: list[str] | None = None,
+        *,
+        mode: str | None = None,
+        poll_interval: float | None = None,
+        max_wait: float | None = None,
+    ) -> bool:
+        """提交排队中的任务并等待结束；全部结束返回 True，等待超时返回 False（重跑可续）
+
+        mode: api=只用批处理接口, local=本地逐条调用, auto=优先批处理接口，不支持时退化为本地
+        """
+        # 同一请求多次 add() 得到相同 job_id，去重后再提交（custom_id 在批次内必须唯一）
+        ids = [j for j in dict.fromkeys(list(self.jobs) if job_ids is None else job_ids) if j in self.jobs]
+        mode = mode or settings.ai_batch_mode
+        queued = [j for j in ids if self.jobs[j]["status"] == "queued"]
+        if queued and mode != "local":
+            try:
+                await self._submit(queued)
+            except BatchUnsupported as e:
+                if mode == "api":
+                    raise
+                logger.info(f"端点不支持批处理（{e}），改为本地逐条调用")
+                mode = "local"
+        if mode == "local":
+            await self._run_local([j for j in ids if self.jobs[j]["status"] == "queued"])
+        finished = await self._poll(
+            ids,
+            settings.ai_batch_poll_interval if poll_interval is None else poll_interval,
+            settings.ai_batch_max_wait if max_wait is None else max_wait,
+        )
+        counts: dict[str, int] = {}
+        for j in ids:
+            counts[self.jobs[j]["status"]] = counts.get(self.jobs[j]["status"], 0) + 1
+        logger.info(f"📦 批处理 {self.name}: {counts}")
+        return finished
+
+    async def _submit(self, jids: list[str]):
+        async with httpx.AsyncClient(timeout=120) as client:
+            for i in range(0, len(jids), MAX_BATCH_REQUESTS):
+                chunk = jids[i:i + MAX_BATCH_REQUESTS]
+                resp = await client.post(
+                    f"{self.base_url}/v1/messages/batches",
+                    headers=self._headers,
+                    json={"requests": [{"custom_id": j, "params": self.jobs[j]["params"]} for j in chunk]},
+                )
+                if resp.status_code in (404, 405, 501):
+                    raise BatchUnsupported(f"HTTP {resp.status_code}")
+                resp.raise_for_status()
+                batch_id = resp.json()["id"]
+                now = time.time()
+                self.batches[batch_id] = {"submitted_at": now, "count": len(chunk)}
+                for j in chunk:
+                    self.jobs[j].update(status="submitted", batch_id=batch_id, submitted_at=now)
+                self.save()
+                logger.info(f"📦 已提交批次 {batch_id}（{len(chunk)} 个请求）")
+
+    async def _poll(self, ids: list[str], poll_interval: float, max_wait: float) -> bool:
+        started = time.monotonic()
+        async with httpx.AsyncClient(timeout=120) as client:
+            while True:
+                outstanding = {
+                    self.jobs[j]["batch_id"] for j in ids if self.jobs[j]["status"] == "submitted"
+                }
+                for batch_id in outstanding:
+                    resp = await client.get(f"{self.base_url}/v1/messages/batches/{batch_id}", headers=self._headers)
+                    resp.raise_for_status()
+                    info = resp.json()
+                    if info.get("processing_status") == "ended":
+                        await self._collect(client, batch_id, info)
+                        outstanding = outstanding - {batch_id}
+                if not outstanding:
+                    return True
+                if time.monotonic() - started >= max_wait:
+                    logger.warning(f"批处理 {self.name}: {len(outstanding)} 个批次未结束，稍后重跑继续")
+                    return False
+                await asyncio.sleep(poll_interval)
+
+    async def _collect(self, client: httpx.AsyncClient, batch_id: str, info: dict[str, Any]):
+        results_url = info.get("results_url") or f"{self.base_url}/v1/messages/batches/{batch_id}/results"
+        resp = await client.get(results_url, headers=self._headers)
+        resp.raise_for_status()
+        submitted_at = self.batches.get(batch_id, {}).get("submitted_at", time.time())
+        now = time.time()
+        seen = set()
+        for line in resp.text.splitlines():
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            job = self.jobs.get(row.get("custom_id", ""))
+            if job is None or job.get("batch_id") != batch_id:
+                continue
+            seen.add(row["custom_id"])
+            result = row.get("result") or {}
+            message = result.get("message") or {}
+            text = _message_text(message) if result.get("type") == "succeeded" else ""
+            if text:
+                job.update(status="succeeded", text=text, finished_at=now)
+            else:
+                error = result.get("error") or {}
+                job.update(status="failed", error=error.get("message") or result.get("type", "unknown"), finished_at=now)
+            telemetry.record(
+                stage=job["stage"], endpoint="batch", model=job["params"]["model"],
+                status="ok" if text else "error", attempts=1, latency_s=now - submitted_at,
+                usage=parse_usage(message.get("usage")) if text else None,
+            )
+        # 结果里缺失的任务（批次被取消/过期）标记失败，下次 add() 会重新排队
+        for job in self.jobs.values():
+            if job.get("batch_id") == batch_id and job["status"] == "submitted":
+                job.update(status="failed", error="missing from results", finished_at=now)
+        self.save()
+        logger.info(f"📦 批次 {batch_id} 已结束，取回 {len(seen)} 个结果")
+
+    async def _run_local(self, jids: list[str]):
+        if not jids:
+            return
+        sem = asyncio.Semaphore(LOCAL_CONCURRENCY)
+        client = AIClient()
+
+        async def run_one(jid: str):
+            job = self.jobs[jid]
+            params = job["params"]
+            async with sem:
+                try:
+                    text = await client.send(AIRequest(
+                        messages=params["messages"],
+                        max_tokens=params["max_tokens"],
+                        system=params.get("system"),
+                        model=params["model"],
+                        timeout=job["timeout"],
+                        stage=job["stage"],
+                    ))
+                    job.update(status="succeeded", text=text, finished_at=time.time())
+                except Exception as e:
+                    job.update(status="failed", error=str(e), finished_at=time.time())
+            self.save()
+
+        await asyncio.gather(*(run_one(j) for j in jids))
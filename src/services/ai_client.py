@@ -6,6 +6,9 @@ import asyncio
 import json
 import random
 import re
+import time
+from bisect import bisect_left
+from collections import Counter
 from dataclasses import dataclass
 from typing import Any, Iterable
 
@@ -13,14 +16,122 @@ import httpx
 from loguru import logger
 
 from src.config import settings
+from src.services.rate_limit import estimate_tokens, get_ai_limiter, parse_retry_after
+from src.services.storage import CACHE_DIR, load_json, save_json
+from src.services.telemetry import parse_usage, telemetry
+
+# 延迟直方图桶上界（秒），最后一个桶收纳超过 180s 的请求
+LATENCY_BUCKETS = [1, 2, 3, 5, 8, 13, 20, 30, 45, 60, 90, 120, 180]
+LATENCY_FILE = CACHE_DIR / "ai_latency.json"
+# 每次记录前对旧计数衰减，让阈值跟随近期表现
+LATENCY_DECAY = 0.98
+# 样本不足时不信任直方图，使用默认阈值
+LATENCY_MIN_SAMPLES = 5
+
+
+# 不支持 prompt caching 的端点（运行期内记住，后续请求不再携带 cache_control）
+_NO_CACHE_ENDPOINTS: set[str] = set()
 
 
 @dataclass
 class AIRequest:
-    messages: list[dict[str, str]]
+    messages: list[dict[str, Any]]
     max_tokens: int = 1024
     timeout: float = 120
     model: str | None = None
+    # system 可以是字符串，也可以是 content block 列表（配合 cached_block 使用 prompt caching）
+    system: str | list[dict[str, Any]] | None = None
+    # 流水线阶段名，遥测按阶段汇总 tokens / 延迟 / 费用
+    stage: str = ""
+
+
+def cached_block(text: str) -> dict[str, Any]:
+    """标记为可缓存的文本块：稳定前缀放前面，缓存断点之前的内容可被服务端复用"""
+    return {"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}
+
+
+def _strip_cache_control(value: Any) -> Any:
+    if isinstance(value, list):
+        return [_strip_cache_control(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _strip_cache_control(v) for k, v in value.items() if k != "cache_control"}
+    return value
+
+
+def _uses_cache_control(payload: dict[str, Any]) -> bool:
+    return '"cache_control"' in json.dumps(payload, ensure_ascii=False)
+
+
+def _endpoint_key(base_url: str, model: str, stage: str) -> str:
+    # 按阶段分开统计：长输出的主分析和短输出的翻译/追问延迟差一个量级，混在一起 p90 会被拉低
+    return f"{base_url}|{model}|{stage}"
+
+
+class LatencyTracker:
+    """Per-endpoint, per-stage latency histograms, persisted so hedge thresholds come from real runs."""
+
+    def __init__(self, path=LATENCY_FILE):
+        self.path = path
+        self._data: dict[str, list[float]] | None = None
+        self._dirty = False
+
+    def _load(self) -> dict[str, list[float]]:
+        if self._data is None:
+            raw = load_json(self.path, {}) or {}
+            self._data = {
+                k: [float(c) for c in v] for k, v in raw.items()
+                if isinstance(v, list) and len(v) == len(LATENCY_BUCKETS) + 1
+            }
+        return self._data
+
+    def record(self, endpoint: str, seconds: float):
+        data = self._load()
+        counts = data.setdefault(endpoint, [0.0] * (len(LATENCY_BUCKETS) + 1))
+        for i in range(len(counts)):
+            counts[i] *= LATENCY_DECAY
+        counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self._dirty = True
+
+    def save(self):
+        """写入直方图文件（入口脚本结束时调用一次）"""
+        if not self._dirty or self._data is None:
+            return
+        try:
+            save_json(self.path, {k: [round(c, 4) for c in v] for k, v in self._data.items()})
+            self._dirty = False
+        except Exception as e:
+            logger.warning(f"保存延迟直方图失败: {e}")
+
+    def percentile(self, endpoint: str, q: float) -> float | None:
+        """按桶内线性插值估算分位数，样本不足返回 None"""
+        counts = self._load().get(endpoint)
+        if not counts:
+            return None
+        total = sum(counts)
+        if total < LATENCY_MIN_SAMPLES:
+            return None
+        target = q * total
+        cum = 0.0
+        for i, c in enumerate(counts):
+            if c > 0 and cum + c >= target:
+                if i >= len(LATENCY_BUCKETS):
+                    return float(LATENCY_BUCKETS[-1])
+                lower = LATENCY_BUCKETS[i - 1] if i > 0 else 0
+                upper = LATENCY_BUCKETS[i]
+                return lower + (target - cum) / c * (upper - lower)
+            cum += c
+        return float(LATENCY_BUCKETS[-1])
+
+    def hedge_delay(self, endpoint: str) -> float:
+        """对冲阈值：主 API 近期 p90（可配置），无数据时用默认值"""
+        p = self.percentile(endpoint, settings.ai_hedge_percentile)
+        if p is None:
+            return settings.ai_hedge_default_delay
+        return max(settings.ai_hedge_min_delay, p)
+
+
+# 所有 AIClient 实例共享，避免重复读写直方图文件
+latency_tracker = LatencyTracker()
 
 
 class AIClient:
@@ -30,52 +141,162 @@ class AIClient:
         self.base_url = settings.claude_base_url.rstrip("/")
         self.api_key = settings.claude_api_key
         self.model = settings.claude_model
+        # 最近一次成功调用的 token 用量（含 prompt cache 读写）
+        self.last_usage: dict[str, int] = {}
 
     async def send(self, req: AIRequest) -> str:
-        result = await self._call_api(
-            self.base_url, self.api_key, req.model or self.model, req,
-        )
+        primary = (self.base_url, self.api_key, req.model or self.model)
+        fallback = None
+        fb_url = settings.ai_fallback_base_url
+        fb_key = settings.ai_fallback_api_key
+        if fb_url and fb_key:
+            fallback = (fb_url.rstrip("/"), fb_key, settings.ai_fallback_model)
+
+        if fallback and settings.ai_hedge_enabled:
+            return await self._send_hedged(req, primary, fallback)
+
+        result = await self._call_api(*primary, req)
         if result is not None:
             return result
 
         # 主 API 内容安全拒绝，尝试 fallback
-        fb_url = settings.ai_fallback_base_url
-        fb_key = settings.ai_fallback_api_key
-        if fb_url and fb_key:
+        if fallback:
             logger.info(f"降级到 fallback API...")
-            result = await self._call_api(
-                fb_url.rstrip("/"), fb_key, settings.ai_fallback_model, req,
-            )
+            result = await self._call_api(*fallback, req, role="fallback")
             if result is not None:
                 return result
 
         raise RuntimeError("AI API error: all endpoints failed")
 
+    async def _send_hedged(
+        self, req: AIRequest, primary: tuple[str, str, str], fallback: tuple[str, str, str],
+    ) -> str:
+        """对冲请求：主 API 超过自适应阈值未返回时并行请求 fallback，先拿到有效结果者胜出。
+
+        主 API 内容安全拒绝或重试耗尽时立即启动 fallback。
+        """
+        started = time.monotonic()
+        endpoint = _endpoint_key(primary[0], primary[2], req.stage)
+        delay = latency_tracker.hedge_delay(endpoint)
+        primary_task = asyncio.create_task(self._call_api(*primary, req))
+        tasks = {primary_task: "primary"}
+        hedged = False
+        last_err: Exception | None = None
+
+        def start_fallback(reason: str):
+            nonlocal hedged
+            hedged = True
+            logger.info(f"{reason}，请求 fallback API...")
+            tasks[asyncio.create_task(self._call_api(*fallback, req, role="fallback"))] = "fallback"
+
+        try:
+            while tasks:
+                timeout = None if hedged else max(0.0, delay - (time.monotonic() - started))
+                done, _ = await asyncio.wait(
+                    tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    start_fallback(f"主 API {delay:.0f}s 未返回（对冲阈值）")
+                    continue
+                for task in done:
+                    name = tasks.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        last_err = e
+                        logger.warning(f"{name} API 失败: {e}")
+                        result = None
+                        if name == "primary":
+                            # 重试耗尽的耗时同样是主 API 延迟的下界
+                            latency_tracker.record(endpoint, time.monotonic() - started)
+                    if result is not None:
+                        if name == "fallback":
+                            logger.info(f"fallback API 先返回（{time.monotonic() - started:.1f}s）")
+                        return result
+                if not hedged:
+                    start_fallback("主 API 无有效结果")
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            # 被对冲取消的主请求也计入直方图（耗时是真实延迟的下界），
+            # 否则直方图只剩快样本，p90 偏低导致对冲越来越早
+            if primary_task.cancelled():
+                latency_tracker.record(endpoint, time.monotonic() - started)
+
+        raise last_err or RuntimeError("AI API error: all endpoints failed")
+
     async def _call_api(
-        self, base_url: str, api_key: str, model: str, req: AIRequest,
+        self, base_url: str, api_key: str, model: str, req: AIRequest, role: str = "primary",
+    ) -> str | None:
+        """调用 API 并记录遥测：成功、拒绝、失败、被对冲取消都记一条"""
+        started = time.monotonic()
+        call: dict[str, Any] = {"status": "error", "attempts": 0, "usage": {}}
+        try:
+            result = await self._post_with_retries(base_url, api_key, model, req, call)
+            call["status"] = "ok" if result is not None else "refused"
+            return result
+        except asyncio.CancelledError:
+            call["status"] = "cancelled"
+            raise
+        finally:
+            telemetry.record(
+                stage=req.stage, endpoint=role, model=model, status=call["status"],
+                attempts=call["attempts"], latency_s=time.monotonic() - started, usage=call["usage"],
+            )
+
+    async def _post_with_retries(
+        self, base_url: str, api_key: str, model: str, req: AIRequest, call: dict[str, Any],
     ) -> str | None:
         """调用 API，返回文本或 None（内容安全拒绝时）。其他错误正常重试。"""
-        payload = {
+        endpoint = _endpoint_key(base_url, model, req.stage)
+        payload: dict[str, Any] = {
             "model": model,
             "max_tokens": req.max_tokens,
             "messages": req.messages,
         }
+        if req.system:
+            payload["system"] = req.system
+        if endpoint in _NO_CACHE_ENDPOINTS:
+            payload = _strip_cache_control(payload)
+
+        headers = {
+            "Content-Type": "application/json",
+            "x-api-key": api_key,
+            "anthropic-version": "2023-06-01",
+        }
+
+        limiter = get_ai_limiter(base_url)
+        est_tokens = estimate_tokens(payload)
 
         backoffs = [1, 2, 4]
         last_err: Exception | None = None
 
         for attempt, backoff in enumerate(backoffs, start=1):
+            call["attempts"] = attempt
             try:
-                async with httpx.AsyncClient(timeout=req.timeout) as client:
+                async with limiter.slot(est_tokens), httpx.AsyncClient(timeout=req.timeout) as client:
+                    t0 = time.monotonic()
                     resp = await client.post(
                         f"{base_url}/v1/messages",
-                        headers={
-                            "Content-Type": "application/json",
-                            "x-api-key": api_key,
-                            "anthropic-version": "2023-06-01",
-                        },
+                        headers=headers,
                         json=payload,
                     )
+                    if resp.status_code == 429:
+                        # 限流：暂停共享令牌桶，下次重试会等到 retry-after 之后
+                        limiter.penalize(parse_retry_after(resp.headers.get("retry-after")))
+                    if (
+                        resp.status_code == 400 and "cache_control" in resp.text
+                        and _uses_cache_control(payload)
+                    ):
+                        # 端点不支持 prompt caching：去掉 cache_control 立即重发，不计入重试
+                        logger.info("端点不支持 prompt caching，去掉 cache_control 重发")
+                        _NO_CACHE_ENDPOINTS.add(endpoint)
+                        payload = _strip_cache_control(payload)
+                        resp = await client.post(
+                            f"{base_url}/v1/messages", headers=headers, json=payload,
+                        )
                     if not resp.is_success:
                         logger.error(f"API error {resp.status_code}: {resp.text[:500]}")
                         # 内容安全拒绝（Kimi "high risk"），不重试直接返回 None 触发降级
@@ -100,6 +321,8 @@ class AIClient:
                     if not text_item.get("text"):
                         raise ValueError(f"Unexpected API response: {data}")
 
+                    latency_tracker.record(endpoint, time.monotonic() - t0)
+                    self.last_usage = call["usage"] = self._parse_usage(data)
                     return text_item["text"].strip()
             except Exception as e:
                 last_err = e
@@ -112,6 +335,18 @@ class AIClient:
 
         raise last_err or RuntimeError("API error")
 
+    @staticmethod
+    def _parse_usage(data: dict[str, Any]) -> dict[str, int]:
+        """提取 token 用量（含 prompt cache 读写）"""
+        usage = data.get("usage") or {}
+        out = parse_usage(usage)
+        if usage:
+            logger.info(
+                f"AI tokens: in={out['input_tokens']} out={out['output_tokens']} "
+                f"cache_read={out['cache_read_tokens']} cache_write={out['cache_write_tokens']}"
+            )
+        return out
+
 
 def _extract_json_block(text: str) -> str:
     if "```json" in text:
@@ -121,28 +356,114 @@ def _extract_json_block(text: str) -> str:
     return text
 
 
+# JSON 修复与字段补问统计（进程内累计，供日志/监控读取）
+repair_stats: Counter = Counter()
+
+# 中文引号在字符串外当作英文引号处理
+_OPEN_QUOTES = {'"': '"', "\u201c": "\u201d", "\u201d": "\u201d"}
+_CLOSERS = {"{": "}", "[": "]"}
+_STR_SPECIAL = re.compile('["\\\\\n\r\t\u201d]')
+_STRUCT_CHARS = re.compile('["\u201c\u201d{}\\[\\],]')
+_CTRL_ESCAPE = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+_CTRL_SPACE = {"\n": " ", "\r": "", "\t": " "}
+
+
+def repair_json(raw: str, *, fix_newlines: bool = False) -> str:
+    """单遍线性修复模型输出的 JSON：
+
+    - 丢弃最外层对象/数组前后的多余文本
+    - 字符串外的中文引号当作英文引号
+    - 字符串内的裸换行/制表符转义（fix_newlines=True 时替换为空格）
+    - 删除 } / ] 前的尾逗号
+    - 输出被截断时补齐未闭合的字符串和括号
+    """
+    starts = [i for i in (raw.find("{"), raw.find("[")) if i != -1]
+    i = min(starts) if starts else 0
+    n = len(raw)
+    out: list[str] = []
+    stack: list[str] = []
+    in_str = False
+    closer = '"'
+    comma_at = -1  # 待定逗号在 out 中的位置，遇到 } / ] 时删除
+    ctrl = _CTRL_SPACE if fix_newlines else _CTRL_ESCAPE
+
+    while i < n:
+        if in_str:
+            # 字符串内容整段拷贝，只在特殊字符处停下
+            m = _STR_SPECIAL.search(raw, i)
+            if not m:
+                out.append(raw[i:])
+                i = n
+                break
+            out.append(raw[i:m.start()])
+            ch = m.group()
+            i = m.end()
+            if ch == "\\":
+                out.append(raw[m.start():i + 1])
+                i += 1
+            elif ch == '"' or ch == closer:
+                in_str = False
+                out.append('"')
+            elif ch in ctrl:
+                out.append(ctrl[ch])
+            else:
+                out.append(ch)
+            continue
+
+        # 字符串外：数字/字面量/空白整段拷贝，只在结构字符处停下
+        m = _STRUCT_CHARS.search(raw, i)
+        j = m.start() if m else n
+        if j > i:
+            chunk = raw[i:j]
+            if not chunk.isspace():
+                comma_at = -1
+            out.append(chunk)
+        if not m:
+            break
+        ch = m.group()
+        i = j + 1
+        if ch in _OPEN_QUOTES:
+            in_str, closer = True, _OPEN_QUOTES[ch]
+            comma_at = -1
+            out.append('"')
+        elif ch in _CLOSERS:
+            stack.append(_CLOSERS[ch])
+            comma_at = -1
+            out.append(ch)
+        elif ch in "}]":
+            if comma_at != -1:
+                out[comma_at] = ""
+                comma_at = -1
+            if not stack:
+                continue
+            # 括号不匹配时按栈顶补正
+            out.append(stack.pop())
+            if not stack:
+                break
+        else:
+            comma_at = len(out)
+            out.append(ch)
+
+    # 截断的输出：闭合字符串，去掉悬空的逗号/冒号，再补齐括号
+    if in_str:
+        if out and out[-1].endswith("\\") and len(out[-1]) == 1:
+            out.pop()
+        out.append('"')
+    if comma_at != -1:
+        out[comma_at] = ""
+    tail = "".join(out).rstrip()
+    if tail.endswith(":"):
+        tail += " null"
+    return tail + "".join(reversed(stack))
+
+
 def parse_json_with_repair(text: str, *, fix_newlines: bool = False) -> dict[str, Any]:
-    """Parse JSON text; repair common issues if needed."""
+    """Parse JSON text; repair common issues in a single pass if needed."""
     raw = _extract_json_block(text)
     try:
         return json.loads(raw)
     except json.JSONDecodeError as e:
         logger.warning(f"JSON 解析失败，尝试修复: {e}")
-        repaired = raw.replace("\u201c", '"').replace("\u201d", '"')
-        repaired = re.sub(r",(\s*[}\]])", r"\1", repaired)
-        if fix_newlines:
-            def _fix_newlines(m: re.Match) -> str:
-                return m.group(0).replace("\n", " ").replace("\r", "")
-            repaired = re.sub(r'"[^"]*"', _fix_newlines, repaired)
-        try:
-            return json.loads(repaired)
-        except json.JSONDecodeError as e2:
-            logger.warning(f"JSON 修复失败，尝试二次修复: {e2}")
-            # Trim to outermost JSON object and normalize whitespace
-            start = repaired.find("{")
-            end = repaired.rfind("}")
-            if start != -1 and end != -1 and end > start:
-                repaired = repaired[start:end + 1]
-            repaired = repaired.replace("\n", " ").replace("\r", " ").replace("\t", " ")
-            repaired = re.sub(r",(\s*[}\]])", r"\1", repaired)
-            return json.loads(repaired)
+    data = json.loads(repair_json(raw, fix_newlines=fix_newlines))
+    repair_stats["json_repaired"] += 1
+    return data
@@ -0,0 +1,106 @@
+"""批处理工具 - 按 token 预算切批、有界并发执行、断点续跑"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Iterable, TypeVar
+
+from loguru import logger
+
+from src.services.rate_limit import estimate_tokens
+from src.services.storage import CACHE_DIR, load_json, save_json
+
+T = TypeVar("T")
+
+CHECKPOINT_DIR = CACHE_DIR / "checkpoints"
+# 超过该时长的断点视为上一次任务的残留，不再续跑
+CHECKPOINT_MAX_AGE = 2 * 86400
+
+
+def pack_batches(
+    items: Iterable[T],
+    render: Callable[[T], str],
+    *,
+    max_prompt_tokens: int = 3000,
+    max_items: int = 40,
+) -> list[list[T]]:
+    """按渲染后的 prompt token 数切批：信息长的 ETF 批次小，信息短的批次大"""
+    batches: list[list[T]] = []
+    current: list[T] = []
+    used = 0
+    for item in items:
+        cost = estimate_tokens(render(item))
+        if current and (used + cost > max_prompt_tokens or len(current) >= max_items):
+            batches.append(current)
+            current, used = [], 0
+        current.append(item)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+class BatchCheckpoint:
+    """按条目落盘的断点：每完成一批就写入，重跑时跳过已完成的条目"""
+
+    def __init__(self, name: str, fingerprint: str = "", directory: Path = CHECKPOINT_DIR):
+        self.path = directory / f"{name}.json"
+        self.fingerprint = fingerprint
+        data = load_json(self.path, {}) or {}
+        fresh = time.time() - data.get("created_at", 0) < CHECKPOINT_MAX_AGE
+        if data.get("fingerprint") == fingerprint and fresh:
+            self.created_at = data["created_at"]
+            self.done: dict[str, Any] = data.get("done", {})
+            if self.done:
+                logger.info(f"断点续跑 {name}: 已完成 {len(self.done)} 条")
+        else:
+            self.created_at = time.time()
+            self.done = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.done
+
+    def update(self, results: dict[str, Any]):
+        self.done.update(results)
+        save_json(self.path, {
+            "fingerprint": self.fingerprint,
+            "created_at": self.created_at,
+            "done": self.done,
+        })
+
+    def clear(self):
+        """任务完整结束后删除断点"""
+        self.path.unlink(missing_ok=True)
+
+
+async def run_batches(
+    batches: list[list[T]],
+    worker: Callable[[list[T]], Awaitable[dict[str, Any]]],
+    *,
+    concurrency: int = 4,
+    checkpoint: BatchCheckpoint | None = None,
+    label: str = "批次",
+) -> dict[str, Any]:
+    """有界并发执行批次，worker 返回 {key: result}，每批完成即写断点"""
+    sem = asyncio.Semaphore(concurrency)
+    results: dict[str, Any] = {}
+    finished = 0
+
+    async def run_one(batch: list[T]):
+        nonlocal finished
+        async with sem:
+            try:
+                out = await worker(batch) or {}
+            except Exception as e:
+                logger.warning(f"{label}失败（{len(batch)}条）: {e}")
+                out = {}
+        results.update(out)
+        if checkpoint is not None and out:
+            checkpoint.update(out)
+        finished += 1
+        logger.info(f"{label}进度: {finished}/{len(batches)}")
+
+    await asyncio.gather(*(run_one(b) for b in batches))
+    return results
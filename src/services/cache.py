@@ -0,0 +1,141 @@
+"""进程内异步缓存 - LRU 容量上限 + TTL + 过期后先返回旧值再后台刷新 + 并发请求合并
+
+    cache = AsyncTTLCache("kline", maxsize=512, ttl=300, stale_ttl=3600)
+    data = await cache.get(key, lambda: fetch(...))
+
+- 新鲜（未过 ttl）：直接返回（hit）
+- 过期但未超过 ttl + stale_ttl：返回旧值，后台刷新一次（stale）
+- 同一 key 已有加载在进行：等待同一个加载结果，不再另发请求（coalesced）
+- 其余：加载并缓存（miss）；加载异常不缓存，所有等待者都收到该异常
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Generic, Hashable, TypeVar
+
+from loguru import logger
+
+T = TypeVar("T")
+
+# 全部实例（按名称），便于统一输出命中统计
+_registry: dict[str, "AsyncTTLCache"] = {}
+
+
+class AsyncTTLCache(Generic[T]):
+    def __init__(
+        self,
+        name: str,
+        *,
+        maxsize: int = 256,
+        ttl: float = 300,
+        stale_ttl: float = 0,
+        cache_if: Callable[[T], bool] | None = None,
+    ):
+        """cache_if: 返回 False 的结果不缓存（如空列表）"""
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.cache_if = cache_if
+        # {key: (写入时间, 值)}，按最近使用排序
+        self._data: OrderedDict[Hashable, tuple[float, T]] = OrderedDict()
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        # 后台刷新任务的强引用（事件循环只持有弱引用）
+        self._background: set[asyncio.Task] = set()
+        self.counters = dict.fromkeys(("hits", "misses", "stale", "coalesced", "evictions", "errors"), 0)
+        _registry[name] = self
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[T]]) -> T:
+        now = time.monotonic()
+        entry = self._data.get(key)
+        if entry is not None:
+            age = now - entry[0]
+            if age < self.ttl:
+                self._data.move_to_end(key)
+                self.counters["hits"] += 1
+                return entry[1]
+            if age < self.ttl + self.stale_ttl:
+                self._data.move_to_end(key)
+                self.counters["stale"] += 1
+                if key not in self._inflight:
+                    task = self._start(key, loader)
+                    self._background.add(task)
+                    task.add_done_callback(self._refresh_done)
+                return entry[1]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.counters["coalesced"] += 1
+        else:
+            self.counters["misses"] += 1
+            task = self._start(key, loader)
+        # 加载在独立任务中进行，某个调用方被取消不影响其他等待者
+        return await asyncio.shield(task)
+
+    def _start(self, key: Hashable, loader: Callable[[], Awaitable[T]]) -> asyncio.Task:
+        async def run() -> T:
+            try:
+                value = await loader()
+            except Exception:
+                self.counters["errors"] += 1
+                raise
+            finally:
+                self._inflight.pop(key, None)
+            self.set(key, value)
+            return value
+
+        task = asyncio.create_task(run())
+        self._inflight[key] = task
+        return task
+
+    def _refresh_done(self, task: asyncio.Task):
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"缓存 {self.name} 后台刷新失败: {task.exception()}")
+
+    def set(self, key: Hashable, value: T):
+        if self.cache_if is not None and not self.cache_if(value):
+            return
+        self._data[key] = (time.monotonic(), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def invalidate(self, key: Hashable | None = None):
+        """清除某个 key，不传则全部清除"""
+        if key is None:
+            self._data.clear()
+        else:
+            self._data.pop(key, None)
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.counters["hits"] + self.counters["stale"] + self.counters["misses"] + self.counters["coalesced"]
+        served = self.counters["hits"] + self.counters["stale"] + self.counters["coalesced"]
+        return {
+            **self.counters,
+            "size": len(self._data),
+            "hit_rate": round(served / lookups, 3) if lookups else 0.0,
+        }
+
+
+def cache_stats() -> dict[str, dict[str, Any]]:
+    """全部缓存的统计 {名称: stats}"""
+    return {name: cache.stats() for name, cache in _registry.items()}
+
+
+def log_cache_stats():
+    lines = [
+        f"  {name}: 命中 {s['hits']} / 旧值 {s['stale']} / 合并 {s['coalesced']} / 未命中 {s['misses']}"
+        f"（命中率 {s['hit_rate']:.0%}，{s['size']} 条，淘汰 {s['evictions']}）"
+        for name, s in cache_stats().items()
+        if s["hits"] + s["stale"] + s["coalesced"] + s["misses"]
+    ]
+    if lines:
+        logger.info("🗃️ 缓存统计:\n" + "\n".join(lines))
@@ -0,0 +1,138 @@
+"""磁盘 KV 缓存 - 跨进程 / 跨 CI 运行共享（SQLite WAL）
+
+单个文件 CACHE_DIR/kv.sqlite3，按 (namespace, key) 存 JSON 值和过期时间。
+WAL 模式下多个进程可以同时读、串行写（busy_timeout 内自动等待）；
+进程退出时做一次 checkpoint，把 WAL 合并回主文件，CI 缓存目录里只剩一个 .sqlite3。
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from loguru import logger
+
+from src.services.storage import CACHE_DIR
+
+DISK_CACHE_FILE = CACHE_DIR / "kv.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    ns TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (ns, key)
+) WITHOUT ROWID
+"""
+
+
+class DiskCache:
+    """带过期时间的 SQLite KV；连接延迟到第一次使用时建立，打开失败时所有操作退化为未命中"""
+
+    def __init__(self, path: Path = DISK_CACHE_FILE):
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._broken = False
+
+    def _connect(self) -> sqlite3.Connection | None:
+        if self._conn is not None or self._broken:
+            return self._conn
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(_SCHEMA)
+        except sqlite3.Error as e:
+            logger.warning(f"磁盘缓存 {self.path.name} 不可用: {e}")
+            self._broken = True
+            return None
+        self._conn = conn
+        atexit.register(self.close)
+        return conn
+
+    def get(self, ns: str, key: str, default: Any = None) -> Any:
+        return self.get_many(ns, [key]).get(key, default)
+
+    def get_many(self, ns: str, keys: list[str]) -> dict[str, Any]:
+        """未过期的条目 {key: value}"""
+        if not keys:
+            return {}
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return {}
+            out: dict[str, Any] = {}
+            now = time.time()
+            # SQLite 单条语句的参数上限
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT key, value FROM kv WHERE ns = ? AND key IN ({','.join('?' * len(chunk))})"
+                    " AND (expires_at IS NULL OR expires_at > ?)",
+                    (ns, *chunk, now),
+                ).fetchall()
+                out.update((k, json.loads(v)) for k, v in rows)
+            return out
+
+    def set(self, ns: str, key: str, value: Any, ttl: float | None = None):
+        self.set_many(ns, {key: value}, ttl)
+
+    def set_many(self, ns: str, items: dict[str, Any], ttl: float | None = None):
+        """写入多条（同一事务）；ttl 为 None 时不过期"""
+        if not items:
+            return
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        rows = [(ns, k, json.dumps(v, ensure_ascii=False), expires_at, now) for k, v in items.items()]
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany("INSERT OR REPLACE INTO kv VALUES (?, ?, ?, ?, ?)", rows)
+
+    def delete(self, ns: str, key: str | None = None):
+        """删除一条，不传 key 时删除整个 namespace"""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            if key is None:
+                conn.execute("DELETE FROM kv WHERE ns = ?", (ns,))
+            else:
+                conn.execute("DELETE FROM kv WHERE ns = ? AND key = ?", (ns, key))
+
+    def purge(self) -> int:
+        """清理过期条目，返回删除条数"""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return 0
+            return conn.execute(
+                "DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+            ).rowcount
+
+    def close(self):
+        with self._lock:
+            if self._conn is None:
+                return
+            try:
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                self._conn.close()
+            except sqlite3.Error as e:
+                logger.warning(f"关闭磁盘缓存失败: {e}")
+            self._conn = None
+
+
+# 进程内共享
+disk_cache = DiskCache()
@@ -0,0 +1,87 @@
+"""ETF 分类缓存 - 按 name/scope/risk 内容哈希复用 AI 分类、描述和别名
+
+月度重建时绝大多数 ETF 的名称、投资范围、风险特征都不变，命中缓存的直接复用，
+只有新上市或信息变化的 ETF 才交给 AI。
+
+各产出方（FundService.build_etf_master / update_etf_master / refresh_etf_desc）的提示词、
+板块体系和描述长度不同，按 namespace 各用一个缓存文件，互不复用。
+"""
+
+from __future__ import annotations
+
+import hashlib
+from pathlib import Path
+from typing import Iterable
+
+from loguru import logger
+
+from src.services.storage import CACHE_DIR, load_json, save_json
+
+# 缓存的 AI 产出字段
+CACHED_FIELDS = ("sector", "related", "desc", "tags")
+
+
+def content_hash(info: dict) -> str:
+    """ETF 内容指纹；scope/risk 按 etf_master.json 的保存长度截断，便于从现有 master 预热"""
+    text = "\n".join([
+        info.get("name", ""),
+        (info.get("scope") or "")[:200],
+        (info.get("risk") or "")[:100],
+    ])
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+class EtfClassifyCache:
+    """ETF 代码 → {hash, sector, related, desc, tags}，每个 namespace 一个文件"""
+
+    def __init__(self, namespace: str, path: Path | None = None):
+        self.namespace = namespace
+        self.path = path or CACHE_DIR / f"etf_classify_{namespace}.json"
+        self._entries: dict[str, dict] = load_json(self.path, {}) or {}
+        self.reused = 0
+        self.recomputed = 0
+
+    def seed_from_master(self, etfs: dict[str, dict]):
+        """用现有 etf_master.json 预热（只补缓存里没有的 ETF）"""
+        seeded = 0
+        for code, info in etfs.items():
+            if code in self._entries or not info.get("sector") or not info.get("desc"):
+                continue
+            entry = {"hash": content_hash(info)}
+            entry.update({f: info[f] for f in CACHED_FIELDS if f in info})
+            self._entries[code] = entry
+            seeded += 1
+        if seeded:
+            logger.info(f"从 etf_master 预热分类缓存: {seeded} 个")
+
+    def lookup(self, info: dict, fields: Iterable[str] = CACHED_FIELDS) -> dict | None:
+        """内容未变且所需字段齐全时返回缓存结果"""
+        entry = self._entries.get(info.get("code", ""))
+        if not entry or entry.get("hash") != content_hash(info):
+            return None
+        if any(f not in entry for f in fields):
+            return None
+        self.reused += 1
+        return {f: entry[f] for f in CACHED_FIELDS if f in entry}
+
+    def store(self, info: dict, result: dict):
+        """写入 AI 结果；同一内容指纹下与已有字段合并（如只刷新 desc/tags）"""
+        code = info.get("code", "")
+        if not code or not isinstance(result, dict):
+            return
+        h = content_hash(info)
+        entry = self._entries.get(code)
+        if not entry or entry.get("hash") != h:
+            entry = {"hash": h}
+        entry.update({f: result[f] for f in CACHED_FIELDS if f in result})
+        self._entries[code] = entry
+        self.recomputed += 1
+
+    def save(self):
+        try:
+            save_json(self.path, self._entries)
+        except Exception as e:
+            logger.warning(f"保存ETF分类缓存失败: {e}")
+
+    def report(self, label: str = "ETF分类"):
+        logger.info(f"{label}缓存: 复用 {self.reused} 个，重新计算 {self.recomputed} 个")
@@ -0,0 +1,173 @@
+"""ETF 列表/详情抓取 - 新浪列表并发分页 + 东方财富基金概况持久缓存
+
+基金全称、管理人、投资范围等基本信息几乎不变，抓取结果长期缓存，
+每次只抓新上市或超过 TTL 的 ETF。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import re
+import time
+from datetime import datetime
+
+import httpx
+from loguru import logger
+
+from src.services.host_limit import host_limiter
+from src.services.storage import CACHE_DIR, load_json, save_json
+
+SINA_NODE_URL = "https://vip.stock.finance.sina.com.cn/quotes_service/api/json_v2.php/Market_Center.getHQNodeData"
+SINA_PAGE_SIZE = 100
+JBGK_URL = "https://fundf10.eastmoney.com/jbgk_{code}.html"
+
+DETAIL_STORE_FILE = CACHE_DIR / "etf_detail.json"
+DETAIL_TTL_DAYS = 90
+
+_JBGK_PATTERNS = {
+    "full_name": (re.compile(r'基金全称</th><td[^>]*>([^<]+)'), 0),
+    "short_name": (re.compile(r'基金简称</th><td[^>]*>([^<]+)'), 0),
+    "manager": (re.compile(r'基金管理人</th><td[^>]*><a[^>]*>([^<]+)'), 0),
+    "establish_date": (re.compile(r'成立日期/规模</th><td[^>]*>(\d{4}年\d{2}月\d{2}日)'), 0),
+    "scope": (re.compile(r'投资范围</label>.*?<p>\s*(.+?)\s*</p>', re.DOTALL), 500),
+    "risk": (re.compile(r'风险收益特征</label>.*?<p>\s*(.+?)\s*</p>', re.DOTALL), 300),
+}
+
+
+async def fetch_sina_etf_pages(client: httpx.AsyncClient, max_pages: int = 15) -> list[dict]:
+    """并发拉取新浪 ETF 行情列表（按成交额降序），返回按 code 去重的原始条目
+
+    并发受域名自适应上限约束；单页失败只丢该页，不影响其他页。
+    """
+
+    async def fetch_page(page: int) -> list[dict] | None:
+        """单页条目；请求或解析失败返回 None（与空页/末页区分）"""
+        try:
+            async with host_limiter.slot(SINA_NODE_URL) as slot:
+                resp = await client.get(
+                    SINA_NODE_URL,
+                    params={
+                        "page": page, "num": SINA_PAGE_SIZE,
+                        "sort": "amount", "asc": 0,
+                        "node": "etf_hq_fund",
+                    },
+                    headers={"Referer": "https://finance.sina.com.cn"},
+                )
+                slot.observe(resp)
+                resp.raise_for_status()
+                # 超出末页时新浪返回 null/空数组，属正常结果
+                return resp.json() or []
+        except Exception as e:
+            logger.warning(f"新浪 ETF 列表第 {page} 页失败: {e}")
+            return None
+
+    pages = await asyncio.gather(*(fetch_page(p) for p in range(1, max_pages + 1)))
+    # 按页序拼接，遇到空页/不满页即为末页；失败的页跳过
+    # 翻页期间成交额排序会变，相邻页可能重复同一只 ETF，按 code 去重
+    items, seen = [], set()
+    failed = 0
+    for data in pages:
+        if data is None:
+            failed += 1
+            continue
+        for item in data:
+            code = item.get("code")
+            if code and code not in seen:
+                seen.add(code)
+                items.append(item)
+        if len(data) < SINA_PAGE_SIZE:
+            break
+    if failed:
+        logger.warning(f"新浪 ETF 列表 {failed} 页失败，获取到 {len(items)} 个")
+    return items
+
+
+def parse_jbgk(text: str) -> dict:
+    """解析东方财富基金概况页（jbgk_{code}.html）"""
+    info = {}
+    for field, (pattern, limit) in _JBGK_PATTERNS.items():
+        m = pattern.search(text)
+        if m:
+            value = m.group(1).strip()
+            info[field] = value[:limit] if limit else value
+    return info
+
+
+async def fetch_jbgk(client: httpx.AsyncClient, code: str) -> dict:
+    """抓取单个 ETF 的基金概况（并发受域名自适应上限约束），失败返回空字典"""
+    url = JBGK_URL.format(code=code)
+    try:
+        async with host_limiter.slot(url) as slot:
+            resp = await client.get(url, timeout=10)
+            slot.observe(resp)
+            info = parse_jbgk(resp.text)
+            if not info:
+                slot.fail()  # 限流时返回的验证页/空页解析不出字段
+        return info
+    except Exception as e:
+        logger.warning(f"获取 {code} 详情失败: {e}")
+        return {}
+
+
+class EtfDetailStore:
+    """ETF 代码 → 基金概况（带抓取时间），超过 TTL 才重新抓取"""
+
+    def __init__(self, path=DETAIL_STORE_FILE, ttl_days: float = DETAIL_TTL_DAYS):
+        self.path = path
+        self.ttl = ttl_days * 86400
+        self._entries: dict[str, dict] = load_json(path, {}) or {}
+
+    def seed_from_master(self, etfs: dict[str, dict], updated_at: str = ""):
+        """缓存丢失时用 etf_master.json 预热，抓取时间取 detail_date（没有则取 master 更新时间）"""
+        seeded = 0
+        for code, info in etfs.items():
+            if code in self._entries or not info.get("scope"):
+                continue
+            fetched_at = _parse_ts(info.get("detail_date") or updated_at)
+            if not fetched_at:
+                continue
+            detail = {k: info[k] for k in _JBGK_PATTERNS if info.get(k)}
+            self._entries[code] = {"fetched_at": fetched_at, "info": detail}
+            seeded += 1
+        if seeded:
+            logger.info(f"从 etf_master 预热详情缓存: {seeded} 个")
+
+    def is_fresh(self, code: str, now: float | None = None) -> bool:
+        entry = self._entries.get(code)
+        return bool(entry) and (now or time.time()) - entry.get("fetched_at", 0) < self.ttl
+
+    def fetched_date(self, code: str) -> str:
+        entry = self._entries.get(code)
+        return datetime.fromtimestamp(entry["fetched_at"]).strftime("%Y-%m-%d") if entry else ""
+
+    async def get_many(self, client: httpx.AsyncClient, codes: list[str]) -> dict[str, dict]:
+        """返回 {code: 基金概况}，只抓缺失或过期的；抓取失败的沿用旧数据"""
+        now = time.time()
+        stale = [c for c in codes if not self.is_fresh(c, now)]
+        logger.info(f"ETF 详情: 缓存命中 {len(codes) - len(stale)} 个，需抓取 {len(stale)} 个")
+
+        if stale:
+            async def fetch(code: str):
+                info = await fetch_jbgk(client, code)
+                if info:
+                    self._entries[code] = {"fetched_at": time.time(), "info": info}
+
+            await asyncio.gather(*(fetch(c) for c in stale))
+            self.save()
+
+        return {c: dict(self._entries[c]["info"]) for c in codes if c in self._entries}
+
+    def save(self):
+        try:
+            save_json(self.path, self._entries)
+        except Exception as e:
+            logger.warning(f"保存ETF详情缓存失败: {e}")
+
+
+def _parse_ts(value: str) -> float:
+    for fmt in ("%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt).timestamp()
+        except (TypeError, ValueError):
+            continue
+    return 0.0
@@ -2,13 +2,29 @@
 
 import asyncio
 import json
-import re
-import time
+from datetime import date
 import httpx
+import numpy as np
 from loguru import logger
 from typing import Optional
 
+from src.config import settings
 from src.services.ai_client import AIClient, AIRequest, parse_json_with_repair
+from src.services.batch_runner import BatchCheckpoint, pack_batches, run_batches
+from src.services.cache import AsyncTTLCache
+from src.services.disk_cache import disk_cache
+from src.services.etf_cache import EtfClassifyCache
+from src.services.etf_scraper import EtfDetailStore, fetch_sina_etf_pages
+from src.services.kline_store import CLOSE, code_to_secid, format_date, kline_store
+from src.services.market_hours import quiet_ttl
+from src.services.market_stats import batch_stats
+from src.services.quotes import fetch_quotes
+
+# 实时行情在交易时段内的磁盘缓存秒数
+QUOTE_TTL = 60
+# 构建 ETF Master 时K线按批写断点；实际请求并发由域名并发上限控制
+KLINE_BATCH_SIZE = 20
+KLINE_CONCURRENCY = 4
 
 # 排除的 ETF 类型（宽基指数、债券、货币、跨境等）
 EXCLUDE_KEYWORDS = [
@@ -31,16 +47,14 @@ class FundService:
             "Accept": "application/json, text/plain, */*",
             "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
         }
-        # K线缓存: {secid: (timestamp, data)}
-        self._kline_cache: dict[str, tuple[float, dict]] = {}
-        self._cache_ttl = 300  # 5分钟
-        # K线(含日期)缓存: {secid: (timestamp, data)}
-        self._kline_date_cache: dict[str, tuple[float, list[tuple[str, float]]]] = {}
-        self._kline_date_cache_ttl = 3600  # 1小时
-        # ETF列表缓存: {sector: [(code, name, amount), ...]}
-        self._etf_list_cache: dict[str, list] = {}
-        self._etf_cache_time: float = 0
-        self._etf_cache_ttl = 86400  # 24小时
+        # 板块->ETF映射缓存（24小时）
+        self._sector_map_cache = AsyncTTLCache(
+            "sector_etf_map", maxsize=1, ttl=86400, stale_ttl=86400, cache_if=bool,
+        )
+        # K线数组缓存: {(secid, limit): (dates, closes)}，5分钟内直接复用，1小时内先返回旧值再后台刷新
+        self._kline_cache = AsyncTTLCache(
+            "kline", maxsize=1024, ttl=300, stale_ttl=3600, cache_if=lambda v: len(v[0]) > 0,
+        )
 
     async def _fetch_all_etfs(self) -> list[dict]:
         """获取所有 ETF 列表（新浪为主，东方财富为备）"""
@@ -53,35 +67,19 @@ class FundService:
         return await self._fetch_etfs_from_eastmoney()
 
     async def _fetch_etfs_from_sina(self) -> list[dict]:
-        """从新浪财经获取 ETF 列表"""
+        """从新浪财经获取 ETF 列表（分页并发）"""
         all_etfs = []
         try:
             async with httpx.AsyncClient(timeout=self.timeout) as client:
-                for page in range(1, 16):
-                    resp = await client.get(
-                        "https://vip.stock.finance.sina.com.cn/quotes_service/api/json_v2.php/Market_Center.getHQNodeData",
-                        params={
-                            "page": page,
-                            "num": 100,
-                            "sort": "amount",
-                            "asc": 0,
-                            "node": "etf_hq_fund",
-                        },
-                        headers={"Referer": "https://finance.sina.com.cn"},
-                    )
-                    data = resp.json()
-                    if not data:
-                        break
-                    for item in data:
-                        code = item.get("code", "")
-                        if code:
-                            all_etfs.append({
-                                "code": code,
-                                "name": item.get("name", ""),
-                                "amount": item.get("amount", 0),
-                            })
-                    if len(data) < 100:
-                        break
+                items = await fetch_sina_etf_pages(client)
+            for item in items:
+                code = item.get("code", "")
+                if code:
+                    all_etfs.append({
+                        "code": code,
+                        "name": item.get("name", ""),
+                        "amount": item.get("amount", 0),
+                    })
             logger.info(f"新浪API获取到 {len(all_etfs)} 个ETF")
             return all_etfs
         except Exception as e:
@@ -128,71 +126,6 @@ class FundService:
                 all_etfs = []
         return all_etfs
 
-    async def _fetch_etf_raw_info(self, client: httpx.AsyncClient, code: str) -> dict:
-        """获取 ETF 原始信息"""
-        try:
-            url = f"https://fundf10.eastmoney.com/jbgk_{code}.html"
-            resp = await client.get(url, timeout=10)
-            text = resp.text
-
-            info = {}
-            # 基金全称
-            m = re.search(r'基金全称</th><td[^>]*>([^<]+)', text)
-            if m:
-                info["full_name"] = m.group(1).strip()
-            # 基金简称
-            m = re.search(r'基金简称</th><td[^>]*>([^<]+)', text)
-            if m:
-                info["short_name"] = m.group(1).strip()
-            # 基金管理人
-            m = re.search(r'基金管理人</th><td[^>]*><a[^>]*>([^<]+)', text)
-            if m:
-                info["manager"] = m.group(1).strip()
-            # 投资范围
-            m = re.search(r'投资范围</label>.*?<p>\s*(.+?)\s*</p>', text, re.DOTALL)
-            if m:
-                info["scope"] = m.group(1).strip()
-            # 风险收益特征
-            m = re.search(r'风险收益特征</label>.*?<p>\s*(.+?)\s*</p>', text, re.DOTALL)
-            if m:
-                info["risk"] = m.group(1).strip()
-            return info
-        except Exception:
-            pass
-        return {}
-
-    async def _summarize_etf_desc(self, client: httpx.AsyncClient, etf_infos: list[dict]) -> dict[str, str]:
-        """用 AI 批量精炼 ETF 描述"""
-        if not etf_infos:
-            return {}
-
-        etf_list = "\n".join([
-            f"- {info['code']}: 全称={info.get('full_name','')}, "
-            f"简称={info.get('short_name','')}, "
-            f"管理人={info.get('manager','')}, "
-            f"投资范围={info.get('scope','')[:200] if info.get('scope') else ''}, "
-            f"风险特征={info.get('risk','')[:150] if info.get('risk') else ''}"
-            for info in etf_infos
-        ])
-
-        prompt = f"""为以下ETF生成简洁描述（每个30-50字），突出投资标的和风险特征。
-
-{etf_list}
-
-        输出JSON格式：{{"代码": "描述", ...}}"""
-
-        try:
-            ai_client = AIClient()
-            text = await ai_client.send(AIRequest(
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=2048,
-                timeout=60,
-            ))
-            return parse_json_with_repair(text)
-        except Exception as e:
-            logger.warning(f"AI精炼描述失败: {e}")
-            return {}
-
     def _should_exclude_etf(self, name: str) -> bool:
         """检查是否应排除该 ETF（宽基、债券、跨境等）"""
         for kw in EXCLUDE_KEYWORDS:
@@ -200,18 +133,25 @@ class FundService:
                 return True
         return False
 
-    async def _ai_classify_etfs(self, client: httpx.AsyncClient, etf_infos: list[dict]) -> dict[str, dict]:
-        """用 AI 批量分类 ETF 到板块"""
+    @staticmethod
+    def _render_etf_info(info: dict) -> str:
+        """渲染单个 ETF 的 prompt 行（分类+描述共用）"""
+        return (
+            f"- {info['code']} {info.get('name','')}: "
+            f"管理人={info.get('manager','')}, "
+            f"投资范围={(info.get('scope') or '')[:150]}, "
+            f"风险特征={(info.get('risk') or '')[:100]}"
+        )
+
+    async def _ai_classify_etfs(self, etf_infos: list[dict]) -> dict[str, dict]:
+        """用 AI 批量分类 ETF 到板块，并在同一次调用中生成描述"""
         if not etf_infos:
             return {}
 
         # 构建 ETF 信息列表
-        etf_list = "\n".join([
-            f"- {info['code']} {info.get('name','')}: {info.get('scope','')[:150]}"
-            for info in etf_infos
-        ])
+        etf_list = "\n".join(self._render_etf_info(info) for info in etf_infos)
 
-        prompt = f"""对以下ETF进行行业板块分类。
+        prompt = f"""对以下ETF进行行业板块分类，并生成简洁描述。
 
 ## ETF列表
 {etf_list}
@@ -225,11 +165,14 @@ class FundService:
    - 货币/策略：货币基金、红利、策略、期货
    - 跨境：纳斯达克、标普、日经、巴西、沙特、海外、中概
 
+## 描述要求
+- desc: 30-50字，突出投资标的和风险特征
+
 ## 输出JSON
 ```json
 {{
   "分类结果": {{
-    "ETF代码": {{"sector": "行业板块或排除", "related": ["相关板块"]}},
+    "ETF代码": {{"sector": "行业板块或排除", "related": ["相关板块"], "desc": "描述"}},
     ...
   }},
   "板块列表": ["黄金", "有色", ...]
@@ -242,8 +185,9 @@ class FundService:
             ai_client = AIClient()
             text = await ai_client.send(AIRequest(
                 messages=[{"role": "user", "content": prompt}],
-                max_tokens=4096,
+                max_tokens=6144,
                 timeout=120,
+                stage="etf_classify",
             ))
             return parse_json_with_repair(text)
         except Exception as e:
@@ -252,10 +196,9 @@ class FundService:
 
     async def get_sector_etf_map(self) -> dict[str, list[tuple[str, str]]]:
         """读取板块->ETF映射（从 etf_master.json）"""
-        now = time.time()
-        if self._etf_list_cache and now - self._etf_cache_time < self._etf_cache_ttl:
-            return self._etf_list_cache
+        return await self._sector_map_cache.get("etf_master", self._load_sector_etf_map)
 
+    async def _load_sector_etf_map(self) -> dict[str, list[tuple[str, str]]]:
         from pathlib import Path
 
         # 读取 etf_master.json
@@ -274,14 +217,12 @@ class FundService:
                         if code in etfs
                     ]
 
-                self._etf_list_cache = sector_map
-                self._etf_cache_time = now
                 logger.info(f"从 etf_master.json 加载，共 {len(sector_map)} 个板块")
                 return sector_map
             except Exception as e:
                 logger.warning(f"读取 etf_master.json 失败: {e}")
 
-        return self._etf_list_cache or {}
+        return {}
 
     async def build_etf_master(self, min_amount_yi: float = 0.5) -> dict:
         """构建 ETF Master 数据
@@ -291,7 +232,7 @@ class FundService:
         2. 按成交额排序，筛选日成交额 > min_amount_yi 亿的，排除宽基/债券
         3. 爬取 ETF 详细介绍（投资范围）
         4. AI 批量分类到板块 + 精炼描述
-        5. 获取 K 线数据
+        5. 并发获取 K 线数据（断点续跑）
         """
         # Step 1: 获取全量 ETF
         etfs = await self._fetch_all_etfs()
@@ -345,55 +286,79 @@ class FundService:
                 "desc": "",
             }
 
-        # Step 3: 获取详细信息
+        # Step 3: 获取详细信息（持久缓存，只抓新上市或过期的）
         logger.info(f"获取 {len(result_etfs)} 个ETF详情...")
+        detail_store = EtfDetailStore()
         async with httpx.AsyncClient(headers=self.headers, timeout=30) as client:
-            sem = asyncio.Semaphore(5)
-
-            # 获取基金详情
-            async def fetch_info(code):
-                async with sem:
-                    info = await self._fetch_etf_raw_info(client, code)
-                    info["code"] = code
-                    info["name"] = result_etfs[code]["name"]
-                    return info
-
-            tasks = [fetch_info(code) for code in result_etfs.keys()]
-            raw_infos = await asyncio.gather(*tasks, return_exceptions=True)
-            raw_infos = [r for r in raw_infos if isinstance(r, dict) and r.get("code")]
-
-            # Step 4: AI 批量分类 + 精炼描述
-            logger.info(f"AI分类+精炼（{len(raw_infos)}个）...")
-            all_sectors = set()
-            for i in range(0, len(raw_infos), 30):
-                batch = raw_infos[i:i+30]
-                # AI 分类
-                classify_result = await self._ai_classify_etfs(client, batch)
+            details = await detail_store.get_many(client, list(result_etfs.keys()))
+            raw_infos = [
+                {**details.get(code, {}), "code": code, "name": etf["name"]}
+                for code, etf in result_etfs.items()
+            ]
+
+            # Step 4: AI 批量分类 + 精炼描述（内容未变的复用缓存；其余按 token 预算切批，并发执行，断点续跑）
+            cache = EtfClassifyCache("build_etf_master")
+            classified = {}
+            for info in raw_infos:
+                hit = cache.lookup(info, ("sector", "related", "desc"))
+                if hit:
+                    classified[info["code"]] = hit
+
+            checkpoint = BatchCheckpoint("build_etf_master", fingerprint=settings.claude_model)
+            pending = [
+                info for info in raw_infos
+                if info["code"] not in classified and info["code"] not in checkpoint
+            ]
+            batches = pack_batches(pending, self._render_etf_info)
+            logger.info(f"AI分类+精炼（{len(pending)}/{len(raw_infos)}个，{len(batches)}批）...")
+
+            async def classify(batch: list[dict]) -> dict:
+                classify_result = await self._ai_classify_etfs(batch)
                 classifications = classify_result.get("分类结果", {})
-                batch_sectors = classify_result.get("板块列表", [])
-                all_sectors.update(batch_sectors)
-
-                for code, info in classifications.items():
-                    if code in result_etfs:
-                        sector = info.get("sector", "其他")
-                        # "排除"类归入"其他"
-                        if sector == "排除":
-                            sector = "其他"
-                        result_etfs[code]["sector"] = sector
-                        result_etfs[code]["related"] = info.get("related", [])
-
-                # AI 精炼描述
-                descs = await self._summarize_etf_desc(client, batch)
-                for code, desc in descs.items():
-                    if code in result_etfs:
-                        result_etfs[code]["desc"] = desc
-
-            # Step 5: 获取K线数据
-            logger.info("获取K线数据...")
-            for code in result_etfs.keys():
-                secid = f"1.{code}" if code.startswith("5") else f"0.{code}"
-                kline_data = await self._get_kline_changes(client, secid)
-                if kline_data:
+                batch_codes = {info["code"] for info in batch}
+                return {c: v for c, v in classifications.items() if c in batch_codes and isinstance(v, dict)}
+
+            await run_batches(
+                batches, classify,
+                concurrency=settings.ai_max_concurrency, checkpoint=checkpoint, label="AI分类",
+            )
+
+            raw_by_code = {info["code"]: info for info in raw_infos}
+            for code, result in checkpoint.done.items():
+                if code in raw_by_code and code not in classified:
+                    cache.store(raw_by_code[code], result)
+                    classified[code] = result
+            cache.save()
+            cache.report()
+
+            for code, info in classified.items():
+                if code in result_etfs:
+                    sector = info.get("sector", "其他")
+                    # "排除"类归入"其他"
+                    if sector == "排除":
+                        sector = "其他"
+                    result_etfs[code]["sector"] = sector
+                    result_etfs[code]["related"] = info.get("related", [])
+                    result_etfs[code]["desc"] = info.get("desc", "")
+
+            # Step 5: 获取K线数据（有界并发，按域名限流；每批完成写断点，中断后从未完成的代码续跑）
+            kline_checkpoint = BatchCheckpoint("build_etf_master_kline", fingerprint=date.today().isoformat())
+            kline_pending = [code for code in result_etfs if code not in kline_checkpoint]
+            logger.info(f"获取K线数据（{len(kline_pending)}/{len(result_etfs)}个）...")
+
+            async def fetch_klines(batch: list[str]) -> dict:
+                changes = await asyncio.gather(
+                    *(self._get_kline_changes(client, code_to_secid(code)) for code in batch)
+                )
+                return {code: data for code, data in zip(batch, changes) if data}
+
+            await run_batches(
+                [kline_pending[i:i + KLINE_BATCH_SIZE] for i in range(0, len(kline_pending), KLINE_BATCH_SIZE)],
+                fetch_klines,
+                concurrency=KLINE_CONCURRENCY, checkpoint=kline_checkpoint, label="K线",
+            )
+            for code, kline_data in kline_checkpoint.done.items():
+                if code in result_etfs:
                     result_etfs[code]["change_5d"] = kline_data.get("change_5d", 0)
                     result_etfs[code]["change_20d"] = kline_data.get("change_20d", 0)
                     result_etfs[code]["kline"] = kline_data.get("kline", [])
@@ -460,6 +425,8 @@ class FundService:
 
         sector_list = sorted(result_sectors.keys())
         logger.info(f"最终板块列表: {sector_list}")
+        checkpoint.clear()
+        kline_checkpoint.clear()
 
         return {"etfs": result_etfs, "sectors": result_sectors, "sector_list": sector_list}
 
@@ -552,148 +519,29 @@ class FundService:
         else:
             return "冷清"
 
-    async def _fetch_batch_with_retry(self, client, secids: list, max_retries: int = 3) -> list:
-        """带重试的批量获取，失败时回退到单个查询"""
-        for attempt in range(max_retries):
-            try:
-                if attempt > 0:
-                    await asyncio.sleep(1 * attempt)  # 递增延迟
-                resp = await client.get(
-                    "https://push2.eastmoney.com/api/qt/ulist.np/get",
-                    params={
-                        "secids": ",".join(secids),
-                        "fields": "f12,f14,f2,f3,f6,f8,f62,f184",
-                    },
-                )
-                text = resp.text
-                if not text or text.strip() == "":
-                    logger.warning(f"批量API返回空响应，重试 {attempt + 1}/{max_retries}")
-                    continue
-                data = resp.json().get("data", {})
-                diff = data.get("diff", [])
-                if diff:
-                    return diff
-                logger.warning(f"批量API返回空数据，重试 {attempt + 1}/{max_retries}")
-            except Exception as e:
-                logger.warning(f"批量API请求失败: {e}，重试 {attempt + 1}/{max_retries}")
-
-        # 批量失败，回退到新浪API
-        logger.info("东方财富API失败，回退到新浪财经API")
-        return await self._fetch_from_sina(client, secids)
-
-    async def _fetch_from_sina(self, client, secids: list) -> list:
-        """使用新浪财经API作为回退方案"""
-        # 转换 secid 为新浪格式: 1.518880 -> sh518880, 0.159915 -> sz159915
-        sina_codes = []
-        for secid in secids:
-            market, code = secid.split(".")
-            prefix = "sh" if market == "1" else "sz"
-            sina_codes.append(f"{prefix}{code}")
-
-        try:
-            resp = await client.get(
-                f"https://hq.sinajs.cn/list={','.join(sina_codes)}",
-                headers={"Referer": "https://finance.sina.com.cn"},
-            )
-            text = resp.text
-            results = []
-            for line in text.strip().split("\n"):
-                if "=" not in line or '""' in line:
-                    continue
-                # 解析: var hq_str_sh518880="黄金ETF,10.883,..."
-                var_part, data_part = line.split("=", 1)
-                code = var_part.split("_")[-1][2:]  # 去掉 sh/sz 前缀
-                data = data_part.strip('"').strip(";").split(",")
-                if len(data) < 10:
-                    continue
-                results.append({
-                    "f12": code,
-                    "f14": data[0],  # 名称
-                    "f2": int(float(data[3]) * 1000),  # 当前价 * 1000
-                    "f3": int((float(data[3]) - float(data[2])) / float(data[2]) * 10000) if float(data[2]) else 0,  # 涨跌幅 * 100
-                    "f6": int(float(data[9])),  # 成交额
-                    "f8": 0,  # 换手率（新浪无此数据）
-                    "f62": 0,  # 主力流入（新浪无此数据）
-                    "f184": 0,  # 主力占比（新浪无此数据）
-                    "_from_sina": True,  # 标记来自新浪，需要单独获取K线
-                })
-            return results
-        except Exception as e:
-            logger.warning(f"新浪API也失败: {e}")
-            return []
+    async def get_kline_arrays(
+        self,
+        *,
+        code: str | None = None,
+        secid: str | None = None,
+        limit: int = 200,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """获取最近 limit 根日K线的 (dates int32 YYYYMMDD, closes)（本地K线库，增量更新）"""
+        if not secid:
+            if not code:
+                return np.zeros(0, dtype=np.int32), np.zeros(0)
+            secid = code_to_secid(code)
 
-    async def _get_kline_from_sina(self, client, code: str) -> dict:
-        """从新浪获取K线数据"""
-        try:
-            prefix = "sh" if code.startswith("5") else "sz"
-            sina_code = f"{prefix}{code}"
-            # 新浪日K线API
-            resp = await client.get(
-                f"https://money.finance.sina.com.cn/quotes_service/api/json_v2.php/CN_MarketData.getKLineData",
-                params={
-                    "symbol": sina_code,
-                    "scale": "240",  # 日K
-                    "ma": "no",
-                    "datalen": "25",
-                },
-                headers={"Referer": "https://finance.sina.com.cn"},
-            )
-            data = resp.json()
-            if not data or not isinstance(data, list):
-                return {}
-
-            closes = [float(item["close"]) for item in data]
-            if len(closes) < 2:
-                return {}
-
-            today_close = closes[-1]
-            change_5d = 0
-            change_20d = 0
-
-            if len(closes) >= 6 and closes[-6]:
-                change_5d = round((today_close - closes[-6]) / closes[-6] * 100, 2)
-            if len(closes) >= 21 and closes[-21]:
-                change_20d = round((today_close - closes[-21]) / closes[-21] * 100, 2)
-
-            kline_data = closes[-90:] if len(closes) >= 90 else closes
-            return {
-                "change_5d": change_5d,
-                "change_20d": change_20d,
-                "kline": kline_data,
-            }
-        except Exception as e:
-            logger.warning(f"新浪K线API失败 {code}: {e}")
-            return {}
+        async def load() -> tuple[np.ndarray, np.ndarray]:
+            async with httpx.AsyncClient(timeout=self.timeout, headers=self.headers) as client:
+                dates, ohlcv = await kline_store.get(client, secid, limit)
+                return np.asarray(dates), np.asarray(ohlcv[CLOSE])
 
-    async def _get_kline_dates_from_sina(self, client, code: str) -> list[tuple[str, float]]:
-        """从新浪获取带日期的K线数据"""
         try:
-            # 5开头=上海ETF, 0开头=上海指数(如000300), 其余=深圳
-            prefix = "sh" if code.startswith("5") or code.startswith("0") else "sz"
-            sina_code = f"{prefix}{code}"
-            resp = await client.get(
-                f"https://money.finance.sina.com.cn/quotes_service/api/json_v2.php/CN_MarketData.getKLineData",
-                params={
-                    "symbol": sina_code,
-                    "scale": "240",
-                    "ma": "no",
-                    "datalen": "200",
-                },
-                headers={"Referer": "https://finance.sina.com.cn"},
-            )
-            data = resp.json()
-            if not data or not isinstance(data, list):
-                return []
-            out = []
-            for item in data:
-                date = item.get("day")
-                close = item.get("close")
-                if date and close is not None:
-                    out.append((date, float(close)))
-            return out
+            return await self._kline_cache.get((secid, limit), load)
         except Exception as e:
-            logger.warning(f"新浪K线(含日期)失败 {code}: {e}")
-            return []
+            logger.warning(f"获取K线(含日期)失败 {secid}: {e}")
+            return np.zeros(0, dtype=np.int32), np.zeros(0)
 
     async def get_kline_date_map(
         self,
@@ -703,83 +551,22 @@ class FundService:
         limit: int = 200,
     ) -> list[tuple[str, float]]:
         """获取带日期的K线收盘价序列 (date, close)"""
-        if not secid:
-            if not code:
-                return []
-            secid = f"1.{code}" if code.startswith("5") else f"0.{code}"
-
-        now = time.time()
-        if secid in self._kline_date_cache:
-            cached_time, cached_data = self._kline_date_cache[secid]
-            if now - cached_time < self._kline_date_cache_ttl:
-                return cached_data
-
-        try:
-            async with httpx.AsyncClient(timeout=self.timeout, headers=self.headers) as client:
-                resp = await client.get(
-                    "https://push2his.eastmoney.com/api/qt/stock/kline/get",
-                    params={
-                        "secid": secid,
-                        "fields1": "f1,f2,f3",
-                        "fields2": "f51,f52,f53",
-                        "klt": "101",
-                        "fqt": "1",
-                        "end": "20500101",
-                        "lmt": str(limit),
-                    },
-                )
-                klines = resp.json().get("data", {}).get("klines", [])
-                if klines:
-                    out = []
-                    for k in klines:
-                        parts = k.split(",")
-                        if len(parts) >= 3:
-                            out.append((parts[0], float(parts[2])))
-                    self._kline_date_cache[secid] = (now, out)
-                    return out
-
-                # 东方财富无数据，尝试新浪
-                if not code:
-                    code = secid.split(".")[1]
-                out = await self._get_kline_dates_from_sina(client, code)
-                if out:
-                    self._kline_date_cache[secid] = (now, out)
-                return out
-        except Exception as e:
-            logger.warning(f"东方财富K线(含日期)失败 {secid}: {e}")
-            # 回退到新浪 API
-            if not code:
-                code = secid.split(".")[1]
-            try:
-                async with httpx.AsyncClient(timeout=self.timeout) as client:
-                    out = await self._get_kline_dates_from_sina(client, code)
-                    if out:
-                        self._kline_date_cache[secid] = (time.time(), out)
-                    return out
-            except Exception as e2:
-                logger.warning(f"新浪K线(含日期)也失败 {code}: {e2}")
-                return []
+        dates, closes = await self.get_kline_arrays(code=code, secid=secid, limit=limit)
+        return [(format_date(d), c) for d, c in zip(dates.tolist(), closes.tolist())]
 
     async def batch_get_funds(self, codes: list[str]) -> dict[str, dict]:
         """批量获取基金信息（实时行情+多周期涨跌幅）"""
         if not codes:
             return {}
 
-        # 构建 secids: 5开头上海(1.)，其他深圳(0.)
-        secids = []
-        code_to_secid = {}
-        for code in codes:
-            if code.startswith("5"):
-                secid = f"1.{code}"
-            else:
-                secid = f"0.{code}"
-            secids.append(secid)
-            code_to_secid[code] = secid
+        # 磁盘缓存的行情：交易时段内 QUOTE_TTL 秒，休市时到下次开盘前都有效（跨进程/跨运行共享）
+        cached = disk_cache.get_many("quote", codes)
+        missing = [code_to_secid(code) for code in codes if code not in cached]
 
         try:
             async with httpx.AsyncClient(timeout=self.timeout, headers=self.headers) as client:
-                # 1. 批量获取实时行情（含资金流向），带重试
-                diff = await self._fetch_batch_with_retry(client, secids)
+                # 1. 批量获取实时行情（含资金流向），分块并发，失败的块降级新浪
+                diff = await fetch_quotes(client, missing) if missing else []
 
                 result = {}
                 for item in diff:
@@ -802,6 +589,18 @@ class FundService:
                             "flow_pct": flow_pct,  # 主力净占比%
                             "turnover": turnover,  # 换手率%
                         }
+                disk_cache.set_many("quote", result, ttl=quiet_ttl(QUOTE_TTL))
+                result = {**cached, **result}
+                if cached:
+                    logger.debug(f"行情缓存命中 {len(cached)}/{len(codes)}")
+
+                # 2. 多周期涨跌幅 / 波动率 / 回撤（本地K线库，整批向量化计算）
+                try:
+                    stats = await batch_stats(client, [code_to_secid(c) for c in result])
+                    for code, item in zip(result, stats):
+                        result[code].update(item)
+                except Exception as e:
+                    logger.warning(f"计算多周期指标失败: {e}")
 
                 return result
         except Exception as e:
@@ -809,58 +608,27 @@ class FundService:
             return {}
 
     async def _get_kline_changes(self, client, secid: str) -> dict:
-        """获取K线计算5日和20日涨跌幅，返回近20日收盘价（带缓存）"""
+        """获取K线计算5日和20日涨跌幅，返回近90日收盘价（本地K线库，增量更新）"""
         if not secid:
             return {}
-        # 检查缓存
-        now = time.time()
-        if secid in self._kline_cache:
-            cached_time, cached_data = self._kline_cache[secid]
-            if now - cached_time < self._cache_ttl:
-                return cached_data
-        try:
-            resp = await client.get(
-                "https://push2his.eastmoney.com/api/qt/stock/kline/get",
-                params={
-                    "secid": secid,
-                    "fields1": "f1,f2,f3",
-                    "fields2": "f51,f52,f53,f54,f55,f56",
-                    "klt": "101",
-                    "fqt": "1",
-                    "end": "20500101",
-                    "lmt": "95",
-                },
-            )
-            klines = resp.json().get("data", {}).get("klines", [])
-            if not klines:
-                # 东方财富无数据，尝试新浪 API
-                code = secid.split(".")[1]
-                return await self._get_kline_from_sina(client, code)
-
-            closes = [float(k.split(",")[2]) for k in klines]
-            today_close = closes[-1]
-            change_5d = 0
-            change_20d = 0
-
-            if len(closes) >= 6 and closes[-6]:
-                change_5d = round((today_close - closes[-6]) / closes[-6] * 100, 2)
-            if len(closes) >= 21 and closes[-21]:
-                change_20d = round((today_close - closes[-21]) / closes[-21] * 100, 2)
-
-            kline_data = closes[-90:] if len(closes) >= 90 else closes
-            result = {
-                "change_5d": change_5d,
-                "change_20d": change_20d,
-                "kline": kline_data,
-            }
-            self._kline_cache[secid] = (now, result)
-            return result
-        except Exception as e:
-            logger.warning(f"东方财富K线失败 {secid}: {e}")
-            # 尝试新浪 API 作为备用
-            code = secid.split(".")[1]
-            return await self._get_kline_from_sina(client, code)
+        closes = await kline_store.closes(client, secid, 95)
+        if len(closes) < 2:
+            return {}
+
+        today_close = closes[-1]
+        change_5d = 0
+        change_20d = 0
 
+        if len(closes) >= 6 and closes[-6]:
+            change_5d = round((today_close - closes[-6]) / closes[-6] * 100, 2)
+        if len(closes) >= 21 and closes[-21]:
+            change_20d = round((today_close - closes[-21]) / closes[-21] * 100, 2)
+
+        return {
+            "change_5d": change_5d,
+            "change_20d": change_20d,
+            "kline": closes[-90:],
+        }
 
     async def get_hot_etfs(self, limit: int = 10) -> list[dict]:
         """获取热门 ETF（从动态映射中获取，按成交额排序）"""
@@ -0,0 +1,197 @@
+"""行情接口按域名的自适应并发（AIMD）- 同一进程内所有请求共用
+
+    async with host_limiter.slot(url) as slot:
+        resp = await client.get(url, ...)
+        slot.observe(resp)          # 403/429/空响应记为失败
+        if not parse(resp):
+            slot.fail()             # 业务上的空数据也算被限流
+
+不同调用方（批量行情、K线、脚本）同时打同一个域名时总并发不超过该域名当前的上限。
+上限按 AIMD 调整：请求成功且延迟正常时每轮加 1（每个成功请求加 1/上限）；
+出现失败（403/429/超时/空响应）时减半。减半只对减半之后发出的请求生效，
+同一波拥塞里的多个失败只减一次。各域名的上限和延迟基线由入口脚本结束时 save()
+存到 host_limits.json（随 CI 缓存目录保留），下次运行从上次的水平开始。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import httpx
+from loguru import logger
+
+from src.services.storage import CACHE_DIR, load_json, save_json
+
+HOST_LIMITS_FILE = CACHE_DIR / "host_limits.json"
+# 各域名的初始并发（没有历史状态时）
+HOST_CONCURRENCY = {
+    "push2.eastmoney.com": 8,
+    "push2his.eastmoney.com": 6,
+    "hq.sinajs.cn": 4,
+    "money.finance.sina.com.cn": 4,
+    "fundf10.eastmoney.com": 5,
+}
+DEFAULT_CONCURRENCY = 4
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 32
+# 视为被限流的状态码
+THROTTLE_STATUS = {403, 429}
+# 延迟超过基线的该倍数时不再加并发（保持）
+SLOW_FACTOR = 3.0
+# 延迟 EWMA 系数；基线取 EWMA 的历史低点并缓慢上浮，适应接口本身变慢
+LATENCY_ALPHA = 0.2
+BASELINE_DRIFT = 0.01
+# 历史状态超过该时长不再沿用
+STATE_MAX_AGE = 7 * 86400
+
+
+class HostState:
+    """单个域名的并发上限与延迟统计"""
+
+    def __init__(self, limit: float, latency: float = 0.0, baseline: float = 0.0):
+        self.limit = limit
+        self.latency = latency
+        self.baseline = baseline
+        self.in_flight = 0
+        self.decreased_at = 0.0
+        self.counters = dict.fromkeys(("ok", "failed", "increases", "decreases"), 0)
+
+    @property
+    def capacity(self) -> int:
+        return max(MIN_CONCURRENCY, int(self.limit))
+
+    def on_success(self, latency: float):
+        self.counters["ok"] += 1
+        self.latency = latency if not self.latency else self.latency + LATENCY_ALPHA * (latency - self.latency)
+        if not self.baseline:
+            self.baseline = self.latency
+        self.baseline = min(self.latency, self.baseline * (1 + BASELINE_DRIFT))
+        if latency <= self.baseline * SLOW_FACTOR and self.in_flight >= self.capacity:
+            # 只在并发确实被用满时加（in_flight 含本次请求），避免空闲时上限虚高
+            before = self.capacity
+            self.limit = min(MAX_CONCURRENCY, self.limit + 1 / self.capacity)
+            if self.capacity > before:
+                self.counters["increases"] += 1
+
+    def on_failure(self, started_at: float):
+        self.counters["failed"] += 1
+        if started_at < self.decreased_at:
+            return  # 上次减半之前发出的请求，同一波拥塞
+        self.limit = max(MIN_CONCURRENCY, self.limit / 2)
+        self.decreased_at = time.monotonic()
+        self.counters["decreases"] += 1
+
+
+class Slot:
+    """一次请求的结果记录：默认成功，出异常或 fail()/observe() 判定失败"""
+
+    def __init__(self):
+        self.ok = True
+
+    def fail(self):
+        self.ok = False
+
+    def observe(self, resp: httpx.Response):
+        if resp.status_code in THROTTLE_STATUS or not resp.content.strip():
+            self.ok = False
+
+
+class HostLimiter:
+    def __init__(self, path: Path | None = HOST_LIMITS_FILE, initial: dict[str, int] | None = None):
+        """path 为 None 时不读写历史状态"""
+        self.path = path
+        self.initial = dict(HOST_CONCURRENCY if initial is None else initial)
+        self.hosts: dict[str, HostState] = {}
+        self._loaded = False
+        # asyncio 原语绑定事件循环，按循环惰性创建（脚本/测试里可能多次 asyncio.run）
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._conds: dict[str, asyncio.Condition] = {}
+
+    def _load(self):
+        self._loaded = True
+        if self.path is None:
+            return
+        data = load_json(self.path, {}) or {}
+        if time.time() - data.get("updated_at", 0) < STATE_MAX_AGE:
+            for host, item in data.get("hosts", {}).items():
+                limit = min(MAX_CONCURRENCY, max(MIN_CONCURRENCY, float(item.get("limit", DEFAULT_CONCURRENCY))))
+                self.hosts[host] = HostState(limit, item.get("latency", 0.0), item.get("baseline", 0.0))
+
+    def state(self, host: str) -> HostState:
+        if not self._loaded:
+            self._load()
+        if host not in self.hosts:
+            self.hosts[host] = HostState(float(self.initial.get(host, DEFAULT_CONCURRENCY)))
+        return self.hosts[host]
+
+    def _cond(self, host: str) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._conds = {}
+            for state in self.hosts.values():
+                state.in_flight = 0
+        if host not in self._conds:
+            self._conds[host] = asyncio.Condition()
+        return self._conds[host]
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        """占用 url 所在域名的一个并发槽，退出时按结果调整该域名的上限"""
+        host = httpx.URL(url).host
+        state = self.state(host)
+        cond = self._cond(host)
+        async with cond:
+            await cond.wait_for(lambda: state.in_flight < state.capacity)
+            state.in_flight += 1
+        slot = Slot()
+        started_at = time.monotonic()
+        cancelled = False
+        try:
+            yield slot
+        except Exception:
+            # 超时、连接错误、解析失败
+            slot.fail()
+            raise
+        except BaseException:
+            cancelled = True
+            raise
+        finally:
+            # 被取消的请求不计入
+            if not cancelled and slot.ok:
+                state.on_success(time.monotonic() - started_at)
+            elif not cancelled:
+                state.on_failure(started_at)
+            async with cond:
+                state.in_flight -= 1
+                cond.notify_all()
+
+    def summary(self) -> dict[str, dict]:
+        return {
+            host: {"limit": round(s.limit, 2), "latency": round(s.latency, 3), **s.counters}
+            for host, s in self.hosts.items()
+        }
+
+    def save(self):
+        """写入 host_limits.json 并输出本次运行的统计（入口脚本结束时调用）"""
+        if self.path is None or not self.hosts:
+            return
+        save_json(self.path, {
+            "updated_at": time.time(),
+            "hosts": {
+                host: {"limit": round(s.limit, 2), "latency": round(s.latency, 4), "baseline": round(s.baseline, 4)}
+                for host, s in self.hosts.items()
+            },
+        })
+        active = {h: s for h, s in self.summary().items() if s["ok"] + s["failed"]}
+        if active:
+            logger.info("🌐 域名并发: " + ", ".join(
+                f"{h}={s['limit']}（成功 {s['ok']} / 失败 {s['failed']}）" for h, s in active.items()
+            ))
+
+
+# 进程内共享
+host_limiter = HostLimiter()
@@ -0,0 +1,283 @@
+"""本地日K线存储 - 按 secid 落盘，每次运行只增量拉取最后一根之后的K线
+
+每个 secid 两个文件（列式）：
+    <secid>.dates.npy  int32，YYYYMMDD
+    <secid>.ohlcv.npy  float64，形状 (5, n)，依次为 开/收/高/低/成交量
+读取用 mmap，不整体载入内存。
+
+首次遇到某 secid 时回填一次历史（BACKFILL_BARS 根），之后按距上次最后一根的交易日数
+请求很小的 lmt，并多取 OVERLAP_BARS 根与已存数据重叠：重叠部分收盘价对不上说明前复权价
+因分红拆分整体变了，这时重新回填。
+
+每个 secid 的更新时间/回填深度记在同目录的 meta.sqlite3（多进程共享）；上次更新之后没有
+开过盘的（休市时段的重复运行）直接用本地数据，不发请求。
+
+只有东方财富的前复权K线落盘。东方财富拉不到时降级新浪，但新浪是不复权价，
+只用于本次返回，不写入存储（否则同一序列混两种价格基准，下次增量校验必然失败并重新回填）。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+import httpx
+import numpy as np
+from loguru import logger
+
+from src.services.disk_cache import DiskCache
+from src.services.host_limit import host_limiter
+from src.services.market_hours import unchanged_since
+from src.services.storage import CACHE_DIR
+
+KLINE_DIR = CACHE_DIR / "kline"
+FIELDS = ("open", "close", "high", "low", "volume")
+OPEN, CLOSE, HIGH, LOW, VOLUME = range(len(FIELDS))
+# 首次回填的K线根数（覆盖 200 日复盘窗口）
+BACKFILL_BARS = 250
+# 增量请求与已存数据重叠的根数（校验复权价 + 刷新盘中未收盘的最后一根）
+OVERLAP_BARS = 2
+# 距上次更新不足该秒数视为最新，不请求
+FRESH_SECONDS = 300
+# 缺口超过该交易日数时直接重新回填
+MAX_GAP_BARS = 120
+
+EASTMONEY_KLINE_URL = "https://push2his.eastmoney.com/api/qt/stock/kline/get"
+SINA_KLINE_URL = "https://money.finance.sina.com.cn/quotes_service/api/json_v2.php/CN_MarketData.getKLineData"
+
+
+def code_to_secid(code: str) -> str:
+    """5开头上海(1.)，其他深圳(0.)"""
+    return f"1.{code}" if code.startswith("5") else f"0.{code}"
+
+
+def format_date(value: int) -> str:
+    """20240102 → "2024-01-02" """
+    return f"{value // 10000:04d}-{value // 100 % 100:02d}-{value % 100:02d}"
+
+
+def _parse_date(text: str) -> int:
+    return int(text[:10].replace("-", ""))
+
+
+def _empty() -> tuple[np.ndarray, np.ndarray]:
+    return np.zeros(0, dtype=np.int32), np.zeros((len(FIELDS), 0))
+
+
+def _save_npy(path: Path, array: np.ndarray):
+    """原子写入 .npy"""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp, path)
+    except Exception:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+async def _fetch_eastmoney(client: httpx.AsyncClient, secid: str, limit: int) -> tuple[np.ndarray, np.ndarray]:
+    async with host_limiter.slot(EASTMONEY_KLINE_URL) as slot:
+        resp = await client.get(
+            EASTMONEY_KLINE_URL,
+            params={
+                "secid": secid,
+                "fields1": "f1,f2,f3",
+                "fields2": "f51,f52,f53,f54,f55,f56",
+                "klt": "101",
+                "fqt": "1",
+                "end": "20500101",
+                "lmt": str(limit),
+            },
+        )
+        slot.observe(resp)
+        klines = (resp.json().get("data") or {}).get("klines") or []
+        if not klines:
+            slot.fail()
+    # kline格式: 日期,开,收,高,低,成交量
+    rows = [k.split(",") for k in klines]
+    rows = [r for r in rows if len(r) >= 6]
+    if not rows:
+        return _empty()
+    dates = np.array([_parse_date(r[0]) for r in rows], dtype=np.int32)
+    ohlcv = np.array([[float(r[i + 1]) for r in rows] for i in range(len(FIELDS))])
+    return dates, ohlcv
+
+
+async def _fetch_sina(client: httpx.AsyncClient, secid: str, limit: int) -> tuple[np.ndarray, np.ndarray]:
+    market, code = secid.split(".", 1)
+    async with host_limiter.slot(SINA_KLINE_URL) as slot:
+        resp = await client.get(
+            SINA_KLINE_URL,
+            params={"symbol": f"{'sh' if market == '1' else 'sz'}{code}", "scale": "240", "ma": "no", "datalen": str(limit)},
+            headers={"Referer": "https://finance.sina.com.cn"},
+        )
+        slot.observe(resp)
+        data = resp.json()
+        if not data or not isinstance(data, list):
+            slot.fail()
+            return _empty()
+    rows = [item for item in data if item.get("day") and item.get("close") is not None]
+    if not rows:
+        return _empty()
+    dates = np.array([_parse_date(item["day"]) for item in rows], dtype=np.int32)
+    ohlcv = np.array([[float(item.get(name) or 0) for item in rows] for name in FIELDS])
+    return dates, ohlcv
+
+
+async def fetch_klines(client: httpx.AsyncClient, secid: str, limit: int) -> tuple[np.ndarray, np.ndarray]:
+    """拉取最近 limit 根前复权日K线（东方财富），失败返回空数组"""
+    try:
+        return await _fetch_eastmoney(client, secid, limit)
+    except Exception as e:
+        logger.warning(f"东方财富K线失败 {secid}: {e}")
+        return _empty()
+
+
+async def fetch_unadjusted_klines(client: httpx.AsyncClient, secid: str, limit: int) -> tuple[np.ndarray, np.ndarray]:
+    """拉取最近 limit 根不复权日K线（新浪，东方财富失败时的降级），失败返回空数组"""
+    try:
+        return await _fetch_sina(client, secid, limit)
+    except Exception as e:
+        logger.warning(f"新浪K线也失败 {secid}: {e}")
+        return _empty()
+
+
+class KlineStore:
+    """按 secid 落盘的日K线，get() 时按需增量更新"""
+
+    def __init__(self, directory: Path = KLINE_DIR, *, fresh_seconds: float = FRESH_SECONDS):
+        self.directory = directory
+        self.fresh_seconds = fresh_seconds
+        # {secid: {"depth": 最近一次回填请求的根数, "updated_at": 时间戳}}
+        self.meta = DiskCache(directory / "meta.sqlite3")
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    def _paths(self, secid: str) -> tuple[Path, Path]:
+        return self.directory / f"{secid}.dates.npy", self.directory / f"{secid}.ohlcv.npy"
+
+    def load(self, secid: str) -> tuple[np.ndarray, np.ndarray]:
+        """读取已存K线（mmap）：(dates int32, ohlcv (5, n))，没有或损坏时返回空数组"""
+        dates_path, ohlcv_path = self._paths(secid)
+        if not dates_path.exists() or not ohlcv_path.exists():
+            return _empty()
+        try:
+            dates = np.load(dates_path, mmap_mode="r")
+            ohlcv = np.load(ohlcv_path, mmap_mode="r")
+        except Exception as e:
+            logger.warning(f"读取K线 {secid} 失败: {e}")
+            return _empty()
+        if ohlcv.shape != (len(FIELDS), len(dates)):
+            return _empty()
+        return dates, ohlcv
+
+    def _write(self, secid: str, dates: np.ndarray, ohlcv: np.ndarray, **meta):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        dates_path, ohlcv_path = self._paths(secid)
+        _save_npy(ohlcv_path, np.ascontiguousarray(ohlcv, dtype=np.float64))
+        _save_npy(dates_path, np.ascontiguousarray(dates, dtype=np.int32))
+        entry = self.meta.get("kline", secid, {})
+        self.meta.set("kline", secid, {**entry, **meta, "updated_at": time.time()})
+
+    def _lock(self, secid: str) -> asyncio.Lock:
+        return self._locks.setdefault(secid, asyncio.Lock())
+
+    async def get(self, client: httpx.AsyncClient, secid: str, bars: int) -> tuple[np.ndarray, np.ndarray]:
+        """返回最近 bars 根K线，必要时先增量更新；东方财富失败时本次返回新浪数据，都失败返回已存数据"""
+        async with self._lock(secid):
+            dates, ohlcv = self.load(secid)
+            entry = self.meta.get("kline", secid, {})
+            updated_at = entry.get("updated_at", 0)
+            if len(dates) and (time.time() - updated_at < self.fresh_seconds or unchanged_since(updated_at)):
+                return dates[-bars:], ohlcv[:, -bars:]
+            try:
+                updated = await self._update(client, secid, dates, ohlcv, bars, entry.get("depth", 0))
+            except Exception as e:
+                logger.warning(f"更新K线 {secid} 失败: {e}")
+                updated = None
+            if updated is None:
+                # 不落盘、不更新 meta，下次仍从东方财富拉取
+                fallback = await fetch_unadjusted_klines(client, secid, bars)
+                if len(fallback[0]):
+                    dates, ohlcv = fallback
+            else:
+                dates, ohlcv = updated
+            return dates[-bars:], ohlcv[:, -bars:]
+
+    async def _update(
+        self, client: httpx.AsyncClient, secid: str,
+        dates: np.ndarray, ohlcv: np.ndarray, bars: int, depth: int,
+    ) -> tuple[np.ndarray, np.ndarray] | None:
+        """增量更新并返回落盘后的K线；东方财富没拿到数据时返回 None"""
+        # 已存根数不够且之前没回填过这么深（新上市的回填过也不够，不再重复回填）
+        if not len(dates) or (len(dates) < bars and depth < bars):
+            return await self._backfill(client, secid, bars)
+
+        last = format_date(int(dates[-1]))
+        # 本地日期可能落后于行情日期（CI 用 UTC），不足 0 按 0 算
+        gap = max(int(np.busday_count(last, date.today().isoformat())), 0)
+        if gap > MAX_GAP_BARS:
+            return await self._backfill(client, secid, bars)
+
+        new_dates, new_ohlcv = await fetch_klines(client, secid, gap + OVERLAP_BARS)
+        if not len(new_dates):
+            return None
+        # 新数据须与已存数据重叠，且重叠部分收盘价一致（否则复权价已变或缺口超出请求范围）；
+        # 已存的最后一根可能是盘中价，不参与校验
+        common = np.intersect1d(dates[:-1], new_dates)
+        if not len(common) or not np.allclose(
+            ohlcv[CLOSE][np.isin(dates, common)], new_ohlcv[CLOSE][np.isin(new_dates, common)], rtol=1e-4,
+        ):
+            return await self._backfill(client, secid, bars)
+
+        keep = dates < new_dates[0]
+        merged_dates = np.concatenate([dates[keep], new_dates])
+        merged_ohlcv = np.concatenate([ohlcv[:, keep], new_ohlcv], axis=1)
+        self._write(secid, merged_dates, merged_ohlcv)
+        return self.load(secid)
+
+    async def _backfill(
+        self, client: httpx.AsyncClient, secid: str, bars: int,
+    ) -> tuple[np.ndarray, np.ndarray] | None:
+        # 按 BACKFILL_BARS 的整数倍回填，复盘窗口逐日变长时不会每天重新回填
+        depth = -(-max(bars, BACKFILL_BARS) // BACKFILL_BARS) * BACKFILL_BARS
+        new_dates, new_ohlcv = await fetch_klines(client, secid, depth)
+        if not len(new_dates):
+            return None
+        self._write(secid, new_dates, new_ohlcv, depth=depth)
+        logger.debug(f"K线回填 {secid}: {len(new_dates)} 根")
+        return self.load(secid)
+
+    async def close_matrix(
+        self, client: httpx.AsyncClient, secids: list[str], bars: int,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """多个 secid 的收盘价按日期对齐成矩阵：(dates, closes (len(secids), n))，缺失为 NaN
+
+        全部并发发起，实际请求并发由域名自适应上限控制。
+        """
+        series = await asyncio.gather(*(self.get(client, s, bars) for s in secids))
+        dates = np.unique(np.concatenate([np.zeros(0, dtype=np.int32)] + [d for d, _ in series]))[-bars:]
+        matrix = np.full((len(secids), len(dates)), np.nan)
+        if not len(dates):
+            return dates, matrix
+        for row, (d, ohlcv) in enumerate(series):
+            pos = np.searchsorted(dates, d)
+            ok = (pos < len(dates)) & (dates[np.minimum(pos, len(dates) - 1)] == d)
+            matrix[row, pos[ok]] = ohlcv[CLOSE][ok]
+        return dates, matrix
+
+    async def closes(self, client: httpx.AsyncClient, secid: str, bars: int) -> list[float]:
+        _, ohlcv = await self.get(client, secid, bars)
+        return ohlcv[CLOSE].tolist()
+
+    async def date_closes(self, client: httpx.AsyncClient, secid: str, bars: int) -> list[tuple[str, float]]:
+        dates, ohlcv = await self.get(client, secid, bars)
+        return [(format_date(d), c) for d, c in zip(dates.tolist(), ohlcv[CLOSE].tolist())]
+
+
+# 进程内共享
+kline_store = KlineStore()
@@ -0,0 +1,65 @@
+"""A 股交易时段 - 判断行情数据在某段时间内是否可能变化
+
+按工作日 9:15-15:05（北京时间）算作交易时段，不识别节假日（节假日当作交易日，
+最多多请求一次，之后按收盘后处理）。
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, time, timedelta, timezone
+
+BEIJING = timezone(timedelta(hours=8))
+# 集合竞价开始 / 收盘（留几分钟让最后一根日K线落定）
+SESSION_OPEN = time(9, 15)
+SESSION_CLOSE = time(15, 5)
+
+
+def now_beijing() -> datetime:
+    return datetime.now(BEIJING)
+
+
+def _at(day: datetime, t: time) -> datetime:
+    return day.replace(hour=t.hour, minute=t.minute, second=0, microsecond=0)
+
+
+def is_open(now: datetime | None = None) -> bool:
+    now = (now or now_beijing()).astimezone(BEIJING)
+    return now.weekday() < 5 and SESSION_OPEN <= now.time() < SESSION_CLOSE
+
+
+def last_close(now: datetime | None = None) -> datetime:
+    """最近一次已经发生的收盘时间"""
+    now = (now or now_beijing()).astimezone(BEIJING)
+    day = now
+    while True:
+        close = _at(day, SESSION_CLOSE)
+        if day.weekday() < 5 and close <= now:
+            return close
+        day -= timedelta(days=1)
+
+
+def next_open(now: datetime | None = None) -> datetime:
+    """下一次开盘时间（正在交易时返回当前时间）"""
+    now = (now or now_beijing()).astimezone(BEIJING)
+    if is_open(now):
+        return now
+    day = now
+    while True:
+        start = _at(day, SESSION_OPEN)
+        if day.weekday() < 5 and start > now:
+            return start
+        day += timedelta(days=1)
+
+
+def unchanged_since(ts: float, now: datetime | None = None) -> bool:
+    """时间戳 ts 之后没有开过盘（当前休市且 ts 晚于最近一次收盘），日K线/行情不会变"""
+    now = now or now_beijing()
+    return not is_open(now) and ts >= last_close(now).timestamp()
+
+
+def quiet_ttl(default: float, now: datetime | None = None) -> float:
+    """交易时段内返回 default；休市时返回到下次开盘的秒数（期间行情不变）"""
+    now = (now or now_beijing()).astimezone(BEIJING)
+    if is_open(now):
+        return default
+    return max((next_open(now) - now).total_seconds(), default)
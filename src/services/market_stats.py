@@ -0,0 +1,66 @@
+"""批量行情指标 - 多周期涨跌幅 / 波动率 / 回撤
+
+从本地K线库取出一批 ETF 的收盘价，按日期对齐成 代码 × 日期 矩阵，
+所有指标对整个矩阵一次向量化计算，不再逐个代码循环。
+"""
+
+from __future__ import annotations
+
+import httpx
+import numpy as np
+
+from src.services.kline_store import kline_store
+
+# 涨跌幅周期（交易日）
+HORIZONS = (1, 5, 20, 60)
+# 年化波动率的统计窗口 / 最大回撤的统计窗口（交易日）
+VOLATILITY_WINDOW = 20
+DRAWDOWN_WINDOW = 60
+TRADING_DAYS_PER_YEAR = 252
+STATS_BARS = max(max(HORIZONS), VOLATILITY_WINDOW, DRAWDOWN_WINDOW) + 1
+
+
+def _ffill(closes: np.ndarray) -> np.ndarray:
+    """停牌等缺失的收盘价沿时间轴用前值填充（开头的缺失保持 NaN）"""
+    cols = np.arange(closes.shape[1])
+    idx = np.where(np.isnan(closes), 0, cols)
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    return closes[np.arange(closes.shape[0])[:, None], idx]
+
+
+def compute_stats(closes: np.ndarray) -> dict[str, np.ndarray]:
+    """closes: (代码数, 日期数) 收盘价矩阵 → 每项指标一个长度为代码数的数组（%，数据不足为 NaN）"""
+    n, days = closes.shape
+    stats: dict[str, np.ndarray] = {}
+    if days == 0:
+        nan = np.full(n, np.nan)
+        return {**{f"change_{h}d": nan for h in HORIZONS}, "volatility_20d": nan, "max_drawdown_60d": nan}
+
+    filled = _ffill(closes)
+    last = filled[:, -1]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for h in HORIZONS:
+            base = filled[:, -1 - h] if days > h else np.full(n, np.nan)
+            stats[f"change_{h}d"] = (last / base - 1) * 100
+
+        daily = filled[:, -VOLATILITY_WINDOW - 1:]
+        daily = daily[:, 1:] / daily[:, :-1] - 1
+        count = np.sum(~np.isnan(daily), axis=1)
+        mean = np.nansum(daily, axis=1) / count
+        var = np.nansum((daily - mean[:, None]) ** 2, axis=1) / (count - 1)
+        stats["volatility_20d"] = np.where(count > 1, np.sqrt(var * TRADING_DAYS_PER_YEAR) * 100, np.nan)
+
+        window = filled[:, -DRAWDOWN_WINDOW - 1:]
+        peak = np.fmax.accumulate(window, axis=1)
+        stats["max_drawdown_60d"] = np.fmin.reduce(window / peak - 1, axis=1) * 100
+    return stats
+
+
+async def batch_stats(client: httpx.AsyncClient, secids: list[str]) -> list[dict[str, float]]:
+    """按 secids 顺序返回每个代码的指标（保留两位小数，数据不足的指标为 0）"""
+    if not secids:
+        return []
+    _, closes = await kline_store.close_matrix(client, secids, STATS_BARS)
+    stats = compute_stats(closes)
+    table = {k: np.round(np.nan_to_num(v, nan=0.0), 2).tolist() for k, v in stats.items()}
+    return [{k: values[i] for k, values in table.items()} for i in range(len(secids))]
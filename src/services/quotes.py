@@ -0,0 +1,135 @@
+"""实时行情批量获取 - 分块并发（东方财富 ulist → 新浪降级）
+
+secid 列表按 CHUNK_SIZE 均分成若干块并发请求（受域名自适应并发上限约束），
+每块独立重试，仍失败的块单独降级到新浪，最后合并所有块的结果。
+几百个代码的耗时约等于一块的耗时，单块失败也不会丢掉整批数据。
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+import httpx
+from loguru import logger
+
+from src.services.host_limit import host_limiter
+
+EASTMONEY_QUOTE_URL = "https://push2.eastmoney.com/api/qt/ulist.np/get"
+SINA_QUOTE_URL = "https://hq.sinajs.cn/list="
+QUOTE_FIELDS = "f12,f14,f2,f3,f6,f8,f62,f184"
+# 每块的 secid 上限：ulist 单次 100 个以内响应稳定；新浪受 URL 长度限制（每个代码 9 字符）
+CHUNK_SIZE = 100
+SINA_CHUNK_SIZE = 80
+MAX_RETRIES = 3
+# 重试的递增延迟基数（秒）
+RETRY_DELAY = 1.0
+
+
+def split_chunks(items: list, size: int) -> list[list]:
+    """均分成 ceil(n/size) 块（各块大小相差不超过 1，避免最后一块很小）"""
+    if not items:
+        return []
+    count = -(-len(items) // size)
+    step, extra = divmod(len(items), count)
+    chunks, start = [], 0
+    for i in range(count):
+        end = start + step + (i < extra)
+        chunks.append(items[start:end])
+        start = end
+    return chunks
+
+
+async def _fetch_eastmoney(client: httpx.AsyncClient, secids: list[str]) -> list[dict]:
+    """一块 secid 的东方财富行情，带重试；全部失败返回空列表"""
+    for attempt in range(MAX_RETRIES):
+        if attempt > 0:
+            await asyncio.sleep(RETRY_DELAY * attempt)  # 递增延迟
+        try:
+            async with host_limiter.slot(EASTMONEY_QUOTE_URL) as slot:
+                resp = await client.get(
+                    EASTMONEY_QUOTE_URL,
+                    params={"secids": ",".join(secids), "fields": QUOTE_FIELDS},
+                )
+                slot.observe(resp)
+                diff = ((resp.json().get("data") or {}).get("diff") or []) if resp.text.strip() else []
+                if not diff:
+                    slot.fail()
+            if diff:
+                return diff
+            logger.warning(f"批量行情返回空数据（{len(secids)} 个），重试 {attempt + 1}/{MAX_RETRIES}")
+        except Exception as e:
+            logger.warning(f"批量行情请求失败: {e}，重试 {attempt + 1}/{MAX_RETRIES}")
+    return []
+
+
+def _parse_sina(text: str) -> list[dict]:
+    results = []
+    for line in text.strip().split("\n"):
+        if "=" not in line or '""' in line:
+            continue
+        # 解析: var hq_str_sh518880="黄金ETF,10.883,..."
+        var_part, data_part = line.split("=", 1)
+        code = var_part.split("_")[-1][2:]  # 去掉 sh/sz 前缀
+        data = data_part.strip().strip(";").strip('"').split(",")
+        if len(data) < 10:
+            continue
+        try:
+            price, prev_close = float(data[3]), float(data[2])
+            results.append({
+                "f12": code,
+                "f14": data[0],  # 名称
+                "f2": int(price * 1000),  # 当前价 * 1000
+                "f3": int((price - prev_close) / prev_close * 10000) if prev_close else 0,  # 涨跌幅 * 100
+                "f6": int(float(data[9])),  # 成交额
+                "f8": 0,  # 换手率（新浪无此数据）
+                "f62": 0,  # 主力流入（新浪无此数据）
+                "f184": 0,  # 主力占比（新浪无此数据）
+                "_from_sina": True,  # 标记来自新浪，需要单独获取K线
+            })
+        except ValueError:
+            continue
+    return results
+
+
+async def _fetch_sina(client: httpx.AsyncClient, secids: list[str]) -> list[dict]:
+    """新浪行情（东方财富失败的块），同样按块并发"""
+    # 转换 secid 为新浪格式: 1.518880 -> sh518880, 0.159915 -> sz159915
+    sina_codes = []
+    for secid in secids:
+        market, code = secid.split(".")
+        sina_codes.append(f"{'sh' if market == '1' else 'sz'}{code}")
+
+    async def one(chunk: list[str]) -> list[dict]:
+        url = SINA_QUOTE_URL + ",".join(chunk)
+        try:
+            async with host_limiter.slot(url) as slot:
+                resp = await client.get(url, headers={"Referer": "https://finance.sina.com.cn"})
+                slot.observe(resp)
+                items = _parse_sina(resp.text)
+                if not items:
+                    slot.fail()
+            return items
+        except Exception as e:
+            logger.warning(f"新浪行情也失败（{len(chunk)} 个）: {e}")
+            return []
+
+    parts = await asyncio.gather(*(one(c) for c in split_chunks(sina_codes, SINA_CHUNK_SIZE)))
+    return [item for part in parts for item in part]
+
+
+async def _fetch_chunk(client: httpx.AsyncClient, secids: list[str]) -> list[dict]:
+    diff = await _fetch_eastmoney(client, secids)
+    if diff:
+        return diff
+    logger.info(f"东方财富行情失败，{len(secids)} 个代码回退到新浪财经")
+    return await _fetch_sina(client, secids)
+
+
+async def fetch_quotes(client: httpx.AsyncClient, secids: list[str]) -> list[dict]:
+    """批量实时行情（东方财富字段格式 f12/f14/f2/...），各块结果合并；拿不到的代码不出现在结果中"""
+    secids = list(dict.fromkeys(secids))
+    parts = await asyncio.gather(*(_fetch_chunk(client, c) for c in split_chunks(secids, CHUNK_SIZE)))
+    results = [item for part in parts for item in part]
+    if len(results) < len(secids):
+        logger.debug(f"批量行情 {len(results)}/{len(secids)}")
+    return results
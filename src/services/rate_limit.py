@@ -0,0 +1,121 @@
+"""限流 - LLM 调用的全局令牌桶（请求数/分钟 + tokens/分钟 + 并发上限）
+
+同一进程内所有 AIClient 调用以及脚本里的裸 httpx 调用共用同一个限流器（按 API 地址区分），
+遇到 429 时按 retry-after 暂停整个桶，而不是各自盲目重试。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import re
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any
+
+from loguru import logger
+
+# 没有 retry-after 头时 429 的默认暂停时长（秒）
+DEFAULT_RETRY_AFTER = 10.0
+
+_CJK_RE = re.compile(r"[\u3000-\u9fff\uff00-\uffef]")
+
+
+def estimate_tokens(payload: Any) -> int:
+    """粗略估算输入 tokens：中文约 1 字 1 token，其余约 4 字符 1 token"""
+    text = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """解析 retry-after 头（秒数或 HTTP 日期）"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+class TokenBucketLimiter:
+    """请求数 + tokens 双令牌桶，附带并发上限"""
+
+    def __init__(self, rpm: int, tpm: int, max_concurrency: int):
+        self.rpm = max(1, rpm)
+        self.tpm = max(1, tpm)
+        self.max_concurrency = max(1, max_concurrency)
+        self._requests = float(self.rpm)
+        self._tokens = float(self.tpm)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        # asyncio 原语绑定事件循环，按循环惰性创建（脚本/测试里可能多次 asyncio.run）
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._lock: asyncio.Lock | None = None
+        self._sem: asyncio.Semaphore | None = None
+
+    def _primitives(self) -> tuple[asyncio.Lock, asyncio.Semaphore]:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+        return self._lock, self._sem
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    async def _acquire(self, tokens: int):
+        lock, _ = self._primitives()
+        tokens = min(tokens, self.tpm)
+        while True:
+            async with lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = max(
+                    self._blocked_until - now,
+                    (1 - self._requests) * 60 / self.rpm,
+                    (tokens - self._tokens) * 60 / self.tpm,
+                )
+                if wait <= 0:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+            await asyncio.sleep(wait)
+
+    @asynccontextmanager
+    async def slot(self, tokens: int = 0):
+        """占用一次调用配额（先过令牌桶，再占并发槽）"""
+        await self._acquire(tokens)
+        _, sem = self._primitives()
+        async with sem:
+            yield
+
+    def penalize(self, retry_after: float | None = None):
+        """收到 429：暂停整个桶直到 retry-after 过去，并清空请求令牌"""
+        delay = retry_after if retry_after is not None else DEFAULT_RETRY_AFTER
+        self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        self._requests = 0.0
+        logger.warning(f"LLM 限流（429），暂停 {delay:.1f}s")
+
+
+_limiters: dict[str, TokenBucketLimiter] = {}
+
+
+def get_ai_limiter(base_url: str) -> TokenBucketLimiter:
+    """按 API 地址获取共享限流器（配置读取延后到首次使用，脚本导入时无需 API key）"""
+    key = base_url.rstrip("/")
+    if key not in _limiters:
+        from src.config import settings
+        _limiters[key] = TokenBucketLimiter(
+            settings.ai_rpm, settings.ai_tpm, settings.ai_max_concurrency,
+        )
+    return _limiters[key]
@@ -0,0 +1,275 @@
+"""信号复盘引擎 - 全部信号 × 全部周期的远期收益一次向量化计算
+
+所有代码的日K线按 (代码, 日期) 排序拼成一张表，信号入场日用二分查找定位到
+"不早于信号日期的第一个交易日"，各周期的出场价按下标偏移直接取，
+基准（沪深300）收益同样整批计算后相减得到超额收益。
+复杂度 O(信号数 × log K线数)，与周期数、K线长度基本无关。
+
+增量模式：某周期的出场K线收盘后，该周期的结果（收益、超额）写回信号的 results 并计入
+按 信号类型 × 周期 的累计量（count / wins / 收益和 / 超额和），之后不再重算；
+每次运行只计算还有未结算周期的信号。
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, time
+
+import numpy as np
+
+# 复盘周期（交易日）
+HORIZONS = (1, 3, 7, 20)
+# (代码序号, 日期) 合成一个可排序的 int64 键
+_KEY_BASE = 10 ** 8
+# 收盘后当天的日K线才算最终价（北京时间）
+MARKET_CLOSE = time(15, 30)
+# 参与复盘的信号类型及胜负方向（回避信号跌为胜）
+SIGNAL_GROUPS = {"买入": False, "回避": True}
+
+
+def parse_dates(values: list[str]) -> np.ndarray:
+    """"YYYY-MM-DD" 列表 → int32 YYYYMMDD，无法解析的为 -1"""
+    out = np.full(len(values), -1, dtype=np.int32)
+    for i, value in enumerate(values):
+        digits = value[:10].replace("-", "") if value else ""
+        if len(digits) == 8 and digits.isdigit():
+            out[i] = int(digits)
+    return out
+
+
+class PriceIndex:
+    """多个代码的日收盘价，按 (代码, 日期) 排序拼接"""
+
+    def __init__(self, series: dict[str, tuple[np.ndarray, np.ndarray]]):
+        """series: {代码: (dates int32 升序, closes)}"""
+        self.codes = {code: i for i, code in enumerate(series)}
+        parts = list(series.values())
+        lengths = np.array([len(d) for d, _ in parts], dtype=np.int64)
+        self.ends = np.cumsum(lengths)
+        self.keys = np.concatenate(
+            [np.zeros(0, dtype=np.int64)]
+            + [i * _KEY_BASE + np.asarray(d, dtype=np.int64) for i, (d, _) in enumerate(parts)]
+        )
+        self.closes = np.concatenate([np.zeros(0)] + [np.asarray(c, dtype=np.float64) for _, c in parts])
+
+    def forward(
+        self, codes: list[str], entry_dates: np.ndarray, horizons=HORIZONS,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """每个 (代码, 入场日) 在各周期后的 (收益率 %, 出场日期)，形状均为 (信号数, 周期数)
+
+        数据不足时收益为 NaN、出场日期为 -1。
+        """
+        n = len(codes)
+        returns = np.full((n, len(horizons)), np.nan)
+        exit_dates = np.full((n, len(horizons)), -1, dtype=np.int64)
+        code_idx = np.array([self.codes.get(c, -1) for c in codes], dtype=np.int64)
+        valid = (code_idx >= 0) & (entry_dates >= 0)
+        if not valid.any() or not len(self.closes):
+            return returns, exit_dates
+        rows = np.flatnonzero(valid)
+        cidx = code_idx[rows]
+        pos = np.searchsorted(self.keys, cidx * _KEY_BASE + entry_dates[rows], side="left")
+        end = self.ends[cidx]
+        last = len(self.closes) - 1
+        entry = np.where(pos < end, self.closes[np.minimum(pos, last)], np.nan)
+        for j, h in enumerate(horizons):
+            exit_pos = pos + h
+            ok = exit_pos < end
+            exit_price = np.where(ok, self.closes[np.minimum(exit_pos, last)], np.nan)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                returns[rows, j] = (exit_price - entry) / entry * 100
+            exit_dates[rows, j] = np.where(ok, self.keys[np.minimum(exit_pos, last)] % _KEY_BASE, -1)
+        return returns, exit_dates
+
+    def forward_returns(self, codes: list[str], entry_dates: np.ndarray, horizons=HORIZONS) -> np.ndarray:
+        """每个 (代码, 入场日) 在各周期后的收益率（%），形状 (信号数, 周期数)，数据不足为 NaN"""
+        return self.forward(codes, entry_dates, horizons)[0]
+
+
+def _horizon_stats(returns: np.ndarray, excess: np.ndarray, *, invert: bool) -> dict:
+    ok = ~np.isnan(returns)
+    count = int(ok.sum())
+    if not count:
+        return {"count": 0, "win_rate": 0, "avg_return": 0, "avg_excess": 0}
+    r = returns[ok]
+    e = excess[ok]
+    e = e[~np.isnan(e)]
+    wins = (r < 0) if invert else (r > 0)
+    return {
+        "count": count,
+        "win_rate": round(float(wins.mean() * 100), 1),
+        "avg_return": round(float(r.mean()), 2),
+        "avg_excess": round(float(e.mean()), 2) if len(e) else 0,
+    }
+
+
+def compute_review(
+    signals: list[dict],
+    klines: dict[str, tuple[np.ndarray, np.ndarray]],
+    benchmark: tuple[np.ndarray, np.ndarray] | None,
+    *,
+    horizons=HORIZONS,
+    as_of: datetime | None = None,
+) -> dict:
+    """计算复盘汇总：买入信号涨为胜、回避信号跌为胜（观望不参与）
+
+    klines: {ETF代码: (dates int32, closes)}；benchmark: 基准的 (dates, closes)
+    """
+    summary = {
+        "as_of": (as_of or datetime.now()).isoformat(),
+        "horizons": {},
+        "by_signal": {},
+        "benchmark": {"name": "沪深300", "secid": "1.000300"},
+    }
+    texts = [s.get("signal", "") for s in signals]
+    is_buy = np.array(["买入" in t for t in texts], dtype=bool)
+    is_avoid = np.array(["回避" in t for t in texts], dtype=bool)
+    chosen = np.flatnonzero(is_buy | is_avoid)
+
+    codes = [signals[i].get("etf_code") or "" for i in chosen]
+    entry_dates = parse_dates([signals[i].get("date", "") for i in chosen])
+    returns = PriceIndex(klines).forward_returns(codes, entry_dates, horizons)
+    if benchmark is not None and len(benchmark[0]):
+        bench = PriceIndex({"": benchmark}).forward_returns([""] * len(chosen), entry_dates, horizons)
+    else:
+        bench = np.full_like(returns, np.nan)
+    excess = returns - bench
+
+    buy = is_buy[chosen]
+    avoid = is_avoid[chosen]
+
+    def group(mask: np.ndarray, invert: bool) -> dict:
+        return {
+            str(h): _horizon_stats(returns[mask, j], excess[mask, j], invert=invert)
+            for j, h in enumerate(horizons)
+        }
+
+    # 总体统计（买入信号，向后兼容）
+    summary["horizons"] = group(buy, False)
+    if buy.any():
+        summary["by_signal"]["买入"] = dict(summary["horizons"])
+    if avoid.any():
+        summary["by_signal"]["回避"] = group(avoid, True)
+    return summary
+
+
+# ---------- 增量复盘 ----------
+
+def signal_group(signal: dict) -> str | None:
+    text = signal.get("signal", "")
+    return next((g for g in SIGNAL_GROUPS if g in text), None)
+
+
+def final_before(now: datetime) -> int:
+    """早于该日期（YYYYMMDD，不含）的日K线已收盘不会再变"""
+    today = int(now.strftime("%Y%m%d"))
+    return today + 1 if now.time() >= MARKET_CLOSE else today
+
+
+def pending_signals(signals: list[dict], horizons=HORIZONS) -> list[int]:
+    """还有未结算周期的复盘信号下标"""
+    keys = [str(h) for h in horizons]
+    return [
+        i for i, s in enumerate(signals)
+        if signal_group(s) and any(k not in (s.get("results") or {}) for k in keys)
+    ]
+
+
+def _apply(aggregates: dict, group: str, key: str, result: dict, sign: int):
+    agg = aggregates.setdefault(group, {}).setdefault(
+        key, {"count": 0, "wins": 0, "sum_return": 0.0, "excess_count": 0, "sum_excess": 0.0},
+    )
+    ret = result["ret"]
+    agg["count"] += sign
+    agg["wins"] += sign * int(ret < 0 if SIGNAL_GROUPS[group] else ret > 0)
+    agg["sum_return"] += sign * ret
+    if result.get("excess") is not None:
+        agg["excess_count"] += sign
+        agg["sum_excess"] += sign * result["excess"]
+
+
+def add_to_aggregates(aggregates: dict, signal: dict, keys=None, *, sign: int = 1):
+    """把信号已结算的结果计入（sign=-1 时移出）累计量；keys 为 None 时取全部已结算周期"""
+    group = signal_group(signal)
+    results = signal.get("results") or {}
+    if not group:
+        return
+    for key in results if keys is None else keys:
+        if key in results:
+            _apply(aggregates, group, key, results[key], sign)
+
+
+def rebuild_aggregates(signals: list[dict]) -> dict:
+    aggregates: dict = {}
+    for s in signals:
+        add_to_aggregates(aggregates, s)
+    return aggregates
+
+
+def settle(
+    signals: list[dict],
+    indices: list[int],
+    klines: dict[str, tuple[np.ndarray, np.ndarray]],
+    benchmark: tuple[np.ndarray, np.ndarray] | None,
+    aggregates: dict,
+    *,
+    before: int,
+    horizons=HORIZONS,
+) -> list[tuple[int, str]]:
+    """计算 indices 对应信号中出场K线已收盘（日期 < before）的周期，写入 results 并计入累计量
+
+    基准缺数据的周期暂不结算，下次运行再算。返回新结算的 (信号下标, 周期) 列表。
+    """
+    if not indices:
+        return []
+    codes = [signals[i].get("etf_code") or "" for i in indices]
+    entry_dates = parse_dates([signals[i].get("date", "") for i in indices])
+    returns, exits = PriceIndex(klines).forward(codes, entry_dates, horizons)
+    if benchmark is not None and len(benchmark[0]):
+        bench = PriceIndex({"": benchmark}).forward_returns([""] * len(indices), entry_dates, horizons)
+    else:
+        bench = np.full_like(returns, np.nan)
+    ready = (exits >= 0) & (exits < before) & ~np.isnan(returns) & ~np.isnan(bench)
+
+    settled: list[tuple[int, str]] = []
+    for row, j in zip(*np.nonzero(ready)):
+        signal = signals[indices[row]]
+        results = signal.setdefault("results", {})
+        key = str(horizons[j])
+        if key in results:
+            continue
+        results[key] = {
+            "ret": round(float(returns[row, j]), 4),
+            "excess": round(float(returns[row, j] - bench[row, j]), 4),
+            "exit_date": int(exits[row, j]),
+        }
+        add_to_aggregates(aggregates, signal, [key])
+        settled.append((indices[row], key))
+    return settled
+
+
+def summarize(aggregates: dict, *, horizons=HORIZONS, as_of: datetime | None = None) -> dict:
+    """累计量 → 与 compute_review 相同结构的复盘汇总"""
+
+    def stats(agg: dict | None) -> dict:
+        if not agg or agg["count"] <= 0:
+            return {"count": 0, "win_rate": 0, "avg_return": 0, "avg_excess": 0}
+        return {
+            "count": agg["count"],
+            "win_rate": round(agg["wins"] / agg["count"] * 100, 1),
+            "avg_return": round(agg["sum_return"] / agg["count"], 2),
+            "avg_excess": round(agg["sum_excess"] / agg["excess_count"], 2) if agg["excess_count"] else 0,
+        }
+
+    summary = {
+        "as_of": (as_of or datetime.now()).isoformat(),
+        "horizons": {},
+        "by_signal": {},
+        "benchmark": {"name": "沪深300", "secid": "1.000300"},
+    }
+    for group in SIGNAL_GROUPS:
+        by_h = {str(h): stats(aggregates.get(group, {}).get(str(h))) for h in horizons}
+        if group == "买入":
+            summary["horizons"] = by_h
+        if aggregates.get(group):
+            summary["by_signal"][group] = dict(by_h)
+    return summary
@@ -0,0 +1,178 @@
+"""板块名映射 - 本地解析 AI 板块名到 etf_master 标准板块
+
+解析顺序：精确匹配 → 别名表（含 AI 学到的映射）→ 字符 n-gram 模糊匹配（板块名 + ETF tags）。
+都未命中的才交给 AI，AI 的映射结果持久化，下次直接命中；
+AI 也映射不了的名称同样记下来，NEGATIVE_TTL_DAYS 天内不再重复询问。
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+from datetime import datetime, timedelta
+
+from loguru import logger
+
+from src.services.storage import CACHE_DIR, load_json, save_json
+
+MAPPING_CACHE_FILE = CACHE_DIR / "sector_mapping.json"
+
+# 常见别名 → 标准板块（可一对多），目标不在当前 sector_list 中的会被忽略
+SECTOR_ALIASES: dict[str, list[str]] = {
+    "人工智能": ["AI"], "算力": ["AI", "通信"], "大模型": ["AI", "软件"],
+    "半导体": ["芯片"], "集成电路": ["芯片"], "消费电子": ["芯片", "消费"],
+    "科技": ["芯片", "软件", "AI"], "计算机": ["软件"], "信创": ["软件"],
+    "券商": ["证券"], "非银金融": ["证券"], "非银": ["证券"], "保险": ["证券"],
+    "金融": ["银行", "证券"], "大金融": ["银行", "证券"],
+    "贵金属": ["黄金"], "白银": ["黄金", "有色"], "有色金属": ["有色"],
+    "稀土": ["有色"], "铜": ["有色"], "工业金属": ["有色"], "稀有金属": ["有色"],
+    "新能源车": ["锂电池", "汽车"], "新能源汽车": ["锂电池", "汽车"], "储能": ["锂电池", "新能源"],
+    "电池": ["锂电池"], "医疗": ["医药"], "创新药": ["医药"], "生物医药": ["医药"], "中药": ["医药"],
+    "恒生科技": ["港股"], "港股通": ["港股"], "中概互联": ["互联网", "港股"],
+    "原油": ["石油"], "油气": ["石油"], "能源": ["石油", "煤炭"],
+    "国防军工": ["军工"], "航天": ["军工"], "卫星": ["军工"], "低空经济": ["军工"],
+    "人形机器人": ["机器人"], "智能制造": ["机器人"],
+    "食品饮料": ["白酒", "消费"], "酒": ["白酒"], "大消费": ["消费"],
+    "地产": ["房地产"], "电网": ["电力"], "公用事业": ["电力"], "核电": ["电力"],
+    "5G": ["通信"], "光通信": ["通信"], "影视": ["传媒"], "文化传媒": ["传媒"],
+    "农产品": ["农业"], "养殖": ["农业"], "猪肉": ["农业"], "种业": ["农业"],
+    "化工新材料": ["化工"], "基础化工": ["化工"],
+}
+
+# 模糊匹配的最低相似度（Dice 系数）
+FUZZY_THRESHOLD = 0.6
+# tag 命中的折扣（tag 比板块名本身弱一档）
+TAG_WEIGHT = 0.85
+# tag 在所属板块的占比达到该值才视为板块专属关键词
+TAG_PURITY = 0.8
+# AI 无法映射的名称缓存天数（标准板块列表会变，过期后重新询问）
+NEGATIVE_TTL_DAYS = 3
+
+
+def _ngrams(text: str, n: int = 2) -> set[str]:
+    text = text.lower().replace(" ", "")
+    if len(text) <= n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def _dice(a: set[str], b: set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+class SectorResolver:
+    """AI 板块名 → 标准板块的本地解析器"""
+
+    def __init__(self, master_sectors: list[str], etfs: dict | None = None, cache_path=MAPPING_CACHE_FILE):
+        self.master_sectors = list(master_sectors)
+        self._master_set = set(master_sectors)
+        self.cache_path = cache_path
+        self._learned: dict[str, dict] = load_json(cache_path, {}) or {}
+
+        # 候选词 → 标准板块：板块名本身 + ETF tags（tag 指向其 ETF 所属板块中最常见的一个）
+        tag_votes: dict[str, Counter] = {}
+        for info in (etfs or {}).values():
+            sector = info.get("sector", "")
+            if sector not in self._master_set:
+                continue
+            for tag in info.get("tags") or []:
+                tag_votes.setdefault(tag, Counter())[sector] += 1
+        self._terms: list[tuple[str, set[str], str, float]] = [
+            (s, _ngrams(s), s, 1.0) for s in self.master_sectors
+        ]
+        for tag, votes in tag_votes.items():
+            self._terms.append((tag, _ngrams(tag), votes.most_common(1)[0][0], TAG_WEIGHT))
+        # 只属于单一板块的 tag（如"晶圆"）才适合当新闻筛选关键词，"龙头""科技"这类跨板块 tag 不用
+        self._specific_tags: dict[str, str] = {
+            tag: votes.most_common(1)[0][0] for tag, votes in tag_votes.items()
+            if votes.most_common(1)[0][1] >= TAG_PURITY * sum(votes.values())
+        }
+
+    def _valid(self, targets: list[str]) -> list[str]:
+        return [t for t in targets if t in self._master_set]
+
+    def resolve(self, name: str) -> list[str] | None:
+        """本地解析，无法解析返回 None"""
+        if name in self._master_set:
+            return [name]
+
+        targets = self._valid(SECTOR_ALIASES.get(name, []))
+        if targets:
+            return targets
+        learned = self._learned.get(name)
+        if learned:
+            targets = self._valid(learned.get("targets", []))
+            if targets:
+                return targets
+
+        return self._fuzzy(name)
+
+    def _fuzzy(self, name: str) -> list[str] | None:
+        grams = _ngrams(name)
+        scores: dict[str, float] = {}
+        for term, term_grams, sector, weight in self._terms:
+            # 包含关系（如 "AI应用" ⊃ "AI"）视为强匹配
+            if len(term) >= 2 and len(name) >= 2 and (term in name or name in term):
+                score = weight
+            else:
+                score = _dice(grams, term_grams) * weight
+            if score >= FUZZY_THRESHOLD and score > scores.get(sector, 0):
+                scores[sector] = score
+        if not scores:
+            return None
+        ranked = sorted(scores.items(), key=lambda x: -x[1])
+        best = ranked[0][1]
+        return [s for s, sc in ranked if sc >= best - 0.1][:3]
+
+    def keywords(self, name: str) -> set[str]:
+        """板块相关关键词（板块名 + 指向同一标准板块的别名/学到的名称 + ETF tags），用于本地筛选新闻"""
+        targets = set(self.resolve(name) or [])
+        words = {name} | targets
+        words.update(alias for alias, ts in SECTOR_ALIASES.items() if targets & set(ts))
+        words.update(n for n, info in self._learned.items() if targets & set(info.get("targets", [])))
+        words.update(tag for tag, sector in self._specific_tags.items() if sector in targets)
+        return {w for w in words if len(w) >= 2}
+
+    def _known_unmapped(self, name: str) -> bool:
+        """AI 近期已确认无法映射"""
+        learned = self._learned.get(name)
+        if not learned or learned.get("targets"):
+            return False
+        try:
+            learned_at = datetime.strptime(learned.get("learned_at", ""), "%Y-%m-%d")
+        except ValueError:
+            return False
+        return datetime.now() - learned_at < timedelta(days=NEGATIVE_TTL_DAYS)
+
+    def resolve_all(self, names: list[str]) -> tuple[dict[str, list[str]], list[str]]:
+        """批量解析，返回 (已解析映射, 未解析名称)；AI 近期确认无法映射的名称映射为空列表"""
+        mapping: dict[str, list[str]] = {}
+        unresolved: list[str] = []
+        for name in names:
+            targets = self.resolve(name)
+            if targets:
+                mapping[name] = targets
+            elif self._known_unmapped(name):
+                mapping[name] = []
+            else:
+                unresolved.append(name)
+        return mapping, unresolved
+
+    def learn(self, mapping: dict[str, list[str]]):
+        """持久化 AI 给出的映射（只保留合法的标准板块）；无合法板块的记为无法映射"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        changed = False
+        for name, targets in mapping.items():
+            if name in self._master_set or not isinstance(targets, list):
+                continue
+            valid = self._valid(targets)
+            if not valid and self._learned.get(name, {}).get("targets"):
+                continue  # 已有正向映射，不被一次空结果覆盖
+            self._learned[name] = {"targets": valid, "learned_at": today}
+            changed = True
+        if changed:
+            try:
+                save_json(self.cache_path, self._learned, indent=2)
+            except Exception as e:
+                logger.warning(f"保存板块映射缓存失败: {e}")
@@ -0,0 +1,207 @@
+"""复盘信号日志 - 追加写 + 按月分段 + 索引，保留全部历史
+
+目录结构（DATA_DIR/signals，随 R2 同步）：
+    log.ndjson        追加写的事件日志：{"op": "add", "signal": {...}} / {"op": "settle", "id", "h", "result"}
+    YYYY-MM.ndjson    按信号月份压实后的分段，每行一条信号（含已结算的 results）
+    index.json        每月信号数/未结算数、板块 → 月份、代码 → 月份、复盘累计量
+
+每次运行只追加几行日志；日志超过 COMPACT_LINES 行或含上月事件时合并进对应月份分段。
+合并先写分段再清空日志，中途中断重跑时重复应用事件是幂等的。
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from loguru import logger
+
+from src.services.review_engine import HORIZONS, add_to_aggregates, signal_group
+from src.services.storage import DATA_DIR, load_json, save_json
+
+SIGNALS_DIR = DATA_DIR / "signals"
+# 日志达到该行数时压实
+COMPACT_LINES = 500
+
+
+def signal_id(signal: dict) -> str:
+    """同一天同板块同ETF只记一次，日期在前便于按月归档"""
+    return f"{signal.get('date', '')}|{signal.get('sector', '')}|{signal.get('etf_code', '')}"
+
+
+def _settled(signal: dict) -> bool:
+    results = signal.get("results") or {}
+    return all(str(h) in results for h in HORIZONS)
+
+
+def _read_ndjson(path: Path) -> list[dict]:
+    if not path.exists():
+        return []
+    rows = []
+    for line in path.read_text().splitlines():
+        if not line.strip():
+            continue
+        try:
+            rows.append(json.loads(line))
+        except json.JSONDecodeError:
+            # 追加中断留下的半行
+            logger.warning(f"跳过 {path.name} 中损坏的一行")
+    return rows
+
+
+def _write_ndjson(path: Path, rows: list[dict]):
+    """原子写入 NDJSON"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        os.replace(tmp, path)
+    except Exception:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def _apply(signals: dict[str, dict], event: dict):
+    if event.get("op") == "add":
+        sig = event["signal"]
+        signals.setdefault(sig["id"], sig)
+    elif event.get("op") == "settle" and event.get("id") in signals:
+        signals[event["id"]].setdefault("results", {})[event["h"]] = event["result"]
+
+
+class SignalStore:
+    """复盘信号存储；修改后调用 save() 写索引"""
+
+    def __init__(self, directory: Path = SIGNALS_DIR):
+        self.directory = directory
+        self.log_path = directory / "log.ndjson"
+        self.index_path = directory / "index.json"
+        index = load_json(self.index_path, {}) or {}
+        # {"YYYY-MM": {"count": 信号数, "pending": 未结算完的复盘信号数}}
+        self.months: dict[str, dict[str, int]] = index.get("months", {})
+        self.sectors: dict[str, list[str]] = index.get("sectors", {})
+        self.codes: dict[str, list[str]] = index.get("codes", {})
+        # 全部历史的复盘累计量（review_engine.add_to_aggregates 的结构）
+        self.aggregates: dict = index.get("aggregates", {})
+
+    @property
+    def total(self) -> int:
+        return sum(m["count"] for m in self.months.values())
+
+    def _segment_path(self, month: str) -> Path:
+        return self.directory / f"{month}.ndjson"
+
+    def _append(self, events: list[dict]):
+        if not events:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with self.log_path.open("a") as f:
+            for event in events:
+                f.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+    def _log_events(self, month: str | None = None) -> list[dict]:
+        events = _read_ndjson(self.log_path)
+        if month is None:
+            return events
+        return [e for e in events if (e["signal"]["id"] if e.get("op") == "add" else e.get("id", ""))[:7] == month]
+
+    def load_month(self, month: str) -> dict[str, dict]:
+        """某月的全部信号（分段 + 日志中尚未压实的事件），按 id"""
+        signals = {s["id"]: s for s in _read_ndjson(self._segment_path(month))}
+        for event in self._log_events(month):
+            _apply(signals, event)
+        return signals
+
+    def add_many(self, signals: list[dict]) -> int:
+        """追加信号（按 signal_id 去重），返回新增条数；已带 results 的同时计入累计量"""
+        existing: dict[str, set[str]] = {}
+        events = []
+        for sig in signals:
+            sig = {**sig, "id": signal_id(sig)}
+            month = sig["id"][:7]
+            if month not in existing:
+                existing[month] = set(self.load_month(month)) if month in self.months else set()
+            if sig["id"] in existing[month]:
+                continue
+            existing[month].add(sig["id"])
+            events.append({"op": "add", "signal": sig})
+
+            stats = self.months.setdefault(month, {"count": 0, "pending": 0})
+            stats["count"] += 1
+            stats["pending"] += bool(signal_group(sig)) and not _settled(sig)
+            for table, key in ((self.sectors, sig.get("sector")), (self.codes, sig.get("etf_code"))):
+                if key and month not in table.setdefault(key, []):
+                    table[key].append(month)
+            add_to_aggregates(self.aggregates, sig)
+        self._append(events)
+        return len(events)
+
+    def pending(self, since: str) -> list[dict]:
+        """日期不早于 since 且还有未结算周期的复盘信号"""
+        out = []
+        for month in sorted(m for m, stats in self.months.items() if stats["pending"] > 0 and m >= since[:7]):
+            out.extend(
+                s for s in self.load_month(month).values()
+                if s.get("date", "") >= since and signal_group(s) and not _settled(s)
+            )
+        return out
+
+    def record_settled(self, signals: list[dict], settled: list[tuple[int, str]]):
+        """把 review_engine.settle() 新结算的结果写入日志（累计量已由 settle 更新）"""
+        events = [
+            {"op": "settle", "id": signals[i]["id"], "h": key, "result": signals[i]["results"][key]}
+            for i, key in settled
+        ]
+        for i in {i for i, _ in settled}:
+            if _settled(signals[i]):
+                self.months[signals[i]["id"][:7]]["pending"] -= 1
+        self._append(events)
+
+    def query(
+        self, *, sector: str | None = None, code: str | None = None,
+        start: str | None = None, end: str | None = None,
+    ) -> list[dict]:
+        """按板块 / ETF 代码 / 日期范围查询信号（先用索引选出月份再读分段）"""
+        months = set(self.months)
+        if sector is not None:
+            months &= set(self.sectors.get(sector, []))
+        if code is not None:
+            months &= set(self.codes.get(code, []))
+        months = {m for m in months if (not start or m >= start[:7]) and (not end or m <= end[:7])}
+        out = []
+        for month in sorted(months):
+            out.extend(
+                s for s in sorted(self.load_month(month).values(), key=lambda s: s["id"])
+                if (sector is None or s.get("sector") == sector)
+                and (code is None or s.get("etf_code") == code)
+                and (not start or s.get("date", "") >= start)
+                and (not end or s.get("date", "") <= end)
+            )
+        return out
+
+    def compact(self, current_month: str, *, force: bool = False) -> bool:
+        """日志行数达到阈值、含上月事件或 force 时，把日志合并进月份分段并清空"""
+        events = self._log_events()
+        if not events:
+            return False
+        months = {(e["signal"]["id"] if e.get("op") == "add" else e.get("id", ""))[:7] for e in events}
+        if not force and len(events) < COMPACT_LINES and months <= {current_month}:
+            return False
+        for month in sorted(months):
+            signals = self.load_month(month)
+            _write_ndjson(self._segment_path(month), sorted(signals.values(), key=lambda s: s["id"]))
+        self.log_path.write_text("")
+        logger.info(f"🗜️ 信号日志压实: {len(events)} 条事件 → {len(months)} 个月份分段")
+        return True
+
+    def save(self):
+        save_json(self.index_path, {
+            "months": dict(sorted(self.months.items())),
+            "sectors": self.sectors,
+            "codes": self.codes,
+            "aggregates": self.aggregates,
+        })
@@ -0,0 +1,40 @@
+"""本地持久化工具 - 缓存目录 + JSON 原子读写"""
+
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any
+
+from loguru import logger
+
+# 数据目录（与 worker_simple.DATA_DIR 一致）
+DATA_DIR = Path(__file__).parent.parent / "data"
+# 跨运行持久化的缓存目录（CI 中可整体缓存）
+CACHE_DIR = DATA_DIR / "cache"
+
+
+def load_json(path: Path, default: Any = None) -> Any:
+    """读取 JSON 文件，不存在或损坏时返回 default"""
+    if not path.exists():
+        return default
+    try:
+        return json.loads(path.read_text())
+    except Exception as e:
+        logger.warning(f"读取 {path.name} 失败: {e}")
+        return default
+
+
+def save_json(path: Path, data: Any, *, indent: int | None = None):
+    """原子写入 JSON（先写临时文件再替换，避免中断时留下半个文件）"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+        os.replace(tmp, path)
+    except Exception:
+        Path(tmp).unlink(missing_ok=True)
+        raise
@@ -0,0 +1,186 @@
+"""AI 调用遥测 - 按流水线阶段记录 tokens / 延迟 / 重试 / 端点 / 费用
+
+每次调用追加一行到本次运行的 NDJSON 文件（metrics/runs/<run_id>.ndjson），
+运行结束时 flush()：打印按阶段的汇总，并累加到按日、按月的 rollup（metrics/rollup.json）。
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from loguru import logger
+
+from src.services.storage import CACHE_DIR, load_json, save_json
+
+METRICS_DIR = CACHE_DIR / "metrics"
+# 按日 rollup 保留天数（按月的全部保留）
+ROLLUP_KEEP_DAYS = 90
+# 运行明细文件保留个数
+RUN_FILES_KEEP = 200
+# prompt cache 读/写相对输入单价的倍数
+CACHE_READ_PRICE_RATIO = 0.1
+CACHE_WRITE_PRICE_RATIO = 1.25
+# 批处理（Message Batches）相对实时调用的价格倍数
+BATCH_PRICE_RATIO = 0.5
+
+_SUM_FIELDS = (
+    "calls", "errors", "retries", "fallback_calls",
+    "input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens",
+    "latency_s", "cost_usd",
+)
+
+
+def parse_usage(usage: dict[str, Any] | None) -> dict[str, int]:
+    """API usage 字段 → 统一的 token 计数；不支持缓存的端点没有 cache_* 字段，按 0 计"""
+    usage = usage or {}
+    return {
+        "input_tokens": int(usage.get("input_tokens") or 0),
+        "output_tokens": int(usage.get("output_tokens") or 0),
+        "cache_read_tokens": int(usage.get("cache_read_input_tokens") or 0),
+        "cache_write_tokens": int(usage.get("cache_creation_input_tokens") or 0),
+    }
+
+
+def estimate_cost(usage: dict[str, int], endpoint: str = "primary") -> float:
+    """按配置的单价（美元 / 百万 tokens）估算费用"""
+    from src.config import settings
+
+    if endpoint == "fallback":
+        price_in, price_out = settings.ai_fallback_price_input, settings.ai_fallback_price_output
+    else:
+        price_in, price_out = settings.ai_price_input, settings.ai_price_output
+    cost = (
+        usage.get("input_tokens", 0) * price_in
+        + usage.get("cache_read_tokens", 0) * price_in * CACHE_READ_PRICE_RATIO
+        + usage.get("cache_write_tokens", 0) * price_in * CACHE_WRITE_PRICE_RATIO
+        + usage.get("output_tokens", 0) * price_out
+    )
+    if endpoint == "batch":
+        cost *= BATCH_PRICE_RATIO
+    return cost / 1e6
+
+
+@dataclass
+class CallRecord:
+    stage: str
+    endpoint: str  # primary / fallback / batch
+    model: str
+    status: str  # ok / refused / error / cancelled
+    attempts: int
+    latency_s: float
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
+    cost_usd: float = 0.0
+    ts: str = field(default_factory=lambda: datetime.now().isoformat(timespec="seconds"))
+
+
+def _empty() -> dict[str, float]:
+    return dict.fromkeys(_SUM_FIELDS, 0)
+
+
+def _accumulate(target: dict[str, float], rec: CallRecord):
+    target["calls"] += 1
+    target["errors"] += rec.status not in ("ok", "cancelled")
+    target["retries"] += max(rec.attempts - 1, 0)
+    target["fallback_calls"] += rec.endpoint == "fallback"
+    for key in ("input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens",
+                "latency_s", "cost_usd"):
+        target[key] += getattr(rec, key)
+
+
+def _merge(target: dict[str, float], source: dict[str, float]):
+    for key in _SUM_FIELDS:
+        target[key] = round(target.get(key, 0) + source.get(key, 0), 6)
+
+
+class Telemetry:
+    """进程内收集 AI 调用记录；record() 即时落盘，flush() 汇总并写 rollup"""
+
+    def __init__(self, metrics_dir: Path = METRICS_DIR, run_id: str | None = None):
+        self.metrics_dir = metrics_dir
+        self.run_id = run_id or os.getenv("GITHUB_RUN_ID") or datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.records: list[CallRecord] = []
+
+    @property
+    def run_file(self) -> Path:
+        return self.metrics_dir / "runs" / f"{self.run_id}.ndjson"
+
+    def record(
+        self, *, stage: str, endpoint: str, model: str, status: str, attempts: int,
+        latency_s: float, usage: dict[str, int] | None = None,
+    ) -> CallRecord:
+        usage = usage or {}
+        rec = CallRecord(
+            stage=stage or "other", endpoint=endpoint, model=model, status=status,
+            attempts=attempts, latency_s=round(latency_s, 3),
+            cost_usd=round(estimate_cost(usage, endpoint), 6) if usage else 0.0,
+            **usage,
+        )
+        self.records.append(rec)
+        try:
+            self.run_file.parent.mkdir(parents=True, exist_ok=True)
+            with self.run_file.open("a") as f:
+                f.write(json.dumps(asdict(rec), ensure_ascii=False) + "\n")
+        except Exception as e:
+            logger.warning(f"写入 AI 调用记录失败: {e}")
+        return rec
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """按阶段汇总本次运行，另含 "total" 合计"""
+        stages: dict[str, dict[str, float]] = defaultdict(_empty)
+        for rec in self.records:
+            _accumulate(stages[rec.stage], rec)
+            _accumulate(stages["total"], rec)
+        return dict(stages)
+
+    def flush(self):
+        """打印本次运行汇总，累加到按日/按月 rollup；没有调用时什么也不做"""
+        if not self.records:
+            return
+        summary = self.summary()
+        lines = [
+            f"  {stage}: {s['calls']} 次（失败 {s['errors']} / 重试 {s['retries']} / 降级 {s['fallback_calls']}）"
+            f" in={s['input_tokens']} out={s['output_tokens']} cache_read={s['cache_read_tokens']}"
+            f" 耗时 {s['latency_s']:.1f}s ${s['cost_usd']:.4f}"
+            for stage, s in sorted(summary.items(), key=lambda x: (x[0] == "total", -x[1]["cost_usd"]))
+        ]
+        logger.info("📊 本次 AI 调用汇总:\n" + "\n".join(lines))
+
+        rollup_file = self.metrics_dir / "rollup.json"
+        rollup = load_json(rollup_file, {}) or {}
+        for rec in self.records:
+            day, month = rec.ts[:10], rec.ts[:7]
+            for period, key in (("daily", day), ("monthly", month)):
+                bucket = rollup.setdefault(period, {}).setdefault(key, {})
+                one = _empty()
+                _accumulate(one, rec)
+                _merge(bucket.setdefault(rec.stage, {}), one)
+                _merge(bucket.setdefault("total", {}), one)
+        rollup["daily"] = dict(sorted(rollup.get("daily", {}).items())[-ROLLUP_KEEP_DAYS:])
+        try:
+            save_json(rollup_file, rollup, indent=2)
+            runs = sorted((self.metrics_dir / "runs").glob("*.ndjson"), key=lambda p: p.stat().st_mtime)
+            for old in runs[:-RUN_FILES_KEEP]:
+                old.unlink(missing_ok=True)
+        except Exception as e:
+            logger.warning(f"保存 AI 调用 rollup 失败: {e}")
+
+        today = rollup["daily"].get(datetime.now().strftime("%Y-%m-%d"), {}).get("total", {})
+        month = rollup["monthly"].get(datetime.now().strftime("%Y-%m"), {}).get("total", {})
+        logger.info(
+            f"📊 今日累计 {today.get('calls', 0)} 次 / ${today.get('cost_usd', 0):.4f}，"
+            f"本月累计 {month.get('calls', 0)} 次 / ${month.get('cost_usd', 0):.4f}"
+        )
+        self.records.clear()
+
+
+# 进程内共享
+telemetry = Telemetry()
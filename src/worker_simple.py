@@ -5,12 +5,21 @@ import json
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
 from collections import Counter
+import numpy as np
 from loguru import logger
 
 from src.config import settings
 from src.collectors import NewsAggregator
 from src.analyzers.realtime import analyze
+from src.services.ai_client import latency_tracker
+from src.services.cache import log_cache_stats
+from src.services.host_limit import host_limiter
 from src.services.fund_service import fund_service
+from src.services.review_engine import HORIZONS, final_before, settle, summarize
+from src.services.sector_mapper import SectorResolver
+from src.services.signal_store import SignalStore
+from src.services.storage import load_json, save_json
+from src.services.telemetry import telemetry
 
 # 输出目录
 DATA_DIR = Path(__file__).parent / "data"
@@ -21,8 +30,10 @@ ARCHIVE_DIR = DATA_DIR / "archive"
 
 ARCHIVE_DIR.mkdir(exist_ok=True)
 
-# 信号复盘数据
+# 信号复盘汇总（前端读取的小文件；信号明细在 DATA_DIR/signals）
 REVIEW_FILE = DATA_DIR / "review.json"
+# 超过该天数仍未结算的信号不再尝试（停牌/退市等拿不到K线）
+REVIEW_PENDING_DAYS = 60
 
 
 def _parse_date(date_str: str) -> datetime | None:
@@ -39,25 +50,10 @@ def _days_between(now: datetime, date_str: str) -> int | None:
     return (now.replace(tzinfo=None) - d).days
 
 
-def _pick_trading_index(dates: list[str], entry_date: str) -> int | None:
-    """选择不早于 entry_date 的第一个交易日索引"""
-    for i, d in enumerate(dates):
-        if d >= entry_date:
-            return i
-    return None
-
-
-def load_review_data() -> dict:
-    if REVIEW_FILE.exists():
-        try:
-            return json.loads(REVIEW_FILE.read_text())
-        except Exception as e:
-            logger.warning(f"⚠️ review.json 解析失败: {e}")
-    return {"signals": []}
-
-
-def save_review_data(data: dict):
-    REVIEW_FILE.write_text(json.dumps(data, ensure_ascii=False, indent=2))
+def load_legacy_signals() -> list[dict]:
+    """旧版 review.json 中的全部信号（迁移到信号日志用）"""
+    data = load_json(REVIEW_FILE, {}) or {}
+    return data.get("signals", []) if isinstance(data, dict) else []
 
 
 def _build_code_to_sector(etf_master: dict | None) -> dict[str, str]:
@@ -72,25 +68,24 @@ def _build_code_to_sector(etf_master: dict | None) -> dict[str, str]:
 
 
 async def update_review(result: dict, beijing_tz, *, etf_master: dict | None = None) -> dict:
-    """更新信号复盘数据并返回汇总指标"""
-    data = load_review_data()
-    signals: list[dict] = data.get("signals", [])
-
+    """记录今日信号、结算到期的复盘周期，返回汇总指标"""
+    store = SignalStore()
     now = datetime.now(beijing_tz)
 
-    # 构建去重集合（基于已有信号）
-    existing_keys: set[tuple[str, str, str]] = set()
-    for s in signals:
-        existing_keys.add((s.get("date", ""), s.get("sector", ""), s.get("etf_code", "")))
+    # 首次运行：把旧版 review.json 里的信号导入信号日志
+    if not store.months:
+        legacy = load_legacy_signals()
+        if legacy:
+            imported = store.add_many(legacy)
+            logger.info(f"📊 从 review.json 导入 {imported} 条历史信号")
 
     # ETF代码→标准板块名 反查表
     code_to_sector = _build_code_to_sector(etf_master)
 
-    # 添加今日信号（记录所有信号类型：买入/观望/回避）
+    # 添加今日信号（记录所有信号类型：买入/观望/回避），同一天同板块同ETF只记一次
     today = now.strftime("%Y-%m-%d")
-    sectors = result.get("sectors", [])
-    new_count = 0
-    for sector in sectors:
+    candidates = []
+    for sector in result.get("sectors", []):
         etfs = sector.get("etfs") or []
         if not etfs:
             continue
@@ -103,12 +98,7 @@ async def update_review(result: dict, beijing_tz, *, etf_master: dict | None = N
             continue
         # 板块名归一化：优先用 etf_master 的标准名
         sector_name = code_to_sector.get(code, sector.get("name", ""))
-        # 去重：同一天同板块同ETF只记一次
-        key = (today, sector_name, code)
-        if key in existing_keys:
-            continue
-        existing_keys.add(key)
-        signals.append({
+        candidates.append({
             "date": today,
             "sector": sector_name,
             "type": "overall",
@@ -116,97 +106,36 @@ async def update_review(result: dict, beijing_tz, *, etf_master: dict | None = N
             "etf_code": code,
             "entry_price": price,
         })
-        new_count += 1
-
+    new_count = store.add_many(candidates)
     if new_count:
         logger.info(f"📊 新增 {new_count} 条信号")
 
-    # 只保留最近90天的信号，防止无限增长
-    cutoff = (now - timedelta(days=90)).strftime("%Y-%m-%d")
-    signals = [s for s in signals if s.get("date", "") >= cutoff]
-
-    data["signals"] = signals
-    data["updated_at"] = now.isoformat()
-    save_review_data(data)
-
-    # 计算复盘指标（1/3/7/20 交易日），按信号类型分组
-    horizons = [1, 3, 7, 20]
-    summary = {
-        "as_of": now.isoformat(),
-        "horizons": {},
-        "by_signal": {},
-        "benchmark": {"name": "沪深300", "secid": "1.000300"},
-    }
-
-    # 只对买入和回避信号计算胜率（观望不参与）
-    buy_signals = [s for s in signals if "买入" in s.get("signal", "")]
-    avoid_signals = [s for s in signals if "回避" in s.get("signal", "")]
-
-    benchmark_kline = await fund_service.get_kline_date_map(secid="1.000300")
-    bench_dates = [d for d, _ in benchmark_kline]
-    bench_closes = [c for _, c in benchmark_kline]
-
-    codes = list({s.get("etf_code") for s in signals if s.get("etf_code")})
-    code_to_kline: dict[str, list[tuple[str, float]]] = {}
-    if codes:
-        sem = asyncio.Semaphore(5)
-
-        async def fetch_kline(c: str):
-            async with sem:
-                return await fund_service.get_kline_date_map(code=c)
-
-        results = await asyncio.gather(*(fetch_kline(c) for c in codes))
-        code_to_kline = dict(zip(codes, results))
-
-    def _calc_horizon(sig_list: list[dict], h: int, *, invert: bool = False) -> dict:
-        """计算某组信号在 h 个交易日后的胜率。invert=True 时跌为胜（回避信号）"""
-        returns = []
-        excess = []
-        for s in sig_list:
-            entry_date = s.get("date", "")
-            code = s.get("etf_code")
-            kline = code_to_kline.get(code, [])
-            if not kline:
-                continue
-            dates = [d for d, _ in kline]
-            closes = [c for _, c in kline]
-            idx = _pick_trading_index(dates, entry_date)
-            if idx is None:
-                continue
-            exit_idx = idx + h
-            if exit_idx >= len(closes):
-                continue
-            entry = closes[idx]
-            exit_price = closes[exit_idx]
-            ret = (exit_price - entry) / entry * 100
-            returns.append(ret)
-
-            if bench_dates and bench_closes:
-                bidx = _pick_trading_index(bench_dates, entry_date)
-                if bidx is not None and bidx + h < len(bench_closes):
-                    bret = (bench_closes[bidx + h] - bench_closes[bidx]) / bench_closes[bidx] * 100
-                    excess.append(ret - bret)
-        if returns:
-            win_rate = sum(1 for r in returns if (r < 0 if invert else r > 0)) / len(returns) * 100
-            avg_ret = sum(returns) / len(returns)
-            return {
-                "count": len(returns),
-                "win_rate": round(win_rate, 1),
-                "avg_return": round(avg_ret, 2),
-                "avg_excess": round(sum(excess) / len(excess), 2) if excess else 0,
-            }
-        return {"count": 0, "win_rate": 0, "avg_return": 0, "avg_excess": 0}
-
-    # 总体统计（买入信号，向后兼容）
-    for h in horizons:
-        summary["horizons"][str(h)] = _calc_horizon(buy_signals, h)
-
-    # 按信号类型分组统计
-    if buy_signals:
-        summary["by_signal"]["买入"] = {str(h): _calc_horizon(buy_signals, h) for h in horizons}
-    if avoid_signals:
-        summary["by_signal"]["回避"] = {str(h): _calc_horizon(avoid_signals, h, invert=True) for h in horizons}
-
+    # 只计算还有未结算周期的信号，K线也只取这些信号涉及的代码
+    since = (now - timedelta(days=REVIEW_PENDING_DAYS)).strftime("%Y-%m-%d")
+    pending = store.pending(since)
+    if pending:
+        # K线长度覆盖最早的未结算信号 + 最长复盘周期
+        oldest = min((s["date"] for s in pending if _parse_date(s.get("date", ""))), default=today)
+        bars = max(200, int(np.busday_count(oldest, today)) + max(HORIZONS) + 5)
+
+        benchmark = await fund_service.get_kline_arrays(secid="1.000300", limit=bars)
+
+        codes = list({s.get("etf_code") for s in pending if s.get("etf_code")})
+        # 实际请求并发由域名自适应上限控制
+        results = await asyncio.gather(*(fund_service.get_kline_arrays(code=c, limit=bars) for c in codes))
+        settled = settle(
+            pending, list(range(len(pending))), dict(zip(codes, results)), benchmark, store.aggregates,
+            before=final_before(now),
+        )
+        store.record_settled(pending, settled)
+        logger.info(f"📊 复盘: {len(pending)} 条信号待结算（{len(codes)} 个代码），本次结算 {len(settled)} 个周期")
+
+    store.compact(now.strftime("%Y-%m"))
+    store.save()
+
+    # 复盘指标（1/3/7/20 交易日），按信号类型分组；导出小文件给前端
+    summary = summarize(store.aggregates, as_of=now)
+    save_json(REVIEW_FILE, {**summary, "total_signals": store.total, "updated_at": now.isoformat()}, indent=2)
     return summary
 
 
@@ -474,6 +403,7 @@ async def save_news(news_items, beijing_tz):
     news_list = [
         {
             "title": item.title,
+            **({"title_zh": item.summary_zh} if item.summary_zh else {}),
             "source": item.source,
             "url": item.url,
             "published_at": item.published_at.isoformat() if item.published_at else None,
@@ -624,6 +554,7 @@ async def ai_map_to_master_sectors(
             messages=[{"role": "user", "content": prompt}],
             max_tokens=1024,
             timeout=60,
+            stage="sector_map",
         ))
         return parse_json_with_repair(text)
     except Exception as e:
@@ -649,14 +580,24 @@ async def enrich_sectors_with_etfs(result: dict):
     etfs_data = etf_master.get("etfs", {})
     logger.info(f"📊 ETF主数据: {len(etfs_data)} 个ETF, {len(master_sectors)} 个板块")
 
-    # AI 将分析板块映射到 master 标准板块
+    # 本地解析板块名（精确/别名/模糊），未解析的再交给 AI 映射
     ai_sector_names = [s["name"] for s in sectors]
-    logger.info(f"🤖 AI 映射板块: {ai_sector_names}")
-    sector_mapping = await ai_map_to_master_sectors(ai_sector_names, master_sectors)
-
-    if not sector_mapping:
-        logger.warning("⚠️ AI映射失败，使用直接匹配")
-        sector_mapping = {name: [name] if name in sector_index else [] for name in ai_sector_names}
+    resolver = SectorResolver(master_sectors, etfs_data)
+    sector_mapping, unresolved = resolver.resolve_all(ai_sector_names)
+    known_unmapped = [n for n, t in sector_mapping.items() if not t]
+    logger.info(f"🧭 本地映射 {len(sector_mapping) - len(known_unmapped)}/{len(ai_sector_names)} 个板块")
+    if known_unmapped:
+        logger.info(f"⏭️ 近期 AI 已确认无法映射，跳过: {known_unmapped}")
+
+    if unresolved:
+        logger.info(f"🤖 AI 映射板块: {unresolved}")
+        ai_mapping = await ai_map_to_master_sectors(unresolved, master_sectors)
+        if ai_mapping:
+            resolver.learn(ai_mapping)
+        else:
+            logger.warning("⚠️ AI映射失败，未解析板块跳过")
+        for name in unresolved:
+            sector_mapping[name] = [m for m in ai_mapping.get(name, []) if m in sector_index]
 
     # 根据映射收集 ETF 代码（合并多个板块）
     sector_etf_codes: dict[str, list[str]] = {}
@@ -701,4 +642,10 @@ async def enrich_sectors_with_etfs(result: dict):
 
 
 if __name__ == "__main__":
-    asyncio.run(run())
+    try:
+        asyncio.run(run())
+    finally:
+        telemetry.flush()
+        log_cache_stats()
+        host_limiter.save()
+        latency_tracker.save()
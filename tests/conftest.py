@@ -0,0 +1,10 @@
+import pytest
+
+from src.services.host_limit import host_limiter
+
+
+@pytest.fixture(autouse=True)
+def isolated_host_limits(monkeypatch):
+    """测试里不读写真实的域名并发状态，每个测试从初始上限开始"""
+    monkeypatch.setattr(host_limiter, "path", None)
+    monkeypatch.setattr(host_limiter, "hosts", {})
@@ -0,0 +1,78 @@
+"""离线批处理队列测试（基于本地 mock 服务）"""
+
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+from src.services import ai_batch, ai_client
+from src.services.ai_batch import BatchQueue
+from src.services.ai_client import AIRequest, LatencyTracker
+from src.services.telemetry import Telemetry
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
+from mock_llm_server import MockConfig, MockLLMServer  # noqa: E402
+
+
+def _req(text: str) -> AIRequest:
+    return AIRequest(messages=[{"role": "user", "content": text}], stage="test")
+
+
+def _patches(server: MockLLMServer, tmp_path: Path, metrics: Telemetry):
+    return [
+        patch.object(ai_client.settings, "claude_base_url", server.url),
+        patch.object(ai_client.settings, "ai_fallback_base_url", ""),
+        patch.object(ai_client, "latency_tracker", LatencyTracker(tmp_path / "lat.json")),
+        patch.object(ai_client, "telemetry", metrics),
+        patch.object(ai_batch, "telemetry", metrics),
+    ]
+
+
+async def test_submit_resume_and_idempotent_ids(tmp_path):
+    server = MockLLMServer(MockConfig(latency=0, batch_delay=0.2)).start()
+    metrics = Telemetry(tmp_path / "metrics", run_id="t")
+    patches = _patches(server, tmp_path, metrics)
+    for p in patches:
+        p.start()
+    try:
+        queue = BatchQueue("t", directory=tmp_path)
+        ids = [queue.add(_req("甲")), queue.add(_req("乙")), queue.add(_req("甲"))]
+        assert ids[0] == ids[2]
+        queue.save()
+        # 首次运行不等待：已提交但未结束
+        assert not await queue.run(ids, poll_interval=0.05, max_wait=0)
+        assert queue.result(ids[0]) is None
+
+        # 新进程从磁盘恢复，继续轮询已提交的批次，不重复提交
+        queue = BatchQueue("t", directory=tmp_path)
+        assert queue.add(_req("甲")) == ids[0]
+        assert await queue.run(ids, poll_interval=0.05, max_wait=5)
+        assert "echo" in queue.result(ids[0])
+        assert await queue.run(ids, poll_interval=0.05, max_wait=5)
+    finally:
+        for p in patches:
+            p.stop()
+        server.stop()
+
+    assert server.stats["batches"] == 1
+    summary = metrics.summary()["test"]
+    assert summary["calls"] == 2 and summary["input_tokens"] > 0
+
+
+async def test_falls_back_to_local_calls_without_batch_api(tmp_path):
+    server = MockLLMServer(MockConfig(latency=0, batch_api=False)).start()
+    metrics = Telemetry(tmp_path / "metrics", run_id="t")
+    patches = _patches(server, tmp_path, metrics)
+    for p in patches:
+        p.start()
+    try:
+        queue = BatchQueue("t", directory=tmp_path)
+        ids = [queue.add(_req("甲")), queue.add(_req("乙"))]
+        assert await queue.run(ids, poll_interval=0.05, max_wait=5)
+        assert all("echo" in queue.result(j) for j in ids)
+    finally:
+        for p in patches:
+            p.stop()
+        server.stop()
+
+    assert server.stats["404"] == 1
+    assert server.stats["requests"] == 2
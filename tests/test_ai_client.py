@@ -0,0 +1,181 @@
+"""AIClient 测试 - 对冲请求 + 延迟直方图"""
+
+import asyncio
+from unittest.mock import patch
+
+from src.services import ai_client
+from src.services.ai_client import AIClient, AIRequest, LatencyTracker
+from src.services.telemetry import Telemetry
+
+
+def _fake_call(latencies: dict[str, float], results: dict[str, str | None]):
+    """按 base_url 返回预设延迟和结果的 _call_api 替身"""
+    calls = []
+
+    async def call(self, base_url, api_key, model, req, role="primary"):
+        calls.append(base_url)
+        await asyncio.sleep(latencies[base_url])
+        return results[base_url]
+
+    return call, calls
+
+
+def _hedge_settings(**overrides):
+    values = {
+        "claude_base_url": "http://primary",
+        "ai_fallback_base_url": "http://fallback",
+        "ai_fallback_api_key": "k",
+        "ai_hedge_enabled": True,
+        "ai_hedge_default_delay": 0.05,
+        "ai_hedge_min_delay": 0.0,
+    }
+    values.update(overrides)
+    return [patch.object(ai_client.settings, k, v) for k, v in values.items()]
+
+
+async def _send_with(latencies, results, tmp_path) -> tuple[str, list[str]]:
+    call, calls = _fake_call(latencies, results)
+    patches = _hedge_settings()
+    for p in patches:
+        p.start()
+    try:
+        with patch.object(ai_client, "latency_tracker", LatencyTracker(tmp_path / "lat.json")):
+            with patch.object(AIClient, "_call_api", call):
+                text = await AIClient().send(AIRequest(messages=[{"role": "user", "content": "hi"}]))
+    finally:
+        for p in patches:
+            p.stop()
+    return text, calls
+
+
+async def test_hedge_fallback_wins_when_primary_slow(tmp_path):
+    text, calls = await _send_with(
+        {"http://primary": 1.0, "http://fallback": 0.01},
+        {"http://primary": "slow", "http://fallback": "fast"},
+        tmp_path,
+    )
+    assert text == "fast"
+    assert calls == ["http://primary", "http://fallback"]
+
+
+async def test_no_hedge_when_primary_fast(tmp_path):
+    text, calls = await _send_with(
+        {"http://primary": 0.01, "http://fallback": 0.01},
+        {"http://primary": "ok", "http://fallback": "unused"},
+        tmp_path,
+    )
+    assert text == "ok"
+    assert calls == ["http://primary"]
+
+
+async def test_refusal_triggers_fallback_immediately(tmp_path):
+    text, calls = await _send_with(
+        {"http://primary": 0.0, "http://fallback": 0.01},
+        {"http://primary": None, "http://fallback": "fb"},
+        tmp_path,
+    )
+    assert text == "fb"
+    assert calls == ["http://primary", "http://fallback"]
+
+
+def test_latency_percentile_persists(tmp_path):
+    path = tmp_path / "lat.json"
+    tracker = LatencyTracker(path)
+    for s in [1.5] * 8 + [25] * 2:
+        tracker.record("ep", s)
+    # 记录只在内存里，结束时统一写一次
+    assert not path.exists()
+    tracker.save()
+    p90 = LatencyTracker(path).percentile("ep", 0.9)
+    assert p90 is not None and 2 <= p90 <= 30
+    assert LatencyTracker(path).percentile("other", 0.9) is None
+
+
+async def test_mock_server_cache_control_rejected_then_stripped(tmp_path):
+    """不支持 prompt caching 的端点：400 后去掉 cache_control 重发，且后续请求不再携带"""
+    import sys
+    from pathlib import Path
+
+    sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
+    from mock_llm_server import MockConfig, MockLLMServer
+
+    server = MockLLMServer(MockConfig(latency=0, cache_control=False)).start()
+    metrics = Telemetry(tmp_path / "metrics", run_id="t")
+    patches = [
+        patch.object(ai_client, "telemetry", metrics),
+        patch.object(ai_client.settings, "claude_base_url", server.url),
+        patch.object(ai_client.settings, "ai_fallback_base_url", ""),
+        patch.object(ai_client, "latency_tracker", LatencyTracker(tmp_path / "lat.json")),
+    ]
+    for p in patches:
+        p.start()
+    try:
+        req = AIRequest(
+            system=[ai_client.cached_block("规则")],
+            messages=[{"role": "user", "content": "hi"}],
+            stage="test",
+        )
+        assert "echo" in await AIClient().send(req)
+        assert "echo" in await AIClient().send(req)
+    finally:
+        for p in patches:
+            p.stop()
+        server.stop()
+    assert server.stats["400"] == 1
+    assert server.stats["200"] == 2
+    # 400 后去掉 cache_control 的重发不计入重试；两次调用都记入遥测
+    summary = metrics.summary()["test"]
+    assert (summary["calls"], summary["retries"], summary["errors"]) == (2, 0, 0)
+    assert summary["input_tokens"] > 0 and summary["cost_usd"] > 0
+    assert len(metrics.run_file.read_text().splitlines()) == 2
+
+
+async def test_cancelled_primary_raises_hedge_percentile(tmp_path):
+    """被对冲取消的慢主请求按已耗时计入直方图，p90 随之上升"""
+    from types import SimpleNamespace
+
+    tracker = LatencyTracker(tmp_path / "lat.json")
+    key = ai_client._endpoint_key("http://primary", ai_client.settings.claude_model, "")
+    for _ in range(10):
+        tracker.record(key, 1.5)
+    before = tracker.percentile(key, 0.9)
+
+    # 假时钟：fallback 返回时已过去 30s，主请求一直没返回、被取消
+    clock = SimpleNamespace(now=0.0)
+    clock.monotonic = lambda: clock.now
+
+    async def call(self, base_url, api_key, model, req, role="primary"):
+        if base_url == "http://primary":
+            await asyncio.sleep(1.0)
+            return "slow"
+        clock.now += 30
+        return "fast"
+
+    patches = _hedge_settings() + [
+        patch.object(ai_client, "latency_tracker", tracker),
+        patch.object(ai_client, "time", clock),
+        patch.object(AIClient, "_call_api", call),
+        patch.object(tracker, "hedge_delay", lambda endpoint: 0.01),
+    ]
+    for p in patches:
+        p.start()
+    try:
+        for _ in range(3):
+            assert await AIClient().send(AIRequest(messages=[{"role": "user", "content": "hi"}])) == "fast"
+    finally:
+        for p in patches:
+            p.stop()
+
+    assert before < 2
+    assert tracker.percentile(key, 0.9) > 20
+
+
+def test_short_stage_does_not_lower_main_hedge_delay(tmp_path):
+    """翻译等短调用的样本不影响主分析的对冲阈值"""
+    tracker = LatencyTracker(tmp_path / "lat.json")
+    model = ai_client.settings.claude_model
+    for _ in range(10):
+        tracker.record(ai_client._endpoint_key("http://primary", model, "translate"), 0.5)
+        tracker.record(ai_client._endpoint_key("http://primary", model, "analyze"), 40)
+    assert tracker.percentile(ai_client._endpoint_key("http://primary", model, "translate"), 0.9) < 1
+    assert tracker.hedge_delay(ai_client._endpoint_key("http://primary", model, "analyze")) > 30
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from src.services.cache import AsyncTTLCache
+
+
+async def test_coalesce_lru_and_stale_while_revalidate():
+    calls: list[str] = []
+
+    def loader(key: str, value):
+        async def load():
+            calls.append(key)
+            await asyncio.sleep(0.01)
+            return value
+        return load
+
+    cache = AsyncTTLCache("test_cache", maxsize=2, ttl=60, stale_ttl=60)
+
+    # 并发的相同请求只加载一次
+    results = await asyncio.gather(*(cache.get("a", loader("a", 1)) for _ in range(5)))
+    assert results == [1] * 5 and calls == ["a"]
+    assert cache.counters["misses"] == 1 and cache.counters["coalesced"] == 4
+
+    # 超出容量淘汰最久未用的
+    await cache.get("b", loader("b", 2))
+    assert await cache.get("a", loader("a", 0)) == 1
+    await cache.get("c", loader("c", 3))
+    assert cache.counters["evictions"] == 1 and "b" not in cache._data
+
+    # 过期后先返回旧值，后台刷新
+    cache._data["a"] = (cache._data["a"][0] - 90, 1)
+    assert await cache.get("a", loader("a", 10)) == 1
+    await asyncio.sleep(0.05)
+    assert await cache.get("a", loader("a", 0)) == 10
+    assert cache.counters["stale"] == 1
+    assert cache.stats()["hit_rate"] > 0.5
+
+
+async def test_errors_are_shared_and_not_cached():
+    cache = AsyncTTLCache("test_cache_errors", ttl=60, cache_if=bool)
+    attempts = 0
+
+    async def failing():
+        nonlocal attempts
+        attempts += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    outcomes = await asyncio.gather(cache.get("k", failing), cache.get("k", failing), return_exceptions=True)
+    assert attempts == 1 and all(isinstance(o, RuntimeError) for o in outcomes)
+
+    async def empty():
+        return []
+
+    assert await cache.get("k", empty) == [] and len(cache) == 0
+    with pytest.raises(RuntimeError):
+        await cache.get("k", failing)
@@ -0,0 +1,36 @@
+from datetime import datetime
+
+from src.services.disk_cache import DiskCache
+from src.services.market_hours import BEIJING, quiet_ttl, unchanged_since
+
+
+def test_disk_cache_ttl_and_shared_file(tmp_path):
+    path = tmp_path / "kv.sqlite3"
+    writer = DiskCache(path)
+    writer.set_many("quote", {"512480": {"price": 1.2}, "518880": {"price": 5.0}}, ttl=60)
+    writer.set("quote", "159915", {"price": 2.0}, ttl=-1)  # 已过期
+
+    # 另一个实例（相当于另一个进程）读同一个文件
+    reader = DiskCache(path)
+    assert reader.get_many("quote", ["512480", "518880", "159915"]) == {
+        "512480": {"price": 1.2}, "518880": {"price": 5.0},
+    }
+    assert reader.get("kline", "512480") is None
+    assert reader.purge() == 1
+    writer.close()
+    reader.close()
+
+
+def test_market_hours():
+    friday_close = datetime(2026, 10, 16, 15, 5, tzinfo=BEIJING)
+    saturday = datetime(2026, 10, 17, 12, 0, tzinfo=BEIJING)
+    monday_open = datetime(2026, 10, 19, 10, 0, tzinfo=BEIJING)
+
+    # 周五收盘后写入，周末都不变，周一开盘后失效
+    ts = friday_close.timestamp() + 60
+    assert unchanged_since(ts, saturday)
+    assert not unchanged_since(ts, monday_open)
+    assert not unchanged_since(friday_close.timestamp() - 3600, saturday)
+
+    assert quiet_ttl(60, monday_open) == 60
+    assert quiet_ttl(60, saturday) == (datetime(2026, 10, 19, 9, 15, tzinfo=BEIJING) - saturday).total_seconds()
@@ -0,0 +1,39 @@
+"""ETF 分类缓存测试"""
+
+from src.services.etf_cache import EtfClassifyCache
+
+
+def test_cache_reuses_unchanged_and_invalidates_changed(tmp_path):
+    path = tmp_path / "classify.json"
+    cache = EtfClassifyCache("test", path)
+    cache.seed_from_master({
+        "512480": {"code": "512480", "name": "半导体ETF", "scope": "半导体指数成分股",
+                   "risk": "高风险", "sector": "芯片", "desc": "半导体龙头", "tags": ["芯片"]},
+    })
+    cache.save()
+
+    cache = EtfClassifyCache("test", path)
+    same = {"code": "512480", "name": "半导体ETF", "scope": "半导体指数成分股", "risk": "高风险"}
+    changed = dict(same, scope="半导体设备指数成分股")
+    assert cache.lookup(same, ("sector", "desc"))["sector"] == "芯片"
+    assert cache.lookup(changed) is None
+    # 缺少所需字段时不算命中
+    assert cache.lookup(same, ("sector", "related")) is None
+
+    cache.store(changed, {"sector": "芯片", "desc": "半导体设备"})
+    assert cache.lookup(changed, ("desc",))["desc"] == "半导体设备"
+    assert (cache.reused, cache.recomputed) == (2, 1)
+
+
+def test_namespaces_do_not_share_entries(tmp_path, monkeypatch):
+    from src.services import etf_cache
+
+    monkeypatch.setattr(etf_cache, "CACHE_DIR", tmp_path)
+    info = {"code": "512480", "name": "半导体ETF", "scope": "半导体指数成分股", "risk": "高风险"}
+    master = EtfClassifyCache("build_etf_master")
+    master.store(info, {"sector": "排除", "related": [], "desc": "半导体龙头"})
+    master.save()
+
+    assert EtfClassifyCache("build_etf_master").lookup(info, ("sector",))["sector"] == "排除"
+    assert EtfClassifyCache("update_etf_master").lookup(info, ("sector",)) is None
+
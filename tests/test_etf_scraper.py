@@ -0,0 +1,64 @@
+"""ETF 详情抓取缓存测试"""
+
+import time
+
+import httpx
+
+from src.services.etf_scraper import SINA_PAGE_SIZE, EtfDetailStore, fetch_sina_etf_pages, parse_jbgk
+
+JBGK_HTML = (
+    "<th>基金全称</th><td class='x'>华夏国证半导体芯片交易型开放式指数证券投资基金</td>"
+    "<th>基金管理人</th><td><a href='#'>华夏基金</a></td>"
+    "<label>投资范围</label><div><p>  主要投资于标的指数成份股  </p></div>"
+)
+
+
+def test_parse_jbgk():
+    info = parse_jbgk(JBGK_HTML)
+    assert info["manager"] == "华夏基金"
+    assert info["scope"] == "主要投资于标的指数成份股"
+    assert "risk" not in info
+
+
+async def test_detail_store_fetches_only_missing_or_stale(tmp_path):
+    requested = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requested.append(request.url.path)
+        return httpx.Response(200, text=JBGK_HTML)
+
+    store = EtfDetailStore(tmp_path / "detail.json", ttl_days=30)
+    store.seed_from_master(
+        {"512480": {"scope": "旧范围", "detail_date": time.strftime("%Y-%m-%d")},
+         "159995": {"scope": "旧范围", "detail_date": "2020-01-01"}},
+    )
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        infos = await store.get_many(client, ["512480", "159995", "515050"])
+
+    assert sorted(requested) == ["/jbgk_159995.html", "/jbgk_515050.html"]
+    assert infos["512480"]["scope"] == "旧范围"
+    assert infos["159995"]["manager"] == "华夏基金"
+    assert EtfDetailStore(tmp_path / "detail.json").is_fresh("515050")
+
+
+async def test_sina_pages_skip_failed_page_and_dedupe():
+    def handler(request: httpx.Request) -> httpx.Response:
+        page = int(request.url.params["page"])
+        if page == 2:
+            return httpx.Response(500, text="error")
+        if page == 4:
+            # 末页不满；翻页期间排序变化，重复了上一页的最后一只
+            return httpx.Response(200, json=[{"code": "sh399"}, {"code": "sh400"}])
+        if page > 4:
+            return httpx.Response(200, text="null")
+        start = page * 100
+        return httpx.Response(200, json=[{"code": f"sh{start + i}"} for i in range(SINA_PAGE_SIZE)])
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        items = await fetch_sina_etf_pages(client, max_pages=6)
+
+    codes = [i["code"] for i in items]
+    # 第 2 页失败只丢该页，后面的页照常拼接
+    assert len(codes) == len(set(codes)) == 2 * SINA_PAGE_SIZE + 1
+    assert codes[0] == "sh100" and codes[-1] == "sh400"
+
@@ -0,0 +1,44 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src.services.host_limit import HostLimiter
+
+URL = "https://push2his.eastmoney.com/api/qt/stock/kline/get"
+
+
+async def test_aimd_grows_when_saturated_and_halves_on_throttle(tmp_path):
+    path = tmp_path / "host_limits.json"
+    limiter = HostLimiter(path, initial={"push2his.eastmoney.com": 2})
+    active = peak = 0
+
+    async def request(status: int = 200):
+        nonlocal active, peak
+        async with limiter.slot(URL) as slot:
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.005)
+            active -= 1
+            slot.observe(httpx.Response(status, text="ok"))
+
+    await asyncio.gather(*(request() for _ in range(60)))
+    state = limiter.state("push2his.eastmoney.com")
+    assert peak <= state.capacity and state.capacity > 2
+
+    # 同一波 429 只减半一次
+    grown = state.limit
+    await asyncio.gather(*(request(429) for _ in range(state.capacity)))
+    assert state.limit == pytest.approx(grown / 2)
+    assert state.counters["decreases"] == 1
+
+    # 超时同样减半
+    with pytest.raises(httpx.ReadTimeout):
+        async with limiter.slot(URL):
+            raise httpx.ReadTimeout("timeout")
+    assert state.limit == pytest.approx(grown / 4)
+
+    # 状态跨运行保留
+    limiter.save()
+    reloaded = HostLimiter(path).state("push2his.eastmoney.com")
+    assert reloaded.limit == pytest.approx(round(grown / 4, 2))
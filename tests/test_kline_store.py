@@ -0,0 +1,83 @@
+from datetime import date
+
+import httpx
+import numpy as np
+
+from src.services.kline_store import BACKFILL_BARS, CLOSE, KlineStore
+
+
+class FakeEastmoney:
+    """按 lmt 返回最近的日K线，记录每次请求的 lmt"""
+
+    def __init__(self, days: int = 300):
+        # 截止到上一个交易日，测试里再追加一根
+        end = np.busday_offset(date.today().isoformat(), -1, roll="backward")
+        self.dates = [str(d) for d in np.busday_offset(end, np.arange(-days + 1, 1))]
+        self.closes = [1.0 + i / 1000 for i in range(days)]
+        self.limits: list[int] = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        limit = int(request.url.params["lmt"])
+        self.limits.append(limit)
+        rows = list(zip(self.dates, self.closes))[-limit:]
+        klines = [f"{d},{c},{c},{c},{c},1000" for d, c in rows]
+        return httpx.Response(200, json={"data": {"klines": klines}})
+
+
+async def test_backfill_once_then_incremental(tmp_path):
+    market = FakeEastmoney()
+    store = KlineStore(tmp_path, fresh_seconds=0)
+    async with httpx.AsyncClient(transport=httpx.MockTransport(market.handler)) as client:
+        dates, ohlcv = await store.get(client, "1.512480", 95)
+        assert len(dates) == 95 and ohlcv[CLOSE][-1] == market.closes[-1]
+        assert market.limits == [BACKFILL_BARS]
+
+        # 新增一根K线：只按缺口请求小 lmt，合并后末尾是新K线
+        market.dates.append(str(np.busday_offset(market.dates[-1], 1)))
+        market.closes.append(2.0)
+        market.dates.pop(0), market.closes.pop(0)
+        store.meta.set("kline", "1.512480", {**store.meta.get("kline", "1.512480"), "updated_at": 0})
+        await store.get(client, "1.512480", 95)
+        assert market.limits[-1] < 10
+
+        # 复权价整体变化：重叠部分对不上，重新回填
+        market.closes = [c * 0.9 for c in market.closes]
+        store.meta.set("kline", "1.512480", {**store.meta.get("kline", "1.512480"), "updated_at": 0})
+        pairs = await store.date_closes(client, "1.512480", 200)
+        assert market.limits[-1] == BACKFILL_BARS
+        assert pairs[-1] == (market.dates[-1], market.closes[-1])
+        assert len(store.load("1.512480")[0]) == BACKFILL_BARS
+
+
+async def test_fresh_store_skips_network(tmp_path):
+    market = FakeEastmoney()
+    async with httpx.AsyncClient(transport=httpx.MockTransport(market.handler)) as client:
+        await KlineStore(tmp_path).get(client, "0.159995", 20)
+        closes = await KlineStore(tmp_path).closes(client, "0.159995", 20)
+    assert market.limits == [BACKFILL_BARS]
+    assert closes == market.closes[-20:]
+
+
+async def test_sina_fallback_not_persisted(tmp_path):
+    market = FakeEastmoney()
+    eastmoney_down = True
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.host == "push2his.eastmoney.com":
+            return httpx.Response(200, text="") if eastmoney_down else market.handler(request)
+        # 新浪不复权价，与东方财富前复权价不同
+        rows = [{"day": d, "open": 9, "close": 9, "high": 9, "low": 9, "volume": 1} for d in market.dates[-30:]]
+        return httpx.Response(200, json=rows)
+
+    store = KlineStore(tmp_path, fresh_seconds=0)
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        dates, ohlcv = await store.get(client, "1.512480", 20)
+        # 本次返回新浪数据，但不写入存储、不记 meta
+        assert len(dates) == 20 and ohlcv[CLOSE][-1] == 9
+        assert len(store.load("1.512480")[0]) == 0
+        assert store.meta.get("kline", "1.512480") is None
+
+        eastmoney_down = False
+        dates, ohlcv = await store.get(client, "1.512480", 20)
+        assert ohlcv[CLOSE][-1] == market.closes[-1]
+        assert market.limits == [BACKFILL_BARS]
@@ -0,0 +1,67 @@
+"""map-reduce 分片与证据合并测试"""
+
+from src.analyzers.realtime import (
+    MAP_CONCURRENCY, MAX_EVIDENCE_PER_SECTOR, _merge_evidence, _shard_news,
+)
+from src.models import NewsItem
+
+
+def _news(count: int, sources: tuple[str, ...] = ("财联社", "东方财富", "新浪")) -> list[NewsItem]:
+    return [NewsItem(source=sources[i % len(sources)], title=f"新闻{i}") for i in range(count)]
+
+
+def test_shard_count_capped_and_sources_grouped():
+    # 条数少时按最小分片大小切，不拆满
+    assert [len(s) for s in _shard_news(_news(150))] == [75, 75]
+    assert [len(s) for s in _shard_news(_news(80))] == [80]
+    assert _shard_news([]) == []
+
+    # 条数多时分片数封顶，分片变大，全部新闻都在
+    for count in (400, 1000, 3001):
+        shards = _shard_news(_news(count))
+        assert len(shards) == MAP_CONCURRENCY
+        assert max(map(len, shards)) - min(map(len, shards)) <= 1
+        assert sum(map(len, shards)) == count
+
+    # 同一来源连续排列，跨分片的来源至多在分片边界处切开
+    shards = _shard_news(_news(900))
+    flat = [item.source for shard in shards for item in shard]
+    assert flat == sorted(flat)
+    assert sum(len({i.source for i in shard}) for shard in shards) <= 3 + len(shards) - 1
+
+
+def test_merge_evidence_weights_votes_dedupes_and_truncates():
+    partials = [
+        {
+            "sectors": {
+                "芯片": {"direction": "利好", "weight": 4, "evidence": ["光刻机突破", "大基金增持"]},
+                "黄金": {"direction": "利空", "weight": 1, "evidence": ["美元走强"]},
+            },
+            "macro": ["降准预期"],
+        },
+        {
+            "sectors": {
+                "芯片": {"direction": "利空", "weight": "2", "evidence": ["光刻机突破"]
+                         + [f"证据{i}" for i in range(10)]},
+                "黄金": {"direction": "利好", "weight": "x", "evidence": ["避险升温"]},
+                "证券": "不是字典",
+            },
+            "macro": ["降准预期", "北向流入"],
+            "commodities": ["金价新高"],
+        },
+    ]
+    text = _merge_evidence(partials)
+    lines = text.splitlines()
+
+    # 按累计权重排序，方向按权重投票
+    assert lines[0] == "### 芯片（证据强度6，利好4/利空2）"
+    assert "### 黄金（证据强度2，利空1/利好1）" in lines
+    assert "证券" not in text
+
+    # 证据去重并截断到每板块上限
+    chip = lines[1:lines.index("### 黄金（证据强度2，利空1/利好1）")]
+    assert chip.count("- 光刻机突破") == 1
+    assert len(chip) == MAX_EVIDENCE_PER_SECTOR
+
+    assert lines[lines.index("### 宏观") + 1:lines.index("### 商品")] == ["- 降准预期", "- 北向流入"]
+    assert lines[-1] == "- 金价新高"
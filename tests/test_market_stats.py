@@ -0,0 +1,26 @@
+import numpy as np
+
+from src.services.market_stats import compute_stats
+
+
+def test_compute_stats_matches_per_code_loop():
+    rng = np.random.default_rng(0)
+    closes = np.cumprod(1 + rng.normal(0, 0.02, size=(3, 80)), axis=1)
+    closes[1, 40] = np.nan  # 停牌一天，按前值填充
+    closes[2, :70] = np.nan  # 新上市，只有 10 根
+
+    stats = compute_stats(closes)
+
+    for h in (1, 5, 20, 60):
+        expected = (closes[0, -1] / closes[0, -1 - h] - 1) * 100
+        assert np.isclose(stats[f"change_{h}d"][0], expected)
+    assert np.isclose(stats["change_60d"][1], (closes[1, -1] / closes[1, -61] - 1) * 100)
+    assert np.isnan(stats["change_20d"][2]) and not np.isnan(stats["change_5d"][2])
+
+    daily = closes[0, -21:][1:] / closes[0, -21:][:-1] - 1
+    assert np.isclose(stats["volatility_20d"][0], daily.std(ddof=1) * np.sqrt(252) * 100)
+
+    window = closes[0, -61:]
+    expected_dd = ((window / np.maximum.accumulate(window)) - 1).min() * 100
+    assert np.isclose(stats["max_drawdown_60d"][0], expected_dd)
+    assert stats["max_drawdown_60d"][2] <= 0
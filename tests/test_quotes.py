@@ -0,0 +1,48 @@
+import asyncio
+
+import httpx
+
+from src.services import quotes
+from src.services.quotes import fetch_quotes, split_chunks
+
+
+def test_split_chunks_balanced():
+    sizes = [len(c) for c in split_chunks(list(range(642)), 100)]
+    assert sizes == [92] * 5 + [91] * 2
+    assert split_chunks([], 100) == []
+
+
+async def test_failed_chunk_falls_back_to_sina(monkeypatch):
+    monkeypatch.setattr(quotes, "RETRY_DELAY", 0)
+    secids = [f"1.{510000 + i}" for i in range(250)]
+    failing = "1.510000"  # 第一块东方财富一直失败
+    calls = {"eastmoney": 0, "sina": 0}
+    active = peak = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        if request.url.host == "push2.eastmoney.com":
+            calls["eastmoney"] += 1
+            chunk = request.url.params["secids"].split(",")
+            if failing in chunk:
+                return httpx.Response(200, text="")
+            diff = [{"f12": s.split(".")[1], "f14": "ETF", "f2": 1000, "f3": 0, "f6": 0} for s in chunk]
+            return httpx.Response(200, json={"data": {"diff": diff}})
+        calls["sina"] += 1
+        codes = str(request.url).split("list=", 1)[1].split(",")
+        lines = [f'var hq_str_{c}="ETF,1.0,1.0,1.1,1.2,0.9,0,0,100,110";' for c in codes]
+        return httpx.Response(200, text="\n".join(lines))
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        items = await fetch_quotes(client, secids)
+
+    assert sorted(i["f12"] for i in items) == sorted(s.split(".")[1] for s in secids)
+    # 3 块并发，失败的那块重试 3 次后整块降级新浪（84 个 → 2 个新浪请求）
+    assert calls["eastmoney"] == 2 + quotes.MAX_RETRIES
+    assert calls["sina"] == 2
+    assert peak > 1
+    assert sum(1 for i in items if i.get("_from_sina")) == 84
@@ -0,0 +1,15 @@
+"""LLM 令牌桶限流测试"""
+
+import asyncio
+
+from src.services.rate_limit import TokenBucketLimiter
+
+
+async def test_rate_limiter_penalize_blocks_bucket():
+    limiter = TokenBucketLimiter(rpm=6000, tpm=100000, max_concurrency=2)
+    limiter.penalize(0.1)
+    loop = asyncio.get_running_loop()
+    t0 = loop.time()
+    async with limiter.slot(100):
+        pass
+    assert loop.time() - t0 >= 0.09
@@ -0,0 +1,74 @@
+"""新闻相关度预过滤测试"""
+
+from datetime import datetime, timedelta
+
+from src.analyzers.relevance import RelevanceScorer, prefilter
+from src.models import NewsItem
+
+SECTORS = ["芯片", "黄金", "证券", "软件"]
+ETFS = {
+    "512480": {"sector": "芯片", "tags": ["晶圆", "光刻机"]},
+    "518880": {"sector": "黄金", "tags": ["贵金属"]},
+    "159852": {"sector": "软件", "tags": ["IT", "信创"]},
+}
+
+
+def test_scores_keywords_sources_and_recency():
+    now = datetime.now()
+    items = [
+        NewsItem(source="财联社", title="光刻机国产化取得突破，芯片板块走强"),
+        NewsItem(source="环球网", title="外交部发言人就某国访问答记者问"),
+        NewsItem(source="TechCrunch", title="This startup said it raised $5M for a dating app"),
+        NewsItem(source="CNBC", title="Gold hits record as Fed signals rate cut"),
+        NewsItem(source="财联社", title="光刻机国产化取得突破，芯片板块走强", published_at=now - timedelta(hours=24)),
+    ]
+    scores, matched = RelevanceScorer(SECTORS, ETFS).score(items, now=now.timestamp())
+
+    assert set(matched[0]) == {"光刻机", "芯片"}
+    assert matched[2] == []  # "said"/"it" 不按子串命中英文词
+    assert {"gold", "fed", "rate cut"} <= set(matched[3])
+    assert scores[0] > scores[3] > scores[2] > scores[1]
+    assert abs(scores[4] - scores[0] / 4) < 1e-9  # 24 小时两个半衰期
+
+
+def test_prefilter_keeps_order_and_tail():
+    items = [NewsItem(source="环球网", title=f"时政新闻{i}") for i in range(5)]
+    items.insert(2, NewsItem(source="东方财富", title="券商板块异动，证券ETF放量"))
+    selected, audit = prefilter(items, SECTORS, 0.2, ETFS, tail_size=2)
+
+    assert selected[0].title.startswith("券商")
+    assert len(selected) == 3
+    assert (audit["kept"], audit["tail"], audit["dropped"]) == (1, 2, 3)
+    assert audit["items"][0]["status"] == "kept"
+
+
+async def test_analyze_scores_translated_titles():
+    """英文标题先翻译再打分，板块相关的国际新闻按译文命中板块词"""
+    from unittest.mock import patch
+
+    from src.analyzers import realtime
+
+    items = [
+        NewsItem(source="BBC", title="ASML ships new lithography tools to Chinese fabs", language="en"),
+        NewsItem(source="环球网", title="外交部发言人答记者问"),
+    ]
+    audits = []
+
+    async def fake_translate(news):
+        for item in news:
+            if item.language == "en":
+                item.summary_zh = "阿斯麦向中国晶圆厂交付新光刻机"
+
+    async def fake_send(self, req):
+        raise RuntimeError("stop")
+
+    with patch.object(realtime, "translate_titles", fake_translate), \
+            patch.object(realtime, "save_audit", audits.append), \
+            patch.object(realtime, "_load_master_etfs", lambda: ETFS), \
+            patch.object(realtime.settings, "news_relevance_threshold", 0.2), \
+            patch.object(realtime.settings, "ai_translate_enabled", True), \
+            patch.object(realtime.AIClient, "send", fake_send):
+        assert await realtime.analyze(items, SECTORS, mode="single", deep_dive=False) == {}
+
+    status = {i["title"]: (i["status"], set(i["matched"])) for i in audits[0]["items"]}
+    assert status[items[0].title] == ("kept", {"光刻机", "晶圆"})
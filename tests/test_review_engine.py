@@ -0,0 +1,82 @@
+import numpy as np
+
+from src.services.review_engine import (
+    HORIZONS, add_to_aggregates, compute_review, pending_signals, rebuild_aggregates, settle, summarize,
+)
+
+
+def _dates(n: int) -> np.ndarray:
+    days = np.busday_offset("2025-01-02", np.arange(n))
+    return np.array([int(str(d).replace("-", "")) for d in days], dtype=np.int32)
+
+
+def _naive(signals, klines, bench, h, invert):
+    """逐条信号线性查找（原 _calc_horizon 的算法）"""
+    returns, excess = [], []
+    for s in signals:
+        entry = int(s["date"].replace("-", ""))
+        dates, closes = klines.get(s["etf_code"], ([], []))
+        idx = next((i for i, d in enumerate(dates) if d >= entry), None)
+        if idx is None or idx + h >= len(closes):
+            continue
+        ret = (closes[idx + h] - closes[idx]) / closes[idx] * 100
+        returns.append(ret)
+        bidx = next((i for i, d in enumerate(bench[0]) if d >= entry), None)
+        if bidx is not None and bidx + h < len(bench[1]):
+            excess.append(ret - (bench[1][bidx + h] - bench[1][bidx]) / bench[1][bidx] * 100)
+    wins = sum(1 for r in returns if (r < 0 if invert else r > 0))
+    return len(returns), round(wins / len(returns) * 100, 1), round(sum(returns) / len(returns), 2), \
+        round(sum(excess) / len(excess), 2)
+
+
+def _sample(rng):
+    dates = _dates(120)
+    klines = {
+        code: (dates[start:], np.cumprod(1 + rng.normal(0, 0.02, 120 - start)))
+        for code, start in (("512480", 0), ("159995", 30), ("515030", 100))
+    }
+    bench = (dates, np.cumprod(1 + rng.normal(0, 0.01, 120)))
+    signals = []
+    for i in range(300):
+        d = str(dates[rng.integers(0, 120)])
+        signals.append({
+            "date": f"{d[:4]}-{d[4:6]}-{d[6:]}",
+            "etf_code": ["512480", "159995", "515030", "000000"][i % 4],
+            "signal": ["买入", "回避", "观望"][i % 3],
+        })
+    return dates, klines, bench, signals
+
+
+def test_compute_review_matches_naive_loop():
+    dates, klines, bench, signals = _sample(np.random.default_rng(1))
+    summary = compute_review(signals, klines, bench)
+
+    for label, invert in (("买入", False), ("回避", True)):
+        group = [s for s in signals if s["signal"] == label]
+        for h in HORIZONS:
+            got = summary["by_signal"][label][str(h)]
+            assert (got["count"], got["win_rate"], got["avg_return"], got["avg_excess"]) == \
+                _naive(group, klines, bench, h, invert)
+    assert summary["horizons"] == summary["by_signal"]["买入"]
+
+
+def test_incremental_settle_matches_full_review():
+    dates, klines, bench, signals = _sample(np.random.default_rng(2))
+    aggregates: dict = {}
+
+    # 第一次运行：只有前 60 根K线收盘
+    cut = int(dates[60])
+    first = settle(signals, pending_signals(signals), klines, bench, aggregates, before=cut)
+    assert first and all(r["exit_date"] < cut for s in signals for r in (s.get("results") or {}).values())
+
+    # 第二次运行：全部收盘，只算未结算的
+    pending = pending_signals(signals)
+    settle(signals, pending, klines, bench, aggregates, before=99999999)
+    full = compute_review(signals, klines, bench)
+    assert summarize(aggregates)["by_signal"] == full["by_signal"]
+    assert rebuild_aggregates(signals).keys() == aggregates.keys()
+
+    # 清理旧信号时从累计量扣除
+    for s in signals[:100]:
+        add_to_aggregates(aggregates, s, sign=-1)
+    assert summarize(aggregates)["by_signal"] == compute_review(signals[100:], klines, bench)["by_signal"]
@@ -0,0 +1,58 @@
+"""分析结果校验 + JSON 修复测试"""
+
+from unittest.mock import patch
+
+from src.analyzers import realtime
+from src.analyzers.schema import build_reask_request, validate_analysis
+from src.services.ai_client import AIClient, parse_json_with_repair
+
+VALID = {
+    "market_view": "🎯 芯片领涨",
+    "summary": "综述",
+    "sentiment": "偏乐观",
+    "sectors": [
+        {"name": "芯片", "heat": "5", "direction": "利好", "confidence": 80,
+         "analysis": "国产替代", "signal": "🟢买入"},
+        {"name": "黄金", "heat": 4, "direction": "利好", "confidence": 70, "analysis": "避险"},
+    ],
+    "risk_alerts": ["风险"],
+    "opportunity_hints": ["机会"],
+    "commodity_cycle": {"stage": 1, "stage_name": "黄金领涨期", "leader": "gold", "analysis": "..."},
+}
+
+
+def test_repair_handles_common_model_mistakes():
+    text = '说明文字\n```json\n{“a”: [1, 2,], "b": "第一行\n第二行", "c": {"d": "截断'
+    assert parse_json_with_repair(text, fix_newlines=True) == {
+        "a": [1, 2], "b": "第一行 第二行", "c": {"d": "截断"},
+    }
+    assert parse_json_with_repair('{"a": "x"} 多余 {') == {"a": "x"}
+
+
+def test_validate_reports_missing_paths():
+    data, missing = validate_analysis(VALID)
+    assert missing == ["sectors[1].signal"]
+
+    req = build_reask_request(data, missing)
+    prompt = req.messages[0]["content"]
+    assert "sectors.黄金: signal" in prompt
+    assert "国产替代" not in prompt  # 只带涉及的板块
+
+
+async def test_reask_fills_only_missing_fields():
+    broken = {k: v for k, v in VALID.items() if k != "commodity_cycle"}
+    client = AIClient()
+    calls = []
+
+    async def fake_send(self, req):
+        calls.append(req)
+        return '{"sectors": {"黄金": {"signal": "🟡观望"}}}'
+
+    with patch.object(AIClient, "send", fake_send):
+        result = await realtime._ensure_complete(client, broken)
+
+    assert len(calls) == 1
+    assert result["sectors"][0]["heat"] == 5
+    assert result["sectors"][1]["signal"] == "🟡观望"
+    # 补问没给出的 commodity_cycle 按默认处理（移除）
+    assert "commodity_cycle" not in result
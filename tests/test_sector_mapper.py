@@ -0,0 +1,69 @@
+"""板块名本地映射测试"""
+
+from src.services.sector_mapper import SectorResolver
+
+MASTER_SECTORS = ["AI", "芯片", "证券", "锂电池", "汽车", "光伏", "黄金"]
+ETFS = {
+    "512480": {"sector": "芯片", "tags": ["芯片", "半导体", "晶圆"]},
+    "518880": {"sector": "黄金", "tags": ["黄金", "贵金属", "金价"]},
+}
+
+
+def test_resolve_order(tmp_path):
+    r = SectorResolver(MASTER_SECTORS, ETFS, cache_path=tmp_path / "m.json")
+    assert r.resolve("芯片") == ["芯片"]                 # 精确
+    assert r.resolve("新能源车") == ["锂电池", "汽车"]    # 别名
+    assert r.resolve("AI应用") == ["AI"]                 # 包含
+    assert r.resolve("光伏设备") == ["光伏"]
+    assert r.resolve("晶圆代工") == ["芯片"]              # tag 模糊
+    assert r.resolve("航运") is None
+
+
+def test_learned_mapping_persists(tmp_path):
+    path = tmp_path / "m.json"
+    r = SectorResolver(MASTER_SECTORS, ETFS, cache_path=path)
+    mapping, unresolved = r.resolve_all(["黄金", "航运"])
+    assert mapping == {"黄金": ["黄金"]} and unresolved == ["航运"]
+
+    r.learn({"航运": ["汽车", "不存在"]})
+    r2 = SectorResolver(MASTER_SECTORS, ETFS, cache_path=path)
+    assert r2.resolve("航运") == ["汽车"]
+
+
+def test_keywords_select_sector_headlines(tmp_path):
+    from src.analyzers.realtime import select_headlines
+    from src.models import NewsItem
+
+    r = SectorResolver(MASTER_SECTORS, ETFS, cache_path=tmp_path / "m.json")
+    keywords = r.keywords("半导体")
+    assert {"芯片", "半导体", "晶圆", "集成电路"} <= keywords
+
+    items = [
+        NewsItem(source="a", title="黄金再创新高"),
+        NewsItem(source="b", title="晶圆厂扩产"),
+        NewsItem(source="c", title="半导体设备国产化，芯片股大涨"),
+    ]
+    assert [i.title for i in select_headlines(items, keywords)] == ["半导体设备国产化，芯片股大涨", "晶圆厂扩产"]
+
+
+def test_unmapped_names_cached_with_ttl(tmp_path):
+    import json
+
+    path = tmp_path / "m.json"
+    r = SectorResolver(MASTER_SECTORS, ETFS, cache_path=path)
+    r.learn({"航运": [], "养老": ["不存在"], "黄金": []})
+
+    # AI 无法映射的名称在 TTL 内不再进入未解析列表
+    r2 = SectorResolver(MASTER_SECTORS, ETFS, cache_path=path)
+    assert r2.resolve("航运") is None
+    assert r2.resolve_all(["航运", "养老", "黄金"]) == ({"航运": [], "养老": [], "黄金": ["黄金"]}, [])
+
+    # 过期后重新询问；正向映射不被空结果覆盖
+    data = json.loads(path.read_text())
+    data["航运"]["learned_at"] = "2020-01-01"
+    path.write_text(json.dumps(data))
+    r3 = SectorResolver(MASTER_SECTORS, ETFS, cache_path=path)
+    assert r3.resolve_all(["航运"]) == ({}, ["航运"])
+    r3.learn({"航运": ["汽车"]})
+    r3.learn({"航运": []})
+    assert r3.resolve("航运") == ["汽车"]
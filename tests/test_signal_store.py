@@ -0,0 +1,39 @@
+from src.services.review_engine import summarize
+from src.services.signal_store import SignalStore
+
+
+def _signal(date: str, sector: str, code: str, signal: str = "买入") -> dict:
+    return {"date": date, "sector": sector, "type": "overall", "signal": signal, "etf_code": code, "entry_price": 1.0}
+
+
+def test_append_settle_compact_and_query(tmp_path):
+    store = SignalStore(tmp_path)
+    assert store.add_many([
+        _signal("2026-09-30", "半导体", "512480"),
+        _signal("2026-10-08", "半导体", "512480"),
+        _signal("2026-10-08", "黄金", "518880", "观望"),
+        _signal("2026-10-08", "半导体", "512480"),  # 重复
+    ]) == 3
+    assert store.add_many([_signal("2026-10-08", "半导体", "512480")]) == 0
+
+    pending = store.pending("2026-09-01")
+    assert [s["date"] for s in pending] == ["2026-09-30", "2026-10-08"]
+    pending[0]["results"] = {h: {"ret": 2.0, "excess": 1.0, "exit_date": 20261020} for h in ("1", "3", "7", "20")}
+    store.aggregates = {"买入": {h: {"count": 1, "wins": 1, "sum_return": 2.0, "excess_count": 1, "sum_excess": 1.0}
+                               for h in ("1", "3", "7", "20")}}
+    store.record_settled(pending, [(0, h) for h in ("1", "3", "7", "20")])
+    assert store.months["2026-09"]["pending"] == 0
+
+    # 含上月事件 → 压实进月份分段，日志清空
+    assert store.compact("2026-10")
+    assert store.log_path.read_text() == ""
+    assert (tmp_path / "2026-09.ndjson").exists() and (tmp_path / "2026-10.ndjson").exists()
+    store.save()
+
+    reloaded = SignalStore(tmp_path)
+    assert reloaded.total == 3
+    assert [s["date"] for s in reloaded.pending("2026-09-01")] == ["2026-10-08"]
+    assert [s["etf_code"] for s in reloaded.query(sector="半导体")] == ["512480", "512480"]
+    assert reloaded.query(code="518880", start="2026-10-01")[0]["signal"] == "观望"
+    assert reloaded.query(sector="半导体", end="2026-09-30")[0]["results"]["20"]["ret"] == 2.0
+    assert summarize(reloaded.aggregates)["horizons"]["20"]["win_rate"] == 100.0
@@ -0,0 +1,30 @@
+"""AI 调用遥测测试"""
+
+import json
+
+from src.services.telemetry import Telemetry
+
+
+def test_flush_rolls_up_by_day_and_month(tmp_path):
+    usage = {"input_tokens": 1000, "output_tokens": 200, "cache_read_tokens": 0, "cache_write_tokens": 0}
+    for run_id in ("r1", "r2"):
+        metrics = Telemetry(tmp_path, run_id=run_id)
+        metrics.record(stage="analyze", endpoint="primary", model="m", status="ok",
+                       attempts=2, latency_s=1.5, usage=usage)
+        metrics.record(stage="translate", endpoint="fallback", model="m", status="error",
+                       attempts=3, latency_s=0.5)
+        metrics.flush()
+        assert metrics.records == []
+
+    rollup = json.loads((tmp_path / "rollup.json").read_text())
+    (day,) = rollup["daily"].values()
+    (month,) = rollup["monthly"].values()
+    assert day == month
+    assert day["analyze"]["calls"] == 2
+    assert day["analyze"]["input_tokens"] == 2000
+    assert day["total"]["retries"] == 6
+    assert day["total"]["errors"] == 2
+    assert day["translate"]["fallback_calls"] == 2
+    # 默认单价 3/15 美元每百万 tokens：(1000*3 + 200*15) / 1e6 * 2
+    assert abs(day["total"]["cost_usd"] - 0.012) < 1e-9
+    assert len(list((tmp_path / "runs").glob("*.ndjson"))) == 2
@@ -0,0 +1,68 @@
+"""国际新闻标题翻译测试"""
+
+from unittest.mock import patch
+
+from src.analyzers import translate
+from src.analyzers.translate import TranslationCache, translate_titles
+from src.models import NewsItem
+
+
+async def test_translate_batches_and_caches(tmp_path):
+    calls = []
+
+    async def fake_batch(titles):
+        calls.append(list(titles))
+        return {t: f"译:{t}" for t in titles}
+
+    def make_items():
+        return [
+            NewsItem(source="CNBC", title="Fed holds rates steady", language="en"),
+            NewsItem(source="BBC", title="Fed holds rates steady", language="en"),
+            NewsItem(source="Bloomberg", title="Nvidia beats estimates", language="en"),
+            NewsItem(source="财联社", title="央行开展逆回购操作"),
+        ]
+
+    path = tmp_path / "t.json"
+    with patch.object(translate, "_translate_batch", fake_batch):
+        items = make_items()
+        assert await translate_titles(items, TranslationCache(path)) == 2
+        assert calls == [["Fed holds rates steady", "Nvidia beats estimates"]]
+        assert items[1].summary_zh == "译:Fed holds rates steady"
+        assert items[3].summary_zh is None
+
+        # 下一轮相同标题全部命中缓存
+        items = make_items()
+        assert await translate_titles(items, TranslationCache(path)) == 0
+        assert len(calls) == 1
+        assert items[2].summary_zh == "译:Nvidia beats estimates"
+
+
+async def test_tail_and_dropped_titles_translated_for_news_json(tmp_path):
+    """预过滤末尾/丢弃的英文新闻也有译文，news.json 里带 title_zh"""
+    import json
+    from datetime import timezone
+
+    from src import worker_simple
+    from src.analyzers import realtime
+
+    items = [NewsItem(source="CNBC", title=f"Celebrity gossip roundup {i}", language="en",
+                      url=f"https://example.com/{i}") for i in range(3)]
+
+    async def fake_batch(titles):
+        return {t: f"译:{t}" for t in titles}
+
+    async def fake_send(self, req):
+        raise RuntimeError("stop")
+
+    with patch.object(translate, "_translate_batch", fake_batch), \
+            patch.object(translate, "TranslationCache", lambda: TranslationCache(tmp_path / "t.json")), \
+            patch.object(realtime, "save_audit", lambda audit: None), \
+            patch.object(realtime.settings, "news_relevance_threshold", 0.9), \
+            patch.object(realtime.settings, "ai_translate_enabled", True), \
+            patch.object(realtime.AIClient, "send", fake_send), \
+            patch.object(worker_simple, "DATA_DIR", tmp_path):
+        await realtime.analyze(items, ["芯片"], mode="single", deep_dive=False)
+        await worker_simple.save_news(items, timezone.utc)
+
+    news = json.loads((tmp_path / "news.json").read_text())["news"]
+    assert [n["title_zh"] for n in news] == [f"译:{i.title}" for i in items]